@@ -0,0 +1,115 @@
+"""
+Microbenchmark for decoding AUR RPC responses: `decode_response()` vs. `json` + structuring via the cattrs converter.
+
+	PYTHONPATH=src python -m benchmarks.bench_aur_decode [FILE] [--count N]
+
+FILE is a saved multiinfo response (e.g. from `curl 'https://aur.archlinux.org/rpc/v5/info?arg[]=...'`)
+or a packages-meta-ext-v1.json(.gz) archive. By default, a synthetic response with N (default 1000)
+realistic results is used.
+"""
+
+import argparse
+import gzip
+import json
+import time
+from collections import abc
+from pathlib import Path
+
+import cattrs.preconf.json
+import cattrs.strategies
+
+from buildpy.provider.aur import (
+	Response,
+	decode_response,
+)
+
+
+def synthetic_result(i: int) -> dict:
+	name = f'package-{i}'
+	return {
+		'ID': i,
+		'Name': name,
+		'PackageBaseID': i,
+		'PackageBase': name,
+		'Version': f'1.{i}.0-1',
+		'Description': f'A fairly typical description of {name}, which is not too short and not too long',
+		'URL': f'https://github.com/someone/{name}',
+		'NumVotes': i % 100,
+		'Popularity': i / 1000,
+		'OutOfDate': None,
+		'Maintainer': 'someone',
+		'FirstSubmitted': 1600000000 + i,
+		'LastModified': 1700000000 + i,
+		'URLPath': f'/cgit/aur.git/snapshot/{name}.tar.gz',
+		'Depends': [ 'glibc', 'gcc-libs', 'zlib', f'lib{i % 50}>=1.0' ],
+		'MakeDepends': [ 'cmake', 'git', 'ninja' ],
+		'OptDepends': [ 'python: scripting support', 'bash-completion: completions' ],
+		'CheckDepends': [ 'python-pytest' ],
+		'Conflicts': [ f'{name}-git' ],
+		'Provides': [ f'{name}-bin={i}', f'virtual{i % 20}' ],
+		'Replaces': [],
+		'Groups': [],
+		'Keywords': [ 'some', 'keywords', 'here' ],
+		'License': [ 'GPL3', 'MIT' ],
+	}
+
+
+def load_response(path: Path | None, count: int) -> bytes:
+	if path is None:
+		results = [ synthetic_result(i) for i in range(count) ]
+	else:
+		data = path.read_bytes()
+		if data[:2] == b'\x1f\x8b':
+			data = gzip.decompress(data)
+		obj = json.loads(data)
+		# the archive is a bare list of results
+		if not isinstance(obj, list):
+			return data
+		results = obj
+	return json.dumps({ 'version': 5, 'type': 'multiinfo', 'resultcount': len(results), 'results': results }).encode()
+
+
+# reference decoder: generic cattrs structuring of every field
+converter = cattrs.preconf.json.make_converter()
+cattrs.strategies.configure_tagged_union(
+	Response,
+	converter,
+	tag_generator=lambda t: t.type,
+	tag_name='type',
+)
+
+
+def structure_reference(obj: dict) -> Response:
+	return converter.structure(obj, Response)
+
+
+def decode_reference(content: bytes) -> Response:
+	return structure_reference(json.loads(content))
+
+
+def bench(fn: abc.Callable[[bytes], Response], content: bytes, min_time: float = 1.0) -> float:
+	nr_loops = 0
+	start = time.perf_counter()
+	while (elapsed := time.perf_counter() - start) < min_time:
+		fn(content)
+		nr_loops += 1
+	return nr_loops / elapsed
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('file', type=Path, nargs='?')
+	parser.add_argument('--count', type=int, default=1000)
+	args = parser.parse_args()
+
+	content = load_response(args.file, args.count)
+	nr_results = decode_response(content).resultcount
+	print(f'response: {nr_results} results, {len(content)} bytes')
+	before = bench(decode_reference, content)
+	print(f'before: {before * nr_results:12.0f} results/s')
+	after = bench(decode_response, content)
+	print(f'after:  {after * nr_results:12.0f} results/s ({after / before:.2f}x)')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,145 @@
+"""
+Memory benchmark for the package model: retained memory per package with all three providers loaded
+from a synthetic corpus.
+
+	PYTHONPATH=src python -m benchmarks.bench_package_memory [--count N]
+
+Inputs are decoded from JSON (or parsed from .SRCINFO text), so that, as with real data, equal strings
+are distinct objects. Inputs are dropped after loading; only what the providers retain is counted.
+"""
+
+import argparse
+import gc
+import json
+import random
+import tempfile
+import tracemalloc
+from collections import abc
+from pathlib import Path
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.pkgbuild import PKGBUILD
+from buildpy.provider import AURPackageProvider, LocalPackageProvider, SyncPackageProvider
+from buildpy.provider.aur import decode_response
+from buildpy.srcinfo import SRCINFO
+from buildpy.syncdb import SyncRecord
+
+
+# a skewed pool of dependency names, as in real repositories (glibc is everywhere, libfoo is not)
+COMMON = [ 'glibc', 'gcc-libs', 'zlib', 'bash', 'python', 'openssl', 'qt5-base', 'gtk3', 'systemd-libs', 'libx11' ]
+POOL = COMMON + [ f'lib{i}' for i in range(300) ]
+WEIGHTS = [ 50 ] * len(COMMON) + [ 1 ] * 300
+OPS = [ '', '', '', '>=1.0', '=2.3.4-1', '<5' ]
+
+
+def synthetic(rng: random.Random, i: int, prefix: str) -> dict:
+	def specs(k: int) -> list[str]:
+		return [ name + rng.choice(OPS) for name in rng.choices(POOL, WEIGHTS, k=k) ]
+	name = f'{prefix}-package-{i}'
+	return {
+		'name': name,
+		'version': f'1.{i}-1',
+		'depends': specs(rng.randint(2, 8)),
+		'makedepends': specs(rng.randint(0, 4)),
+		'optdepends': [ f'{d}: optional support for {d}' for d in specs(rng.randint(0, 2)) ],
+		'provides': [ f'{name}-virtual={i}' ] if i % 4 == 0 else [],
+	}
+
+
+def corpus(count: int, prefix: str) -> list[dict]:
+	rng = random.Random(prefix)
+	# round-trip through JSON to get distinct string objects
+	return json.loads(json.dumps([ synthetic(rng, i, prefix) for i in range(count) ]))
+
+
+def load_aur(provider: AURPackageProvider, packages: list[dict]):
+	results = [ {
+		'ID': i,
+		'Name': p['name'],
+		'PackageBaseID': i,
+		'PackageBase': p['name'],
+		'Version': p['version'],
+		'LastModified': 0,
+		'Depends': p['depends'],
+		'MakeDepends': p['makedepends'],
+		'OptDepends': p['optdepends'],
+		'Provides': p['provides'],
+	} for i, p in enumerate(packages) ]
+	resp = decode_response(json.dumps({
+		'version': 5, 'type': 'multiinfo', 'resultcount': len(results), 'results': results,
+	}).encode())
+	for r in resp.results:
+		provider._load_result(r)
+
+
+def load_sync(provider: SyncPackageProvider, packages: list[dict]):
+	for p in packages:
+		provider._load_record(SyncRecord(
+			repo='extra',
+			name=p['name'],
+			base=p['name'],
+			version=p['version'],
+			depends=p['depends'],
+			makedepends=p['makedepends'],
+			optdepends=p['optdepends'],
+			provides=p['provides'],
+		))
+
+
+def load_local(provider: LocalPackageProvider, packages: list[dict]):
+	for p in packages:
+		pkgver, pkgrel = p['version'].split('-')
+		lines = [ f'pkgbase = {p["name"]}', f'\tpkgver = {pkgver}', f'\tpkgrel = {pkgrel}', '\tarch = any' ]
+		for key in ('depends', 'makedepends', 'optdepends', 'provides'):
+			lines += [ f'\t{key} = {v}' for v in p[key] ]
+		lines += [ '', f'pkgname = {p["name"]}' ]
+
+		pkgbuild = PKGBUILD.from_path(Path('/dev/null'), Path('/dev/null/PKGBUILD'))
+		pkgbuild.srcinfo = SRCINFO.from_lines(lines, pkgbuild=pkgbuild)
+		pkgbuild.pkgbase = pkgbuild.srcinfo.headers['pkgbase']
+		pkgbuild.pkgname = pkgbuild.srcinfo.headers['pkgname']
+		provider.load_pkgbuild(pkgbuild)
+		# the PKGBUILD (and its .SRCINFO) is not retained by the provider
+		pkgbuild.srcinfo = None
+
+
+def measure(load: abc.Callable, provider, name: str, count: int) -> int:
+	gc.collect()
+	before = tracemalloc.get_traced_memory()[0]
+	packages = corpus(count, name)
+	load(provider, packages)
+	del packages
+	gc.collect()
+	return tracemalloc.get_traced_memory()[0] - before
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--count', type=int, default=5000, help='Number of packages per provider')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		tmp = Path(tmp)
+		(tmp/'pacman.conf').write_text('[options]\n\n[extra]\nInclude = /dev/null\n')
+		config = Config(pacman_conf=tmp/'pacman.conf', cache_root=tmp/'cache', sync_root=tmp/'sync')
+		with AppContext(config=config) as ctx:
+			providers = [
+				('local', load_local, LocalPackageProvider(ctx)),
+				('aur', load_aur, AURPackageProvider(ctx)),
+				('sync', load_sync, SyncPackageProvider(ctx)),
+			]
+
+			tracemalloc.start()
+			total = 0
+			for name, load, provider in providers:
+				size = measure(load, provider, name, args.count)
+				total += size
+				print(f'{name:6}: {size / args.count:8.0f} bytes/package')
+			print(f'total : {total / (args.count * len(providers)):8.0f} bytes/package '
+			      f'({total / 2**20:.1f} MiB for {args.count * len(providers)} packages)')
+			tracemalloc.stop()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,187 @@
+"""
+Microbenchmark for `SRCINFO.from_lines`, comparing against the previous regex-per-line implementation.
+
+	PYTHONPATH=src python -m benchmarks.bench_srcinfo [PATH...]
+
+Each PATH is a .SRCINFO file or a directory that is searched for .SRCINFO files (e.g. the pkgbuild root).
+By default, the test corpus in tests/data/srcinfo is used.
+"""
+
+import re
+import sys
+import time
+from collections import abc
+from pathlib import Path
+
+from buildpy.pkgbuild import PKGBUILD
+from buildpy.srcinfo import (
+	SRCINFO,
+	SrcinfoKey,
+	SrcinfoSection,
+	SrcinfoSectionHeader,
+	SrcinfoValue,
+)
+
+
+DEFAULT_CORPUS = Path(__file__).parent.parent/'tests'/'data'/'srcinfo'
+
+
+# verbatim copy of the previous implementation of `SRCINFO.from_lines`, for reference
+def from_lines_reference(srcinfo_lines: abc.Iterable[str], pkgbuild: PKGBUILD) -> SRCINFO:
+	section_keys = (
+		'pkgbase',
+		'pkgname',
+	)
+	pkgbase_keys = (
+		'pkgver',
+		'pkgrel',
+		'epoch',
+	)
+	single_keys = (
+		'pkgdesc',
+		'url',
+		'install',
+		'changelog',
+	)
+	list_keys = (
+		'arch',
+		'groups',
+		'license',
+		'noextract',
+		'options',
+		'backup',
+		'validpgpkeys',
+	)
+	arch_keys = (
+		'source',
+		'depends',
+		'checkdepends',
+		'makedepends',
+		'optdepends',
+		'provides',
+		'conflicts',
+		'replaces',
+		'md5sums',
+		'sha1sums',
+		'sha224sums',
+		'sha256sums',
+		'sha384sums',
+		'sha512sums',
+		'b2sums',
+	)
+
+	# section of section headers
+	headers: SrcinfoSection = dict()
+	# contents of sections
+	sections: dict[SrcinfoSectionHeader, SrcinfoSection] = dict()
+	pkgbase_header: SrcinfoSectionHeader = None
+	pkgbase_section: SrcinfoSection = None
+	cur_header: SrcinfoSectionHeader = None
+	cur_section: SrcinfoSection = None
+
+	def get_value(section: SrcinfoSection, key: SrcinfoKey):
+		try:
+			return section[key]
+		except KeyError:
+			return pkgbase_section[key]
+
+	def set_list_value(section: SrcinfoSection, key: SrcinfoKey, value: SrcinfoValue):
+		# special case: single empty list item overrides pkgbase-level list
+		# with an empty one
+		if not value and key not in section:
+			section[key] = list()
+		else:
+			section.setdefault(key, list()).append(value)
+
+	for line in srcinfo_lines:
+		# skip comments
+		if re.match(r'^\s*(#|$)', line):
+			pass
+		elif m := re.fullmatch(r'\s*([a-zA-Z0-9_]+)\s*=\s*(.*)', line):
+			key, value = m.group(1), m.group(2)
+			assert key.strip() == key
+			assert value.strip() == value
+
+			if key in section_keys:
+				cur_header = SrcinfoSectionHeader(key, value)
+				if cur_header in sections:
+					pkgbuild.r4ise(f'bad .SRCINFO: duplicate section {cur_header}')
+				cur_section = sections[cur_header] = dict()
+
+				if key == 'pkgbase':
+					if pkgbase_header is not None:
+						pkgbuild.r4ise(f'bad .SRCINFO: multiple pkgbase sections: {pkgbase_header} and {cur_header}')
+					pkgbase_header, pkgbase_section = cur_header, cur_section
+
+				# save section header as a key
+				if key == 'pkgbase':
+					headers[key] = value
+				else:
+					set_list_value(headers, key, value)
+			else:
+				if cur_header is None or cur_section is None:
+					pkgbuild.r4ise(f'bad .SRCINFO: non-section key {key} before any section')
+				if key in pkgbase_keys and cur_header.type != 'pkgbase':
+					pkgbuild.r4ise(f'bad .SRCINFO: pkgbase-only key {key} in section {cur_header}')
+
+				if key in pkgbase_keys or key in single_keys:
+					if key in cur_section:
+						pkgbuild.r4ise(f'bad .SRCINFO: non-unique key {key} in section {cur_header}')
+					cur_section[key] = value
+				elif key in list_keys or key in arch_keys:
+					set_list_value(cur_section, key, value)
+				elif ((arch_key := key.split('_', maxsplit=1))
+				      and len(arch_key) == 2
+				      and arch_key[0] in arch_keys
+				      and arch_key[1] in get_value(cur_section, 'arch')):
+					# FIXME: per-arch key handling
+					set_list_value(cur_section, key, value)
+				else:
+					pkgbuild.r4ise(f'bad .SRCINFO: unknown key {key}')
+		else:
+			pkgbuild.r4ise(f'bad line in .SRCINFO: {line}')
+
+	return SRCINFO(headers=headers, sections=sections)
+
+
+def load_corpus(paths: list[Path]) -> list[list[str]]:
+	files = []
+	for p in paths:
+		if p.is_dir():
+			files += sorted(p.rglob('.SRCINFO')) + sorted(p.rglob('*.SRCINFO'))
+		else:
+			files.append(p)
+	return [ f.read_text().splitlines() for f in files ]
+
+
+def bench(fn: abc.Callable, corpus: list[list[str]], pkgbuild: PKGBUILD, min_time: float = 1.0) -> float:
+	nr_lines = sum(len(lines) for lines in corpus)
+	nr_loops = 0
+	start = time.perf_counter()
+	while (elapsed := time.perf_counter() - start) < min_time:
+		for lines in corpus:
+			fn(lines, pkgbuild=pkgbuild)
+		nr_loops += 1
+	return nr_lines * nr_loops / elapsed
+
+
+def main(argv: list[str]):
+	corpus = load_corpus([ Path(a) for a in argv ] or [ DEFAULT_CORPUS ])
+	if not corpus:
+		raise SystemExit('no .SRCINFO files found')
+	pkgbuild = PKGBUILD.from_path(Path('/dev/null'), Path('/dev/null/PKGBUILD'))
+
+	for lines in corpus:
+		ref = from_lines_reference(lines, pkgbuild=pkgbuild)
+		new = SRCINFO.from_lines(lines, pkgbuild=pkgbuild)
+		assert ref == new
+
+	print(f'corpus: {len(corpus)} files, {sum(len(lines) for lines in corpus)} lines')
+	before = bench(from_lines_reference, corpus, pkgbuild)
+	print(f'before: {before:12.0f} lines/s')
+	after = bench(SRCINFO.from_lines, corpus, pkgbuild)
+	print(f'after:  {after:12.0f} lines/s ({after / before:.2f}x)')
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
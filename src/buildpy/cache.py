@@ -0,0 +1,222 @@
+import os
+import pickle
+import shutil
+import threading
+from collections import abc
+from pathlib import Path
+from typing import (
+	Any,
+	ClassVar,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+import buildpy.util
+from buildpy.config import Config
+
+
+@attr.s(frozen=True)
+class CacheEntry:
+	key: str
+	path: Path
+	size: int
+	mtime: float
+
+
+@attr.s
+class Cache:
+	"""
+	A directory of pickled objects addressed by opaque string keys (normally hex digests), bounded by total size.
+	Entries are evicted in LRU order: a successful lookup bumps the entry's mtime.
+
+	All operations are best-effort: I/O errors are treated as cache misses.
+	"""
+	# cache types with their own layout of entries, by name (see `register()`)
+	_types: ClassVar[dict[str, type['Cache']]] = {}
+
+	root: Path
+	max_size: Optional[int] = None
+	hits: int = 0
+	misses: int = 0
+	_lock: threading.Lock = attr.ib(factory=threading.Lock, repr=False)
+
+	@staticmethod
+	def register(name: str) -> abc.Callable[[type['Cache']], type['Cache']]:
+		def decorator(cls: type['Cache']) -> type['Cache']:
+			Cache._types[name] = cls
+			return cls
+		return decorator
+
+	@classmethod
+	def from_config(cls, config: Config, name: str) -> Self:
+		if cls is Cache:
+			cls = Cache._types.get(name, cls)
+		return cls(
+			root=config.cache_root/name,
+			max_size=getattr(config, f'{name}_cache_size', None),
+		)
+
+	def _path(self, key: str) -> Path:
+		return self.root/key[:2]/key
+
+	def _count(self, hit: bool):
+		with self._lock:
+			if hit:
+				self.hits += 1
+			else:
+				self.misses += 1
+
+	def get(self, key: str, default: Any = None) -> Any:
+		path = self._path(key)
+		try:
+			with path.open('rb') as f:
+				value = pickle.load(f)
+		except FileNotFoundError:
+			self._count(hit=False)
+			return default
+		except Exception:
+			# corrupt or incompatible entry: unpickling may fail in all sorts of ways
+			self.remove(key)
+			self._count(hit=False)
+			return default
+
+		try:
+			os.utime(path)
+		except OSError:
+			pass
+		self._count(hit=True)
+		return value
+
+	def put(self, key: str, value: Any):
+		path = self._path(key)
+		try:
+			path.parent.mkdir(parents=True, exist_ok=True)
+			with buildpy.util.atomic_open(path, 'wb') as f:
+				pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+		except OSError:
+			pass
+
+	def remove(self, key: str):
+		try:
+			self._path(key).unlink()
+		except OSError:
+			pass
+
+	def _evict(self, entry: CacheEntry):
+		entry.path.unlink()
+
+	def entries(self) -> list[CacheEntry]:
+		ret = []
+		try:
+			subdirs = list(os.scandir(self.root))
+		except OSError:
+			return ret
+		for d in subdirs:
+			if not d.is_dir(follow_symlinks=False):
+				continue
+			for e in os.scandir(d.path):
+				if e.name.startswith('.') or not e.is_file(follow_symlinks=False):
+					continue
+				st = e.stat(follow_symlinks=False)
+				ret.append(CacheEntry(key=e.name, path=Path(e.path), size=st.st_size, mtime=st.st_mtime))
+		return ret
+
+	def size(self) -> int:
+		return sum(e.size for e in self.entries())
+
+	def prune(self, max_size: Optional[int] = None) -> list[CacheEntry]:
+		"""
+		Evict least recently used entries until the cache fits into `max_size` (default: `self.max_size`) bytes.
+		Returns evicted entries.
+		"""
+		if max_size is None:
+			max_size = self.max_size
+		if max_size is None:
+			return []
+
+		entries = self.entries()
+		total = sum(e.size for e in entries)
+		evicted = []
+		for e in sorted(entries, key=lambda e: e.mtime):
+			if total <= max_size:
+				break
+			try:
+				self._evict(e)
+			except OSError:
+				continue
+			total -= e.size
+			evicted.append(e)
+		return evicted
+
+	def clear(self) -> list[CacheEntry]:
+		return self.prune(max_size=0)
+
+
+@Cache.register('build')
+@attr.s
+class BuildCache(Cache):
+	"""
+	Package files built from PKGBUILDs, addressed by `PKGBUILD.build_key()`. An entry is a directory holding
+	copies of the package files (not hard links: makepkg overwrites package files in place).
+	"""
+	def get(self, key: str, default: Any = None) -> Optional[list[Path]]:
+		path = self._path(key)
+		try:
+			files = sorted(path.iterdir())
+			os.utime(path)
+		except OSError:
+			self._count(hit=False)
+			return default
+		self._count(hit=True)
+		return files
+
+	def put(self, key: str, files: abc.Iterable[Path]):
+		path = self._path(key)
+		tmp = path.with_name(f'.{key}.tmp{os.getpid()}')
+		try:
+			shutil.rmtree(tmp, ignore_errors=True)
+			tmp.mkdir(parents=True)
+			for f in files:
+				shutil.copy2(f, tmp/f.name)
+			shutil.rmtree(path, ignore_errors=True)
+			tmp.rename(path)
+		except OSError:
+			shutil.rmtree(tmp, ignore_errors=True)
+
+	def remove(self, key: str):
+		shutil.rmtree(self._path(key), ignore_errors=True)
+
+	def _evict(self, entry: CacheEntry):
+		shutil.rmtree(entry.path)
+
+	def entries(self) -> list[CacheEntry]:
+		ret = []
+		try:
+			subdirs = list(os.scandir(self.root))
+		except OSError:
+			return ret
+		for d in subdirs:
+			if not d.is_dir(follow_symlinks=False):
+				continue
+			for e in os.scandir(d.path):
+				if e.name.startswith('.') or not e.is_dir(follow_symlinks=False):
+					continue
+				try:
+					size = sum(f.stat(follow_symlinks=False).st_size for f in os.scandir(e.path))
+					mtime = e.stat(follow_symlinks=False).st_mtime
+				except OSError:
+					continue
+				ret.append(CacheEntry(key=e.name, path=Path(e.path), size=size, mtime=mtime))
+		return ret
+
+
+def caches(config: Config) -> abc.Iterator[Cache]:
+	try:
+		dirs = sorted(p for p in config.cache_root.iterdir() if p.is_dir())
+	except OSError:
+		return
+	for d in dirs:
+		yield Cache.from_config(config, d.name)
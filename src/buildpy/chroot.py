@@ -0,0 +1,208 @@
+import contextlib
+import fcntl
+import hashlib
+import subprocess
+import tempfile
+from collections import abc
+from pathlib import Path
+from typing import (
+	ClassVar,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.provider import SyncPackageProvider
+from buildpy.syncindex import SyncIndex
+
+
+@attr.s
+class ChrootManager:
+	"""
+	Prepared base roots for isolated builds, one per effective pacman.conf/makepkg.conf pair, kept across runs
+	in `config.chroot_root`. A base root is bootstrapped once and only upgraded when the sync databases change
+	(they are shared with the sync provider, so the base root never needs a `pacman -Sy` of its own).
+
+	Builds get cheap copy-on-write snapshots of the base root (see `snapshot()`): reflink copies or overlayfs
+	mounts, depending on `config.chroot_snapshot`.
+	"""
+	# API filesystems mounted into a root during pacman transactions, as pacstrap does: target -> mount arguments
+	API_MOUNTS: ClassVar[tuple[tuple[str, tuple[str, ...]], ...]] = (
+		('proc', ('-t', 'proc', '-o', 'nosuid,noexec,nodev', 'proc')),
+		('sys', ('-t', 'sysfs', '-o', 'nosuid,noexec,nodev,ro', 'sys')),
+		('dev', ('-t', 'devtmpfs', '-o', 'mode=0755,nosuid', 'udev')),
+		('dev/pts', ('-t', 'devpts', '-o', 'mode=0620,gid=5,nosuid,noexec', 'devpts')),
+		('dev/shm', ('-t', 'tmpfs', '-o', 'mode=1777,nosuid,nodev', 'shm')),
+		('run', ('-t', 'tmpfs', '-o', 'nosuid,nodev,mode=0755', 'run')),
+		('tmp', ('-t', 'tmpfs', '-o', 'mode=1777,strictatime,nodev,nosuid', 'tmp')),
+	)
+
+	class Error(RuntimeError):
+		def __init__(self, manager: 'ChrootManager', *args):
+			self.manager = manager
+			super().__init__(*args)
+
+		def __str__(self):
+			return f'{self.manager}: {super().__str__()}'
+
+	config: Config
+	sync: SyncPackageProvider
+	work_dir: Path
+	makepkg_conf: Optional[Path] = None
+
+	def __str__(self):
+		return f'ChrootManager({self.work_dir})'
+
+	def r4ise(self, *args):
+		raise self.Error(self, *args)
+
+	@classmethod
+	def from_ctx(cls, ctx: AppContext) -> Self:
+		config = ctx.config
+		sync = SyncPackageProvider.get(ctx)
+		# the sync provider's work dir is keyed by the effective pacman.conf
+		h = hashlib.sha256(sync.work_dir.name.encode())
+		makepkg_conf = Path(config.makepkg_conf) if config.makepkg_conf else None
+		if makepkg_conf is not None:
+			try:
+				h.update(b'\0' + makepkg_conf.read_bytes())
+			except OSError as e:
+				cls(config=config, sync=sync, work_dir=config.chroot_root, makepkg_conf=makepkg_conf) \
+					.r4ise(f'cannot read makepkg.conf: {e}')
+		h.update('\0'.join(config.chroot_packages).encode())
+		return cls(
+			config=config,
+			sync=sync,
+			work_dir=config.chroot_root/h.hexdigest()[:16],
+			makepkg_conf=makepkg_conf,
+		)
+
+	@property
+	def root(self) -> Path:
+		return self.work_dir/'root'
+
+	def _run(self, args: list[str], **kwargs) -> subprocess.CompletedProcess[str]:
+		cmdline = self.config.with_auth_wrapper(self.config.chroot_auth, args)
+		try:
+			return subprocess.run(cmdline, check=True, text=True, stdin=subprocess.DEVNULL, **kwargs)
+		except (subprocess.CalledProcessError, OSError) as e:
+			self.r4ise(f'{args[0]} failed: {e}')
+
+	def run_pacman(self, root: Path, args: list[str], **kwargs) -> subprocess.CompletedProcess[str]:
+		return self._run([
+			'pacman',
+			'--root', str(root),
+			'--dbpath', str(root/'var/lib/pacman'),
+			'--config', str(self.sync.pacman_conf),
+			'--noconfirm',
+			*args,
+		], **kwargs)
+
+	@contextlib.contextmanager
+	def _api_mounts(self, root: Path) -> abc.Generator[None, None, None]:
+		"""
+		Mount the API filesystems (`API_MOUNTS`) into `root`, for install scriptlets and hooks that pacman runs
+		chrooted into it. They are unmounted again afterwards, in reverse order.
+		"""
+		mounted = []
+		try:
+			for target, args in self.API_MOUNTS:
+				path = root/target
+				self._run([ 'mkdir', '-p', str(path) ])
+				self._run([ 'mount', *args, str(path) ])
+				mounted.append(path)
+			yield
+		finally:
+			for path in reversed(mounted):
+				self._run([ 'umount', str(path) ])
+
+	@contextlib.contextmanager
+	def _lock(self, exclusive: bool) -> abc.Generator[None, None, None]:
+		self.work_dir.mkdir(parents=True, exist_ok=True)
+		with open(self.work_dir/'lock', 'w') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+			yield
+
+	def _install_files(self, root: Path):
+		"""
+		Copy the sync databases and makepkg.conf into `root`.
+		"""
+		sync_dir = root/'var/lib/pacman/sync'
+		self._run([ 'mkdir', '-p', str(sync_dir), str(root/'etc') ])
+		dbs = [ str(db.path) for db in self.sync.dbs() ]
+		if dbs:
+			self._run([ 'cp', '-p', '--', *dbs, str(sync_dir) ])
+		if self.makepkg_conf is not None:
+			self._run([ 'cp', '--', str(self.makepkg_conf), str(root/'etc/makepkg.conf') ])
+
+	def update(self) -> Path:
+		"""
+		Make sure that the base root exists and matches the current sync databases. Returns its path.
+		"""
+		self.sync.update(self.config)
+		key = SyncIndex.key(self.sync.dbs()).hex()
+		stamp = self.work_dir/'root.key'
+
+		def is_current() -> bool:
+			try:
+				return stamp.read_text() == key
+			except FileNotFoundError:
+				return False
+
+		with self._lock(exclusive=False):
+			if is_current():
+				return self.root
+		with self._lock(exclusive=True):
+			if is_current():
+				return self.root
+			stamp.unlink(missing_ok=True)
+			if self.root.exists():
+				self._install_files(self.root)
+				with self._api_mounts(self.root):
+					self.run_pacman(self.root, [ '-Su' ])
+			else:
+				# bootstrap next to the final location, so that an interrupted bootstrap is never used
+				tmp = self.work_dir/'root.new'
+				self._run([ 'rm', '-rf', '--one-file-system', '--', str(tmp) ])
+				self._install_files(tmp)
+				with self._api_mounts(tmp):
+					self.run_pacman(tmp, [ '-S', '--needed', *self.config.chroot_packages ])
+				self._run([ 'mv', '--', str(tmp), str(self.root) ])
+			stamp.write_text(key)
+		return self.root
+
+	@contextlib.contextmanager
+	def snapshot(self, name: str = 'build') -> abc.Generator[Path, None, None]:
+		"""
+		A private, writable copy-on-write snapshot of the (current) base root, removed afterwards.
+		"""
+		self.update()
+		snapshots = self.work_dir/'snapshots'
+		snapshots.mkdir(parents=True, exist_ok=True)
+		snap_dir = Path(tempfile.mkdtemp(prefix=f'{name}-', dir=snapshots))
+		try:
+			match self.config.chroot_snapshot:
+				case 'copy':
+					with self._lock(exclusive=False):
+						self._run([ 'cp', '-a', '--reflink=auto', '--', str(self.root), str(snap_dir/'root') ])
+					yield snap_dir/'root'
+				case 'overlay':
+					upper, work, merged = snap_dir/'upper', snap_dir/'work', snap_dir/'root'
+					for d in (upper, work, merged):
+						d.mkdir()
+					# the base root must not change while it is a lower layer
+					with self._lock(exclusive=False):
+						options = f'lowerdir={self.root},upperdir={upper},workdir={work}'
+						self._run([ 'mount', '-t', 'overlay', 'overlay', '-o', options, str(merged) ])
+						try:
+							yield merged
+						finally:
+							self._run([ 'umount', str(merged) ])
+				case method:
+					self.r4ise(f'unknown snapshot method: {method}')
+		finally:
+			self._run([ 'rm', '-rf', '--', str(snap_dir) ])
@@ -1,8 +1,18 @@
+import subprocess
+
 import click
 import attr, attrs
 
+import buildpy.cache
+import buildpy.chroot
+import buildpy.makedepends
+import buildpy.pkgbuild
 import buildpy.proc
 import buildpy.provider
+import buildpy.rebuild
+import buildpy.resolve
+import buildpy.schedule
+import buildpy.syncdb
 import buildpy.util
 from buildpy.config import Config
 from buildpy.context import AppContext
@@ -11,21 +21,179 @@ attr.s, attr.ib = attrs.define, attrs.field
 
 
 @click.group(context_settings=dict(auto_envvar_prefix='BUILDCTL'))
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help='Number of concurrent jobs (default: number of CPUs)')
+@click.option('--offline', is_flag=True, help='Answer AUR queries from the metadata cache only')
+@click.option('--aur-archive', metavar='FILE|URL', default=None,
+              help='Load the full AUR metadata archive (packages-meta-ext-v1.json.gz) instead of querying the RPC')
 @click.pass_context
-def buildctl(cctx: click.Context):
+def buildctl(cctx: click.Context, jobs: int, offline: bool, aur_archive: str):
+	config = Config()
+	if jobs is not None:
+		config.jobs = jobs
+	if offline:
+		config.aur_offline = True
+	if aur_archive is not None:
+		config.aur_archive = aur_archive
+
 	cctx.obj = ctx = AppContext(
-		config=Config(),
+		config=config,
 	)
 	cctx.with_resource(ctx)
 	buildpy.provider.setup(ctx)
 
 
 @buildctl.command(name='review-repo')
+@click.option('--lookup/--no-lookup', default=False, help='Look up dependencies in external providers')
+@click.option('--stats', is_flag=True, help='Print per-stage pipeline statistics')
+@click.pass_obj
+def review_repo(ctx: AppContext, lookup: bool, stats: bool):
+	# find pkgbuilds -> load pkgbuilds -> [pkgbase, [pkgname]] -> look up dependencies
+	pipeline = buildpy.proc.review_pipeline(ctx, lookup=lookup)
+	for _ in pipeline.run():
+		pass
+	buildpy.cache.Cache.from_config(ctx.config, 'srcinfo').prune()
+
+	for e in pipeline.errors:
+		click.echo(f'error: {e}', err=True)
+	if lookup:
+		# dependencies were looked up by the pipeline already, so this mostly hits provider indexes
+		graph = buildpy.resolve.DepGraph.get(ctx)
+		for spec, pkgbases in graph.unresolved().items():
+			required_by = ', '.join(p.pkgbase for p in pkgbases)
+			click.echo(f'warning: unresolved dependency {spec} (required by {required_by})', err=True)
+	if stats:
+		for s in pipeline.stats:
+			click.echo(str(s), err=True)
+
+
+def _build_batch(ctx: AppContext, build_all: bool) -> tuple[list[buildpy.pkgbuild.PKGBUILD], bool]:
+	"""
+	Local PKGBUILDs to build: all of them, or those newer than in the repository (and their dependants).
+	Also returns whether any PKGBUILD failed to load.
+	"""
+	pipeline = buildpy.proc.review_pipeline(ctx, lookup=False)
+	pkgbuilds = list(pipeline.run())
+	for e in pipeline.errors:
+		click.echo(f'error: {e}', err=True)
+
+	if not build_all:
+		try:
+			repo = buildpy.rebuild.RepoDB.from_config(ctx.config)
+		except (buildpy.rebuild.RepoDB.Error, buildpy.syncdb.SyncDB.Error, OSError) as e:
+			raise click.ClickException(str(e))
+		needed = buildpy.rebuild.needs_rebuild(ctx, repo)
+		for pkgbase, reason in needed.items():
+			click.echo(f'{pkgbase.pkgbase}: {reason}', err=True)
+		names = { p.pkgbase for p in needed }
+		pkgbuilds = [ p for p in pkgbuilds if p.pkgbase in names ]
+	return pkgbuilds, bool(pipeline.errors)
+
+
+@buildctl.command(name='build', context_settings=dict(ignore_unknown_options=True))
+@click.option('--all', 'build_all', is_flag=True,
+              help='Build all PKGBUILDs, not only those newer than in the repository (and their dependants)')
+@click.option('--cache/--no-cache', 'use_cache', default=True,
+              help='Reuse packages of previous builds with identical inputs')
+@click.argument('makepkg_args', nargs=-1, type=click.UNPROCESSED)
+@click.pass_obj
+def build(ctx: AppContext, build_all: bool, use_cache: bool, makepkg_args: tuple[str]):
+	"""
+	Build local PKGBUILDs in dependency order, running independent builds concurrently.
+	MAKEPKG_ARGS are passed to each makepkg invocation.
+	"""
+	pkgbuilds, load_errors = _build_batch(ctx, build_all)
+
+	try:
+		scheduler = buildpy.proc.build_scheduler(ctx, pkgbuilds)
+	except buildpy.schedule.BuildScheduler.Error as e:
+		raise click.ClickException(str(e))
+	cache = buildpy.cache.Cache.from_config(ctx.config, 'build') if use_cache else None
+	if cache is not None:
+		# build keys include the versions of resolved dependencies
+		try:
+			buildpy.resolve.DepGraph.get(ctx)
+		except (buildpy.provider.AURPackageProvider.Error, buildpy.syncdb.SyncDB.Error,
+		        subprocess.CalledProcessError, OSError) as e:
+			raise click.ClickException(f'cannot resolve dependencies: {e}')
+	click.echo(f'build logs: {ctx.config.build_log_root}', err=True)
+	buildpy.proc.build_pkgbuilds(ctx, scheduler, makepkg_args, cache=cache)
+	if cache is not None:
+		click.echo(f'build cache: {cache.hits} hits, {cache.misses} misses', err=True)
+
+	for job in scheduler.failed:
+		click.echo(f'error: {job.error}', err=True)
+	for job in scheduler.skipped:
+		click.echo(f'skipped: {job.name} (a dependency failed to build)', err=True)
+	if scheduler.failed or load_errors:
+		raise SystemExit(1)
+
+
+@buildctl.command(name='makedepends')
+@click.option('--all', 'build_all', is_flag=True,
+              help='Plan for all PKGBUILDs, not only those newer than in the repository (and their dependants)')
 @click.pass_obj
-def review_repo(ctx: AppContext):
-	config = ctx.config
+def makedepends(ctx: AppContext, build_all: bool):
+	"""
+	Group builds with overlapping build-time dependencies, and report what installing these once per group
+	would save.
+	"""
+	pkgbuilds, load_errors = _build_batch(ctx, build_all)
+	names = { p.pkgbase for p in pkgbuilds }
+	pkgbases = [ p for p in buildpy.provider.LocalPackageProvider.get(ctx).pkgbases if p.pkgbase in names ]
 
-	# find pkgbuilds
-	pkgbuilds = buildpy.proc.find_pkgbuilds(config)
-	# load pkgbuilds -> [pkgbase, [pkgname]]
-	buildpy.proc.load_pkgbuilds(pkgbuilds, config)
+	plan = buildpy.makedepends.MakedependsPlan.plan(ctx, pkgbases)
+	for i, group in enumerate(plan.groups):
+		click.echo(f'group {i + 1}: {group}')
+	download, installed = plan.saved
+	click.echo(f'saved: {download} bytes download, {installed} bytes installed '
+	           f'({len(pkgbases)} builds in {len(plan.groups)} groups)', err=True)
+	if load_errors:
+		raise SystemExit(1)
+
+
+@buildctl.group(name='chroot')
+def chroot():
+	pass
+
+
+@chroot.command(name='update')
+@click.pass_obj
+def chroot_update(ctx: AppContext):
+	"""
+	Bootstrap the base build root, or upgrade it if the sync databases changed.
+	"""
+	try:
+		root = buildpy.chroot.ChrootManager.from_ctx(ctx).update()
+	except buildpy.chroot.ChrootManager.Error as e:
+		raise click.ClickException(str(e))
+	click.echo(root)
+
+
+@buildctl.group(name='cache')
+def cache():
+	pass
+
+
+@cache.command(name='info')
+@click.pass_obj
+def cache_info(ctx: AppContext):
+	for c in buildpy.cache.caches(ctx.config):
+		entries = c.entries()
+		size = sum(e.size for e in entries)
+		limit = f'{c.max_size} bytes' if c.max_size is not None else 'unlimited'
+		click.echo(f'{c.root.name}: {len(entries)} entries, {size} bytes (limit: {limit}) in {c.root}')
+
+
+@cache.command(name='prune')
+@click.option('--max-size', type=click.IntRange(min=0), default=None,
+              help='Evict entries until the cache fits into this many bytes (default: configured limit)')
+@click.option('--all', 'prune_all', is_flag=True, help='Remove all entries')
+@click.argument('names', nargs=-1)
+@click.pass_obj
+def cache_prune(ctx: AppContext, max_size: int, prune_all: bool, names: tuple[str]):
+	for c in buildpy.cache.caches(ctx.config):
+		if names and c.root.name not in names:
+			continue
+		evicted = c.prune(max_size=0 if prune_all else max_size)
+		click.echo(f'{c.root.name}: evicted {len(evicted)} entries, {sum(e.size for e in evicted)} bytes')
@@ -1,5 +1,9 @@
 import enum
+import os
 from pathlib import Path
+from typing import (
+	Optional,
+)
 import attr, attrs
 attr.s, attr.ib = attrs.define, attrs.field
 
@@ -14,6 +18,12 @@ class Auth(enum.Enum):
 	Real = enum.auto()
 
 
+def _xdg_dir(var: str, default: str) -> Path:
+	# relative paths are to be ignored, as per the XDG base directory specification
+	path = os.environ.get(var)
+	return Path(path) if path and os.path.isabs(path) else Path.home()/default
+
+
 @attr.s
 class Config:
 	config_root: Path = Path('/etc/aurutils')
@@ -23,6 +33,70 @@ class Config:
 	makepkg_conf: Path = config_root/f'makepkg-{repo_name}.conf'
 	pacman_conf: Path = config_root/f'pacman-{repo_name}.conf'
 
+	# database of the custom repository (default: from the file:// Server of [repo_name] in pacman_conf)
+	repo_db: Optional[Path] = None
+
+	# mutable state lives outside of config_root, which is not writable by users
+	cache_root: Path = _xdg_dir('XDG_CACHE_HOME', '.cache')/'build.py'/'cache'
+	# persistent pacman dbpaths of the sync provider, keyed by effective pacman.conf (not inside cache_root:
+	# every directory there is a cache, see `cache.caches()`)
+	sync_root: Path = _xdg_dir('XDG_CACHE_HOME', '.cache')/'build.py'/'sync'
+	# time (seconds) within which the sync databases are not refreshed again
+	sync_refresh_interval: float = 3600.0
+	# build chroots: prepared base roots (one per pacman.conf/makepkg.conf pair) with `chroot_packages`, and how
+	# per-build snapshots of them are made ('copy': cp --reflink=auto, 'overlay': overlayfs mounts)
+	chroot_root: Path = _xdg_dir('XDG_STATE_HOME', '.local/state')/'build.py'/'chroot'
+	chroot_packages: tuple[str, ...] = ('base-devel',)
+	chroot_snapshot: str = 'copy'
+	# privileges for installing into, copying and mounting chroots
+	chroot_auth: Auth = Auth.Real
+
+	# parsed .SRCINFO files, keyed by PKGBUILD inputs
+	srcinfo_cache_size: int = 64 << 20
+	# built package files, keyed by PKGBUILD inputs and resolved dependency versions
+	build_cache_size: int = 8 << 30
+	# whether to (re)write .SRCINFO files into the pkgbuild tree
+	write_srcinfo: bool = True
+	# directories never descended into when looking for PKGBUILDs
+	scan_prune: tuple[str, ...] = ('.git', 'src', 'pkg')
+	# whether to keep a persistent index of the pkgbuild tree
+	scan_index: bool = True
+	# number of concurrent directory walkers (directory listing is latency-bound on network filesystems)
+	scan_jobs: int = 16
+
+	# number of concurrent workers for makepkg invocations etc.
+	jobs: int = os.cpu_count() or 1
+
+	# build scheduler: memory budget (bytes, None: unlimited) of concurrent builds, whose CPU budget is `jobs`,
+	# and what a single build is assumed to take (a build gets MAKEFLAGS=-j<build_job_cpus>)
+	build_memory: Optional[int] = None
+	build_job_cpus: int = 1
+	build_job_memory: int = 0
+	# makepkg output of the latest build of each pkgbase, as <pkgbase>.log
+	build_log_root: Path = _xdg_dir('XDG_STATE_HOME', '.local/state')/'build.py'/'logs'
+	# a build joins a group of builds sharing installed makedepends if the group covers at least this
+	# fraction (by installed size) of its build-time dependencies
+	makedepends_overlap: float = 0.5
+
+	# AUR RPC: per-request timeout (seconds), retries on 429/5xx/connection errors and backoff factor (seconds)
+	aur_timeout: float = 30.0
+	aur_retries: int = 3
+	aur_backoff: float = 0.5
+	# AUR RPC: maximum number of concurrent requests
+	aur_concurrency: int = 8
+	# AUR RPC: maximum number of names per multiinfo request
+	aur_info_chunk: int = 150
+	# AUR metadata cache: time (seconds) for which cached results are used without asking the RPC
+	aur_cache_ttl: float = 3600.0
+	# answer AUR queries purely from the metadata cache
+	aur_offline: bool = False
+	# load the full AUR metadata archive (packages-meta-ext-v1.json.gz) from this file or URL
+	# instead of querying the RPC for each name
+	aur_archive: Optional[str] = None
+
+	# providers (by id) that dependencies are resolved from, in order of precedence
+	resolve_providers: tuple[str, ...] = ('local', 'sync', 'aur')
+
 	auth_wrappers: dict[Auth, list[str]] = {
 		Auth.Fake: [ 'unshare', '-Ur' ],
 		Auth.Real: [ 'sudo' ],
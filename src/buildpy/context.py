@@ -4,12 +4,14 @@ from typing import (
 	TYPE_CHECKING,
 	TypeVar,
 	Any,
+	Optional,
 )
 import attr, attrs
 
 from buildpy.config import Config
 if TYPE_CHECKING:
 	from buildpy.provider import PackageProvider
+	from buildpy.resolve import DepGraph
 
 attr.s, attr.ib = attrs.define, attrs.field
 
@@ -21,6 +23,8 @@ T = TypeVar('T')
 class AppContext:
 	config: Config
 	providers: dict[type[Tp], Tp] = attr.ib(factory=dict)
+	# see DepGraph.get()
+	depgraph: 'Optional[DepGraph]' = None
 	_stack: contextlib.ExitStack = attr.ib(factory=contextlib.ExitStack)
 	_tmpdirs: dict[Any, tempfile.TemporaryDirectory] = attr.ib(factory=dict)
 
@@ -50,6 +54,9 @@ class AppContext:
 	def _with_context(self, obj: contextlib.AbstractContextManager[T]) -> T:
 		return self._stack.enter_context(obj)
 
+	def _callback(self, fn, /, *args, **kwargs):
+		self._stack.callback(fn, *args, **kwargs)
+
 	def __enter__(self):
 		return self
 
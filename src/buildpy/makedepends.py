@@ -0,0 +1,128 @@
+from collections import abc
+from typing import (
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+from buildpy.context import AppContext
+from buildpy.package import DepSpec, Pkgbase, Pkgname
+from buildpy.provider import SyncPackageProvider
+from buildpy.resolve import DepGraph, satisfies
+
+
+@attr.s(eq=False)
+class InstallGroup:
+	"""
+	Builds that could share one environment, with the sync packages (and their dependencies) to install for all of them.
+	"""
+	pkgbases: list[Pkgbase]
+	# package names, as passed to pacman
+	packages: set[str]
+	# the same, with dependencies
+	closure: set[str]
+
+	def __str__(self):
+		return f'{", ".join(p.pkgbase for p in self.pkgbases)}: {" ".join(sorted(self.packages))}'
+
+
+@attr.s
+class MakedependsPlan:
+	"""
+	Groups of builds with overlapping build-time dependencies, and what installing these once per group
+	saves over installing them once per build.
+	"""
+	groups: list[InstallGroup]
+	# (download, installed) bytes of installing dependencies per build, and per group
+	separate: tuple[int, int]
+	grouped: tuple[int, int]
+
+	@property
+	def saved(self) -> tuple[int, int]:
+		return self.separate[0] - self.grouped[0], self.separate[1] - self.grouped[1]
+
+	@classmethod
+	def plan(cls, ctx: AppContext, pkgbases: abc.Iterable[Pkgbase]) -> Self:
+		"""
+		Group `pkgbases` (a batch of builds), greedily, largest dependency sets first: a build joins the group
+		whose dependencies cover the largest part of its own (by installed size), if that part is at least
+		`config.makedepends_overlap`; otherwise it starts a new group.
+
+		Build-time dependencies are depends and makedepends that resolve to sync packages, with their own
+		dependencies.
+		"""
+		sync = SyncPackageProvider.get(ctx)
+		graph = DepGraph.get(ctx)
+		sizes: dict[str, tuple[int, int]] = {}
+		closures: dict[str, set[str]] = {}
+
+		def size(names: abc.Iterable[str]) -> tuple[int, int]:
+			csize, isize = 0, 0
+			for n in names:
+				c, i = sizes[n]
+				csize, isize = csize + c, isize + i
+			return csize, isize
+
+		def closure(pkgname: Pkgname) -> set[str]:
+			# dependencies of sync packages are only resolved within the sync databases, as pacman does
+			try:
+				return closures[pkgname.pkgname]
+			except KeyError:
+				pass
+			ret = closures[pkgname.pkgname] = set()
+			queue = [ pkgname ]
+			while queue:
+				p = queue.pop()
+				if p.pkgname in ret:
+					continue
+				ret.add(p.pkgname)
+				if p.pkgname not in sizes:
+					r = sync.record(p)
+					sizes[p.pkgname] = (r.csize, r.isize)
+				for spec in p.depends:
+					if (dep := _find(sync, spec)) is not None:
+						queue.append(dep)
+			return ret
+
+		builds: list[tuple[Pkgbase, set[str], set[str]]] = []
+		for pkgbase in pkgbases:
+			packages, deps = set(), set()
+			for r in graph.requires.get(pkgbase, []):
+				p = graph.resolved[r.spec]
+				if p is not None and p.pkgbase.provider is sync:
+					packages.add(p.pkgname)
+					deps |= closure(p)
+			builds.append((pkgbase, packages, deps))
+
+		groups: list[InstallGroup] = []
+		builds.sort(key=lambda b: size(b[2])[1], reverse=True)
+		for pkgbase, packages, deps in builds:
+			best, best_overlap = None, -1
+			for g in groups:
+				overlap = size(deps & g.closure)[1]
+				if overlap > best_overlap:
+					best, best_overlap = g, overlap
+			own = size(deps)[1]
+			if best is not None and (own == 0 or best_overlap >= own * ctx.config.makedepends_overlap):
+				best.pkgbases.append(pkgbase)
+				best.packages |= packages
+				best.closure |= deps
+			else:
+				groups.append(InstallGroup(pkgbases=[ pkgbase ], packages=set(packages), closure=set(deps)))
+
+		separate = [ size(deps) for _, _, deps in builds ]
+		grouped = [ size(g.closure) for g in groups ]
+		return cls(
+			groups=groups,
+			separate=(sum(s[0] for s in separate), sum(s[1] for s in separate)),
+			grouped=(sum(s[0] for s in grouped), sum(s[1] for s in grouped)),
+		)
+
+
+def _find(sync: SyncPackageProvider, spec: DepSpec) -> Optional[Pkgname]:
+	for p in sync.by_pkgname.get(spec.name, []) + sync.by_provides.get(spec.name, []):
+		if satisfies(p, spec):
+			return p
+	return None
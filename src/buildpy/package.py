@@ -1,29 +1,95 @@
+import re
+import sys
+from collections import abc
 from typing import (
 	Any,
+	NamedTuple,
 )
 
 import attr, attrs
 attr.s, attr.ib = attrs.define, attrs.field
 
+from buildpy.vercmp import Version, vercmp
 
-@attr.s
+
+_DEPSPEC_RE = re.compile(r'([^<>=]*)(?:(<=|>=|<|>|=)(.*))?')
+
+
+# parsed specs by their string form, shared by all packages
+_depspecs: dict[str, 'DepSpec'] = {}
+
+_DEPSPEC_OPS: dict[str, abc.Callable[[int], bool]] = {
+	'': lambda cmp: True,
+	'=': lambda cmp: cmp == 0,
+	'<': lambda cmp: cmp < 0,
+	'<=': lambda cmp: cmp <= 0,
+	'>': lambda cmp: cmp > 0,
+	'>=': lambda cmp: cmp >= 0,
+}
+
+
+class DepSpec(NamedTuple):
+	"""
+	A dependency, provision or optional dependency: `foo>=1.0` -> ('foo', '>=', '1.0'),
+	`foo: for bar support` -> ('foo', '', '', 'for bar support').
+	"""
+	name: str
+	op: str = ''
+	version: str = ''
+	desc: str = ''
+
+	def __str__(self):
+		s = f'{self.name}{self.op}{self.version}'
+		if self.desc:
+			s += f': {self.desc}'
+		return s
+
+	@staticmethod
+	def parse(spec: 'str|DepSpec') -> 'DepSpec':
+		if isinstance(spec, DepSpec):
+			return spec
+		try:
+			return _depspecs[spec]
+		except KeyError:
+			pass
+		# versions may contain colons (epoch), but never ': '
+		head, _, desc = spec.partition(': ')
+		name, op, version = _DEPSPEC_RE.fullmatch(head).groups()
+		ret = DepSpec(sys.intern(name), sys.intern(op or ''), version or '', desc)
+		return _depspecs.setdefault(spec, ret)
+
+	def satisfied_by(self, version: 'str|Version') -> bool:
+		"""
+		Whether a package of `version` satisfies the version constraint, as in pacman: `foo=1.0` is satisfied
+		by `1.0-2`, since the pkgrel is only compared if both sides have one.
+		"""
+		if not self.op:
+			return True
+		return _DEPSPEC_OPS[self.op](vercmp(version, self.version))
+
+
+def depspecs(specs: 'abc.Iterable[str|DepSpec]') -> tuple[DepSpec, ...]:
+	return tuple(DepSpec.parse(s) for s in specs)
+
+
+@attr.s(eq=False)
 class Pkgbase:
-	pkgbase: str
+	pkgbase: str = attr.ib(converter=sys.intern)
 	version: str
 	pkgnames: 'list[Pkgname]'
-	depends: 'list[Pkgname|str]'
-	makedepends: 'list[Pkgname|str]'
-	optdepends: 'list[Pkgname|str]'
+	depends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
+	makedepends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
+	optdepends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
 	provider: Any
 	uptodate: bool
 
 
-@attr.s
+@attr.s(eq=False)
 class Pkgname:
 	pkgbase: Pkgbase
-	pkgname: str
-	depends: 'list[Pkgname|str]'
-	makedepends: 'list[Pkgname|str]'
-	optdepends: 'list[Pkgname|str]'
-	provides: 'list[str]'
+	pkgname: str = attr.ib(converter=sys.intern)
+	depends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
+	makedepends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
+	optdepends: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
+	provides: tuple[DepSpec, ...] = attr.ib(converter=depspecs)
 	uptodate: bool
@@ -0,0 +1,276 @@
+import queue
+import threading
+import time
+from collections import abc
+from typing import (
+	Any,
+	ClassVar,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+
+# end-of-stream marker
+_DONE = object()
+
+
+class _Cancelled(BaseException):
+	"""
+	Raised in worker threads once the consumer of `Pipeline.run()` went away.
+	"""
+
+
+@attr.s
+class StageStats:
+	name: str
+	workers: int
+	items_in: int = 0
+	items_out: int = 0
+	batches: int = 0
+	errors: int = 0
+	# time spent in the stage function, summed over workers
+	busy: float = 0.0
+	# time from the start of the pipeline until the stage has finished
+	wall: float = 0.0
+	# depth of the stage's input queue
+	queue_depth: int = 0
+	queue_max: int = 0
+
+	@property
+	def throughput(self) -> float:
+		return self.items_in / self.wall if self.wall else 0.0
+
+	@property
+	def utilization(self) -> float:
+		return self.busy / (self.wall * self.workers) if self.wall else 0.0
+
+	def __str__(self):
+		return (f'{self.name}: {self.items_in} in, {self.items_out} out, {self.errors} errors, '
+		        f'{self.throughput:.1f}/s, {self.utilization:.0%} busy ({self.workers} workers), '
+		        f'queue max {self.queue_max}')
+
+
+@attr.s
+class _Stage:
+	stats: StageStats
+	fn: abc.Callable[[Any], abc.Iterable[Any]]
+	batch: Optional[int]
+	inq: Optional[queue.Queue]
+	flush: Optional[abc.Callable[[], abc.Iterable[Any]]] = None
+	outq: Optional[queue.Queue] = None
+	next: Optional['_Stage'] = None
+	workers_left: int = 0
+	lock: threading.Lock = attr.ib(factory=threading.Lock)
+
+
+class Pipeline:
+	"""
+	A chain of stages connected by bounded queues. Each stage runs in its own worker thread(s) and processes
+	items as soon as they arrive, so that a slow stage does not hold back the ones before it (up to the queue
+	bound) and the ones after it can start early.
+
+	Each stage function takes an item (or a list of items, for batching stages) and returns an iterable of items
+	for the next stage. Exceptions raised by stage functions are collected in `errors` and the offending item
+	is dropped.
+
+	If the consumer stops iterating `run()`, the stages are cancelled: workers exit as soon as they are done
+	with the current item.
+	"""
+	# how often (seconds) threads blocked on a queue check for cancellation
+	poll_interval: ClassVar[float] = 0.05
+	maxsize: int
+	errors: list[Exception]
+	_stages: list[_Stage]
+	_errors_lock: threading.Lock
+	_cancel: threading.Event
+	_start: float
+
+	def __init__(self, source: abc.Iterable[Any], *, name: str = 'source', maxsize: int = 64):
+		self.maxsize = maxsize
+		self.errors = []
+		self._errors_lock = threading.Lock()
+		self._cancel = threading.Event()
+		self._stages = [ _Stage(
+			stats=StageStats(name=name, workers=1),
+			fn=lambda _: source,
+			batch=None,
+			inq=None,
+		) ]
+
+	@property
+	def stats(self) -> list[StageStats]:
+		for s in self._stages:
+			if s.inq is not None:
+				s.stats.queue_depth = s.inq.qsize()
+		return [ s.stats for s in self._stages ]
+
+	def then(self, name: str, fn: abc.Callable[[Any], abc.Iterable[Any]], *, workers: int = 1,
+	         flush: Optional[abc.Callable[[], abc.Iterable[Any]]] = None) -> Self:
+		"""
+		Add a stage that calls `fn` on each item. If given, `flush` is called once all items have been processed,
+		and what it returns is passed on as well.
+		"""
+		self._stages.append(_Stage(
+			stats=StageStats(name=name, workers=workers),
+			fn=fn,
+			batch=None,
+			inq=queue.Queue(maxsize=self.maxsize),
+			flush=flush,
+		))
+		return self
+
+	def batch(self, name: str, fn: abc.Callable[[list[Any]], abc.Iterable[Any]], *, size: int) -> Self:
+		"""
+		Add a stage that calls `fn` on batches of up to `size` items. A batch is formed from whatever
+		is available in the input queue as soon as the stage is ready for it.
+		"""
+		self._stages.append(_Stage(
+			stats=StageStats(name=name, workers=1),
+			fn=fn,
+			batch=size,
+			inq=queue.Queue(maxsize=self.maxsize),
+		))
+		return self
+
+	def _error(self, stage: _Stage, e: Exception):
+		with stage.lock:
+			stage.stats.errors += 1
+		with self._errors_lock:
+			self.errors.append(e)
+
+	def _get(self, q: queue.Queue) -> Any:
+		while True:
+			if self._cancel.is_set():
+				raise _Cancelled()
+			try:
+				return q.get(timeout=self.poll_interval)
+			except queue.Empty:
+				pass
+
+	def _put(self, stage: _Stage, item: Any):
+		while True:
+			if self._cancel.is_set():
+				raise _Cancelled()
+			try:
+				stage.outq.put(item, timeout=self.poll_interval)
+				break
+			except queue.Full:
+				pass
+		if item is not _DONE and stage.next is not None:
+			depth = stage.outq.qsize()
+			with stage.next.lock:
+				stage.next.stats.queue_max = max(stage.next.stats.queue_max, depth)
+
+	def _run_source(self, stage: _Stage):
+		try:
+			for item in stage.fn(None):
+				with stage.lock:
+					stage.stats.items_out += 1
+				self._put(stage, item)
+		except Exception as e:
+			self._error(stage, e)
+		finally:
+			stage.stats.items_in = stage.stats.items_out
+			stage.stats.wall = time.perf_counter() - self._start
+			self._put(stage, _DONE)
+
+	def _get_batch(self, stage: _Stage) -> tuple[list[Any], bool]:
+		item = self._get(stage.inq)
+		if item is _DONE:
+			return [], True
+		items = [ item ]
+		if stage.batch is not None:
+			while len(items) < stage.batch:
+				try:
+					item = stage.inq.get_nowait()
+				except queue.Empty:
+					break
+				if item is _DONE:
+					return items, True
+				items.append(item)
+		return items, False
+
+	def _run_worker(self, stage: _Stage):
+		done = False
+		while not done:
+			items, done = self._get_batch(stage)
+			if not items:
+				break
+
+			t = time.perf_counter()
+			try:
+				out = list(stage.fn(items if stage.batch is not None else items[0]))
+			except Exception as e:
+				out = []
+				self._error(stage, e)
+			t = time.perf_counter() - t
+
+			with stage.lock:
+				stage.stats.items_in += len(items)
+				stage.stats.items_out += len(out)
+				stage.stats.batches += 1
+				stage.stats.busy += t
+			for item in out:
+				self._put(stage, item)
+
+		with stage.lock:
+			stage.workers_left -= 1
+			last = stage.workers_left == 0
+		if last:
+			if stage.flush is not None:
+				try:
+					out = list(stage.flush())
+				except Exception as e:
+					out = []
+					self._error(stage, e)
+				with stage.lock:
+					stage.stats.items_out += len(out)
+				for item in out:
+					self._put(stage, item)
+			stage.stats.wall = time.perf_counter() - self._start
+			self._put(stage, _DONE)
+		else:
+			# wake up sibling workers
+			stage.inq.put(_DONE)
+
+	@staticmethod
+	def _thread(fn: abc.Callable[[_Stage], None], stage: _Stage):
+		try:
+			fn(stage)
+		except _Cancelled:
+			pass
+
+	def run(self) -> abc.Iterator[Any]:
+		"""
+		Start all stages and yield items produced by the last stage.
+		"""
+		sink = queue.Queue(maxsize=self.maxsize)
+		for stage, nxt in zip(self._stages, self._stages[1:]):
+			stage.outq = nxt.inq
+			stage.next = nxt
+		self._stages[-1].outq = sink
+
+		self._start = time.perf_counter()
+		threads = [ threading.Thread(target=self._thread, args=(self._run_source, self._stages[0]),
+		                             name=f'pipeline-{self._stages[0].stats.name}', daemon=True) ]
+		for stage in self._stages[1:]:
+			stage.workers_left = stage.stats.workers
+			threads += [
+				threading.Thread(target=self._thread, args=(self._run_worker, stage),
+				                 name=f'pipeline-{stage.stats.name}', daemon=True)
+				for _ in range(stage.stats.workers)
+			]
+		for t in threads:
+			t.start()
+
+		try:
+			while (item := sink.get()) is not _DONE:
+				yield item
+		finally:
+			# a no-op if all stages are done already
+			self._cancel.set()
+			for t in threads:
+				t.join()
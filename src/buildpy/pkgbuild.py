@@ -1,8 +1,14 @@
 import enum
+import hashlib
+import os
+import re
 import subprocess
+from collections import abc
 from pathlib import Path
 from typing import (
 	TYPE_CHECKING,
+	ClassVar,
+	Optional,
 	Self,
 )
 
@@ -58,6 +64,102 @@ class PKGBUILD:
 	def from_config(cls, config_file: Path) -> Self:
 		raise NotImplementedError()
 
+	_source_re = re.compile(r'^\s*(?:source|\.)\s+["\']?([^\s"\';&|]+)', flags=re.MULTILINE)
+
+	def sourced_files(self) -> list[Path]:
+		"""
+		Local files (transitively) sourced by the PKGBUILD, e.g. shared helpers. Paths that cannot be resolved
+		without evaluating the PKGBUILD are ignored.
+		"""
+		startdir = self.pkgbuild_file.parent
+		ret: list[Path] = []
+		seen: set[Path] = { self.pkgbuild_file }
+		queue: list[Path] = [ self.pkgbuild_file ]
+		while queue:
+			text = queue.pop(0).read_text(errors='replace')
+			for m in self._source_re.finditer(text):
+				arg = m.group(1).replace('${startdir}', str(startdir)).replace('$startdir', str(startdir))
+				if '$' in arg or '`' in arg:
+					continue
+				path = startdir/arg
+				if path in seen or not path.is_file():
+					continue
+				seen.add(path)
+				ret.append(path)
+				queue.append(path)
+		return ret
+
+	def inputs_hash(self, *, config: Config) -> str:
+		"""
+		A digest of everything that affects makepkg's view of the PKGBUILD: the PKGBUILD itself, local files
+		sourced by it and makepkg.conf.
+		"""
+		h = hashlib.sha256()
+
+		def update(tag: str, path: Path):
+			data = path.read_bytes()
+			h.update(f'{tag}\0{len(data)}\0'.encode())
+			h.update(data)
+
+		update(self.pkgbuild_file.name, self.pkgbuild_file)
+		for p in self.sourced_files():
+			update(os.path.relpath(p, self.pkgbuild_file.parent), p)
+		if config.makepkg_conf:
+			update('makepkg.conf', Path(config.makepkg_conf))
+		return h.hexdigest()
+
+	def local_sources(self) -> list[Path]:
+		"""
+		Files in the PKGBUILD directory used by the build, as listed in .SRCINFO: `source` entries without a URL
+		(for any architecture), `install` and `changelog` scripts.
+		"""
+		startdir = self.pkgbuild_file.parent
+		names = []
+		for section in self.srcinfo.sections.values():
+			for key, value in section.items():
+				if key in ('install', 'changelog'):
+					names.append(value)
+				elif key == 'source' or isinstance(key, str) and key.startswith('source_'):
+					for source in value:
+						# `name::url`
+						name, _, url = source.rpartition('::')
+						if '://' not in url and not url.startswith(('git+', 'svn+', 'hg+', 'bzr+', 'fossil+')):
+							names.append(os.path.basename(url))
+		return [ startdir/n for n in dict.fromkeys(names) ]
+
+	# environment variables that makepkg lets override makepkg.conf, and that end up in packages
+	BUILD_ENV: ClassVar[tuple[str, ...]] = ('PACKAGER', 'PKGEXT', 'SOURCE_DATE_EPOCH')
+
+	def build_key(self, *, config: Config, depends: abc.Mapping[str, str], makepkg_args: abc.Sequence[str] = (),
+	              env: Optional[abc.Mapping[str, str]] = None) -> str:
+		"""
+		A digest of everything that determines the packages built from the PKGBUILD: `inputs_hash()`, local
+		sources, the versions of the packages its dependencies resolve to (`depends`: dependency -> version),
+		makepkg arguments and `BUILD_ENV` variables of `env` (default: the current environment).
+		"""
+		if env is None:
+			env = os.environ
+		h = hashlib.sha256(self.inputs_hash(config=config).encode())
+		for arg in makepkg_args:
+			h.update(f'\0arg\0{arg}'.encode())
+		for name in self.BUILD_ENV:
+			if name in env:
+				h.update(f'\0env\0{name}={env[name]}'.encode())
+		for p in self.local_sources():
+			data = p.read_bytes()
+			h.update(f'\0{p.name}\0{len(data)}\0'.encode())
+			h.update(data)
+		for name in sorted(depends):
+			h.update(f'\0{name}\0{depends[name]}'.encode())
+		return h.hexdigest()
+
+	def makepkg_packagelist(self, *, config: Config, **kwargs) -> list[Path]:
+		"""
+		Paths of the package files that makepkg would produce.
+		"""
+		out = self.run_makepkg([ '--packagelist' ], config=config, **kwargs).stdout
+		return [ Path(line) for line in out.splitlines() if line ]
+
 	def _makepkg_args(self, args: list[str], *, config: Config) -> list[str]:
 		cmdline: list[str] = [ 'makepkg' ]
 		if config.makepkg_conf:
@@ -71,14 +173,17 @@ class PKGBUILD:
 
 	def run_makepkg(self, args: list[str], *, config: Config, **kwargs) \
 			-> subprocess.CompletedProcess[str]:
+		makepkg_kwargs = {
+			'stdin': subprocess.DEVNULL,
+			'stdout': subprocess.PIPE,
+		}
+		makepkg_kwargs.update(kwargs)
 		return subprocess.run(
 			args=self._makepkg_args(args, config=config),
 			cwd=self.pkgbuild_file.parent,
 			check=True,
 			text=True,
-			stdin=subprocess.DEVNULL,
-			stdout=subprocess.PIPE,
-			**kwargs,
+			**makepkg_kwargs,
 		)
 
 	def pipe_makepkg(self, args: list[str], *, config: Config, **kwargs) \
@@ -1,37 +1,240 @@
+import concurrent.futures
+import hashlib
+import itertools
 import os
+import shutil
+import subprocess
+from collections import abc
 from pathlib import Path
+from typing import (
+	Optional,
+)
 
+from buildpy.cache import BuildCache, Cache
 from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.pipeline import Pipeline
+from buildpy.package import Pkgbase
 from buildpy.pkgbuild import PKGBUILD
+from buildpy.provider import LocalPackageProvider
+from buildpy.resolve import DepGraph, local_dependencies
+from buildpy.scan import ScanIndex
+from buildpy.schedule import BuildJob, BuildScheduler, JobState
 from buildpy.srcinfo import SRCINFO
 
 
-def find_pkgbuilds(config: Config) -> list[PKGBUILD]:
-	for path, dirs, files in os.walk(config.pkgbuild_root, onerror=lambda e: exec('raise e')):
-		path = Path(path)
-		# 1. trivial case: if PKGBUILD exists -> load it
-		if 'PKGBUILD' in files:
-			yield PKGBUILD.from_path(path, path/'PKGBUILD')
-			dirs[:] = []
-		# 2. asp-style checkouts: if trunk/PKGBUILD exists -> load it and do not traverse further
-		#    (this will necessarily happen before (1) due to topdown=True)
-		elif 'trunk' in dirs and (path/'trunk'/'PKGBUILD').is_file():
-			yield PKGBUILD.from_path(path, path/'trunk'/'PKGBUILD')
-			dirs[:] = []
-		# 3. TODO: per-pkgbase config: if exists -> load indicated PKGBUILD, do not traverse further
-		# 4. TODO: multiple pkgbase per git repo: remember and save git dir
+def find_pkgbuilds(config: Config) -> abc.Iterator[PKGBUILD]:
+	index = ScanIndex.load(config)
+	for base_dir, pkgbuild_file in index.scan(jobs=config.scan_jobs):
+		yield PKGBUILD.from_path(base_dir, pkgbuild_file)
+	index.save(config)
 
 
-def load_srcinfo(pkgbuild: PKGBUILD, config: Config):
+def load_srcinfo(pkgbuild: PKGBUILD, config: Config, cache: Optional[Cache] = None):
 	if not pkgbuild.srcinfo:
-		srcinfo = SRCINFO.from_pkgbuild(pkgbuild, config)
-		pkgbuild.srcinfo = srcinfo
+		try:
+			pkgbuild.srcinfo = SRCINFO.from_pkgbuild(pkgbuild, config, cache=cache)
+		except subprocess.CalledProcessError as e:
+			pkgbuild.r4ise(f'makepkg failed: {e}')
+		except OSError as e:
+			pkgbuild.r4ise(f'could not load .SRCINFO: {e}')
+		pkgbuild.state |= PKGBUILD.State.PkgbuildLoaded
+	srcinfo = pkgbuild.srcinfo
 
 	if not pkgbuild.pkgbase or not pkgbuild.pkgname:
 		pkgbuild.pkgbase = srcinfo.headers['pkgbase']
 		pkgbuild.pkgname = srcinfo.headers['pkgname']
+		pkgbuild.state |= PKGBUILD.State.NameLoaded
 
 
-def load_pkgbuilds(pkgbuilds: list[PKGBUILD], config: Config):
-	for pkgbuild in pkgbuilds:
-		load_srcinfo(pkgbuild, config)
+def _try_load_srcinfo(pkgbuild: PKGBUILD, config: Config, cache: Optional[Cache]) -> Optional[PKGBUILD.Error]:
+	try:
+		load_srcinfo(pkgbuild, config, cache=cache)
+	except PKGBUILD.Error as e:
+		return e
+
+
+def load_pkgbuilds(pkgbuilds: abc.Iterable[PKGBUILD], config: Config, *, jobs: Optional[int] = None) \
+		-> tuple[list[PKGBUILD], list[PKGBUILD.Error]]:
+	"""
+	Load .SRCINFO for each of `pkgbuilds`, running up to `jobs` (default: `config.jobs`) makepkg invocations
+	concurrently. A failure to load one PKGBUILD does not abort the others.
+
+	Returns successfully loaded PKGBUILDs and errors, both in the order of input.
+	"""
+	if jobs is None:
+		jobs = config.jobs
+	pkgbuilds = list(pkgbuilds)
+	cache = Cache.from_config(config, 'srcinfo')
+
+	if jobs > 1 and len(pkgbuilds) > 1:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='load_srcinfo') as pool:
+			# map() yields results in the order of submission
+			results = list(pool.map(lambda p: _try_load_srcinfo(p, config, cache), pkgbuilds))
+	else:
+		results = [ _try_load_srcinfo(p, config, cache) for p in pkgbuilds ]
+	cache.prune()
+
+	loaded = [ p for p, e in zip(pkgbuilds, results) if e is None ]
+	errors = [ e for e in results if e is not None ]
+	return loaded, errors
+
+
+def review_pipeline(ctx: AppContext, *, lookup: bool = False, lookup_batch: int = 100) -> Pipeline:
+	"""
+	Build a pipeline that discovers PKGBUILDs, loads their .SRCINFO, indexes them in the local provider
+	and (optionally) looks up their dependencies in external providers in batches, with all stages
+	running concurrently.
+
+	Dependencies are only looked up once all PKGBUILDs are indexed: one that is not found locally yet may
+	still be provided by a PKGBUILD discovered later.
+
+	The pipeline yields loaded PKGBUILDs (or, if `lookup` is set, batches of looked up names).
+	"""
+	config = ctx.config
+	cache = Cache.from_config(config, 'srcinfo')
+	local = LocalPackageProvider.get(ctx)
+	# in order of precedence, so that names found in sync databases are not looked up in the AUR
+	by_id = { p.id: p for p in ctx.providers.values() }
+	external = [ by_id[i] for i in config.resolve_providers if i in by_id and by_id[i] is not local ]
+	names: dict[str, None] = {}
+
+	def is_known(name: str) -> bool:
+		return any(name in p.by_pkgname or name in p.by_provides for p in ctx.providers.values())
+
+	def load(pkgbuild: PKGBUILD) -> list[PKGBUILD]:
+		load_srcinfo(pkgbuild, config, cache=cache)
+		return [ pkgbuild ]
+
+	def index(pkgbuild: PKGBUILD) -> list[PKGBUILD]:
+		pkgbase = local.load_pkgbuild(pkgbuild)
+		if not lookup:
+			return [ pkgbuild ]
+		for spec in itertools.chain(pkgbase.depends, pkgbase.makedepends, *( p.depends for p in pkgbase.pkgnames )):
+			names.setdefault(spec.name)
+		return []
+
+	def unknown() -> list[str]:
+		return [ n for n in names if not is_known(n) ]
+
+	def resolve(batch: list[str]) -> list[list[str]]:
+		for p in external:
+			if not (batch := [ n for n in batch if not is_known(n) ]):
+				break
+			p.load_packages(batch)
+		return [ batch ]
+
+	pipeline = Pipeline(find_pkgbuilds(config), name='discover')
+	pipeline.then('load', load, workers=config.jobs)
+	pipeline.then('index', index, flush=unknown if lookup else None)
+	if lookup:
+		pipeline.batch('lookup', resolve, size=lookup_batch)
+	return pipeline
+
+
+def _buildtime_key(pkgbase: str) -> str:
+	return hashlib.sha256(pkgbase.encode()).hexdigest()
+
+
+def build_scheduler(ctx: AppContext, pkgbuilds: abc.Iterable[PKGBUILD]) -> BuildScheduler:
+	"""
+	Plan builds of `pkgbuilds` (already indexed by the local provider) in the order of their dependencies
+	on each other, as matched against the local provider (no other provider is asked). Durations of previous
+	builds are used to find the critical path.
+
+	Raises `BuildScheduler.Error` if there are dependency cycles.
+	"""
+	config = ctx.config
+	local = LocalPackageProvider.get(ctx)
+	by_pkgbase = { p.pkgbase: p for p in pkgbuilds }
+	times = Cache.from_config(config, 'buildtime')
+
+	pkgbases = [ p for p in local.pkgbases if p.pkgbase in by_pkgbase ]
+	costs = { p: times.get(_buildtime_key(p.pkgbase)) for p in pkgbases }
+	# builds that never ran are assumed to take as long as the average one
+	known = [ c for c in costs.values() if c is not None ]
+	default_cost = sum(known) / len(known) if known else 1.0
+
+	jobs = {
+		p: BuildJob(
+			name=p.pkgbase,
+			target=by_pkgbase[p.pkgbase],
+			cost=costs[p] if costs[p] is not None else default_cost,
+			cpus=config.build_job_cpus,
+			memory=config.build_job_memory,
+		)
+		for p in pkgbases
+	}
+	dependencies = local_dependencies(local)
+	for pkgbase, job in jobs.items():
+		job.deps = [ jobs[d] for d in dependencies[pkgbase] if d in jobs ]
+
+	return BuildScheduler(list(jobs.values()), cpus=config.jobs, memory=config.build_memory)
+
+
+def _restore_packages(pkgbuild: PKGBUILD, files: list[Path], config: Config) -> bool:
+	"""
+	Copy cached package `files` to where makepkg would put them. Returns False if they do not match.
+	"""
+	by_name = { f.name: f for f in files }
+	dests = pkgbuild.makepkg_packagelist(config=config)
+	if sorted(by_name) != sorted(d.name for d in dests):
+		return False
+	for d in dests:
+		d.parent.mkdir(parents=True, exist_ok=True)
+		shutil.copy2(by_name[d.name], d)
+	return True
+
+
+def build_pkgbuilds(ctx: AppContext, scheduler: BuildScheduler, makepkg_args: abc.Sequence[str] = (), *,
+                    cache: Optional[BuildCache] = None) -> BuildScheduler:
+	"""
+	Run makepkg for each job of `scheduler`, with its output going to `config.build_log_root`/<pkgbase>.log.
+	Durations of successful builds are recorded for later planning.
+
+	With a `cache`, builds whose inputs (see `PKGBUILD.build_key()`, with dependency versions from the
+	dependency graph and `makepkg_args`) match a previous build reuse its package files instead of running makepkg.
+	Only then are dependencies resolved across providers (see `DepGraph`), which may raise provider errors.
+	"""
+	config = ctx.config
+	times = Cache.from_config(config, 'buildtime')
+	graph = DepGraph.get(ctx) if cache is not None else None
+	pkgbases = { p.pkgbase: p for p in LocalPackageProvider.get(ctx).pkgbases }
+	cached: set[BuildJob] = set()
+
+	def depends(pkgbase: Pkgbase) -> dict[str, str]:
+		ret = {}
+		for r in graph.requires[pkgbase]:
+			p = graph.resolved[r.spec]
+			ret[str(r.spec)] = f'{p.pkgname}={p.pkgbase.version}' if p is not None else ''
+		return ret
+
+	def build(job: BuildJob):
+		pkgbuild: PKGBUILD = job.target
+		env = os.environ | { 'MAKEFLAGS': f'-j{job.cpus}' }
+		log = config.build_log_root/f'{job.name}.log'
+		try:
+			key = None
+			if cache is not None:
+				key = pkgbuild.build_key(config=config, depends=depends(pkgbases[job.name]),
+				                         makepkg_args=makepkg_args, env=env)
+				if (files := cache.get(key)) is not None and _restore_packages(pkgbuild, files, config):
+					cached.add(job)
+					return
+			log.parent.mkdir(parents=True, exist_ok=True)
+			with log.open('w') as f:
+				pkgbuild.run_makepkg(list(makepkg_args), config=config, env=env, stdout=f, stderr=subprocess.STDOUT)
+			if key is not None:
+				cache.put(key, pkgbuild.makepkg_packagelist(config=config))
+		except subprocess.CalledProcessError as e:
+			pkgbuild.r4ise(f'makepkg failed: {e} (see {log})')
+		except OSError as e:
+			pkgbuild.r4ise(f'could not run makepkg: {e}')
+
+	scheduler.run(build)
+	for job in scheduler.jobs:
+		if job.state is JobState.Done and job not in cached:
+			times.put(_buildtime_key(job.name), job.duration)
+	if cache is not None:
+		cache.prune()
+	return scheduler
@@ -1,24 +1,39 @@
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import time
+import urllib.parse
 from collections import abc
 from typing import (
 	TYPE_CHECKING,
+	Any,
 	TypeAlias,
+	TypeVar,
 	ClassVar,
 	Optional,
 )
 import attr, attrs
-import cattrs
-import cattrs.strategies
-import cattrs.preconf.json
 import requests
+import requests.adapters
+import urllib3.util
 
 import buildpy.util
-from buildpy.package import Pkgbase, Pkgname
+from buildpy.cache import Cache
+from buildpy.package import DepSpec, Pkgbase, Pkgname
 from .base import PackageProvider
 if TYPE_CHECKING:
 	from buildpy.context import AppContext
 
 attr.s, attr.ib = attrs.define, attrs.field
 
+T = TypeVar('T')
+U = TypeVar('U')
+
 
 @attr.s
 class SearchResult:
@@ -27,32 +42,33 @@ class SearchResult:
 	PackageBaseID: int
 	PackageBase: str
 	Version: str
-	Description: str
-	URL: str
-	NumVotes: int
-	Popularity: int
-	OutOfDate: bool
-	Maintainer: str
-	FirstSubmitted: str
-	LastModified: str
-	URLPath: str
+	LastModified: int
+	# not used by the provider (and not decoded by `decode_response()`)
+	Description: Optional[str] = None
+	URL: Optional[str] = None
+	NumVotes: int = 0
+	Popularity: float = 0.0
+	OutOfDate: Optional[int] = None
+	Maintainer: Optional[str] = None
+	FirstSubmitted: Optional[int] = None
+	URLPath: Optional[str] = None
 
 @attr.s(field_transformer=buildpy.util.factorize)
 class InfoResult(SearchResult):
-	License: str
 	Depends: list[str] = []
 	MakeDepends: list[str] = []
 	OptDepends: list[str] = []
+	Provides: list[str] = []
+	# not used by the provider (and not decoded by `decode_response()`)
 	CheckDepends: list[str] = []
 	Conflicts: list[str] = []
-	Provides: list[str] = []
 	Replaces: list[str] = []
 	Groups: list[str] = []
 	Keywords: list[str] = []
+	License: list[str] = []
 
 @attr.s
 class BaseResponse:
-	converter: ClassVar[cattrs.preconf.json.JsonConverter]
 	type: ClassVar[str]
 	version: int
 	resultcount: int
@@ -75,13 +91,77 @@ class InfoResponse(BaseResponse):
 
 Response: TypeAlias = ErrorResponse|SearchResponse|InfoResponse
 
-BaseResponse.converter = cattrs.preconf.json.make_converter()
-cattrs.strategies.configure_tagged_union(
-	Response,
-	BaseResponse.converter,
-	tag_generator=lambda t: t.type,
-	tag_name='type',
-)
+# (fetch time, result); `None` records that the RPC did not know the name
+InfoEntry: TypeAlias = tuple[float, Optional[InfoResult]]
+SearchEntry: TypeAlias = tuple[float, list[SearchResult]]
+
+
+@attr.s
+class MetadataCache:
+	"""
+	RPC results that persist across runs, keyed by pkgname (`info`) or by searched-for provided name (`provides`).
+	"""
+	# bump when the layout of cached results changes to invalidate cached entries
+	CACHE_VERSION: ClassVar[int] = 2
+	# entries that were not refreshed for this long are dropped on save
+	EXPIRE: ClassVar[float] = 30 * 24 * 3600
+
+	info: dict[str, InfoEntry] = attr.ib(factory=dict)
+	provides: dict[str, SearchEntry] = attr.ib(factory=dict)
+	dirty: bool = attr.ib(default=False, eq=False)
+
+	def expire(self, now: float):
+		for d in (self.info, self.provides):
+			for name in [ name for name, (fetched, _) in d.items() if now - fetched >= self.EXPIRE ]:
+				del d[name]
+
+try:
+	import orjson
+	_json_loads = orjson.loads
+except ImportError:
+	_json_loads = json.loads
+
+
+# specialised structuring functions: these trust JSON types and only decode fields used by the provider
+
+def _structure_search(d: dict[str, Any]) -> SearchResult:
+	return SearchResult(
+		ID=d['ID'],
+		Name=d['Name'],
+		PackageBaseID=d['PackageBaseID'],
+		PackageBase=d['PackageBase'],
+		Version=d['Version'],
+		LastModified=d['LastModified'],
+	)
+
+def _structure_info(d: dict[str, Any]) -> InfoResult:
+	return InfoResult(
+		ID=d['ID'],
+		Name=d['Name'],
+		PackageBaseID=d['PackageBaseID'],
+		PackageBase=d['PackageBase'],
+		Version=d['Version'],
+		LastModified=d['LastModified'],
+		Depends=d.get('Depends', []),
+		MakeDepends=d.get('MakeDepends', []),
+		OptDepends=d.get('OptDepends', []),
+		Provides=d.get('Provides', []),
+	)
+
+def decode_response(content: bytes) -> Response:
+	"""
+	Decode an RPC response. Fields not used by the provider are left at their defaults.
+	"""
+	obj = _json_loads(content)
+	match obj['type']:
+		case InfoResponse.type:
+			return InfoResponse(obj['version'], obj['resultcount'], [ _structure_info(r) for r in obj['results'] ])
+		case SearchResponse.type:
+			return SearchResponse(obj['version'], obj['resultcount'], [ _structure_search(r) for r in obj['results'] ])
+		case ErrorResponse.type:
+			return ErrorResponse(obj['version'], obj['resultcount'], obj['results'], obj['error'])
+		case t:
+			raise ValueError(f'Unknown response type: {t!r}')
 
 
 class AURPackageProvider(PackageProvider):
@@ -112,44 +192,182 @@ class AURPackageProvider(PackageProvider):
 
 	id: ClassVar[str] = 'aur'
 	base_url: ClassVar[str] = 'https://aur.archlinux.org'
+	# full metadata archive, relative to `base_url`
+	archive_path: ClassVar[str] = '/packages-meta-ext-v1.json.gz'
 	pkgbases: dict[int, Pkgbase]
 	pkgnames: dict[int, Pkgname]
 	by_pkgname: dict[str, list[Pkgname]]
 	by_provides: dict[str, list[Pkgname]]
+	session: requests.Session
+	timeout: float
+	concurrency: int
+	info_chunk: int
+	cache_ttl: float
+	offline: bool
+	# the full metadata archive to load instead of querying the RPC
+	archive: Optional[str]
+	# whether the indexes hold all AUR packages (i.e. the archive has been loaded)
+	complete: bool
+	# LastModified of packages seen in search results, by pkgname
+	_last_modified: dict[str, int]
+	_cache: Cache
+	_metadata: Optional[MetadataCache]
 
-	def __init__(self, _: 'AppContext'):
+	def __init__(self, ctx: 'AppContext'):
 		self.pkgbases = dict()
 		self.pkgnames = dict()
 		self.by_pkgname = dict()
 		self.by_provides = dict()
 
+		config = ctx.config
+		self.timeout = config.aur_timeout
+		self.concurrency = config.aur_concurrency
+		self.info_chunk = config.aur_info_chunk
+		self.cache_ttl = config.aur_cache_ttl
+		self.offline = config.aur_offline
+		self.archive = config.aur_archive
+		self.complete = False
+		self._last_modified = dict()
+		self.session = ctx._with_context(self._make_session(
+			retries=config.aur_retries,
+			backoff=config.aur_backoff,
+			pool_size=config.aur_concurrency,
+		))
+
+		self._cache = Cache.from_config(config, 'aur')
+		self._metadata = None
+		ctx._callback(self._save_metadata)
+
+	def _cache_key(self) -> str:
+		h = hashlib.sha256(self.base_url.encode())
+		return f'{h.hexdigest()}-v{MetadataCache.CACHE_VERSION}'
+
+	@property
+	def metadata(self) -> MetadataCache:
+		# loaded on first use: `base_url` may be changed after construction
+		if self._metadata is None:
+			self._metadata = self._cache.get(self._cache_key(), default=None) or MetadataCache()
+		return self._metadata
+
+	def _save_metadata(self):
+		if self._metadata is not None and self._metadata.dirty:
+			self._metadata.dirty = False
+			self._metadata.expire(time.time())
+			self._cache.put(self._cache_key(), self._metadata)
+
+	def _is_fresh(self, fetched: float, now: float) -> bool:
+		return self.offline or now - fetched < self.cache_ttl
+
+	@staticmethod
+	def _make_session(*, retries: int, backoff: float, pool_size: int) -> requests.Session:
+		retry = urllib3.util.Retry(
+			total=retries,
+			backoff_factor=backoff,
+			status_forcelist=(429, 500, 502, 503, 504),
+			# all RPC requests are idempotent, including POSTs to /rpc/v5/info
+			allowed_methods=('GET', 'POST'),
+			respect_retry_after_header=True,
+			raise_on_status=False,
+		)
+		adapter = requests.adapters.HTTPAdapter(
+			max_retries=retry,
+			pool_connections=1,
+			pool_maxsize=max(pool_size, 1),
+		)
+		session = requests.Session()
+		session.mount('https://', adapter)
+		session.mount('http://', adapter)
+		return session
+
 	def load_packages(self, pkgnames: list[str]):
+		if self.archive is not None:
+			if not self.complete:
+				self.load_archive(self.archive)
+			# anything not in the archive does not exist
+			return
+
 		# step 1: direct lookup by pkgname
 		direct_targets = set(pkgnames) - self.by_pkgname.keys()
-		direct_pkgs = [
-			self._load_result(r)
-			for r
-			in self._aur_info(direct_targets)
-		]
-		direct_names = { p.pkgname for p in direct_pkgs }
+		# results are merged chunk by chunk as they arrive
+		direct_names = {
+			self._load_result(r).pkgname
+			for results in self._aur_info_cached(direct_targets)
+			for r in results
+		}
 		direct_missing = direct_targets - direct_names
 
 		# step 2: lookup by provides
 		virtual_targets = direct_missing - self.by_provides.keys()
-		virtual_pkgs = [
-			self._load_result(r)
-			for name in virtual_targets
-			for r in self._aur_search(field='provides', query=name)
-		]
-		# search only gives partial results; fully load them to get provided names
-		# TODO: somehow inject the searched-for provided name into the corresponding Pkgnames
-		#       this way we can avoid (or delay) fully loading Pkgnames but still resolve the required names
-		virtual_pkgs = [
-			self._load_result(r)
-			for r in self._aur_info({ p.pkgname for p in virtual_pkgs })
-		]
-		virtual_names = { name for p in virtual_pkgs for name in p.provides }
-		virtual_missing = virtual_targets - virtual_names
+		# searches run concurrently, but results are merged in a fixed order
+		# search only gives partial results: instead of fully loading every candidate to learn what it provides,
+		# record the searched-for name on it; candidates are fully loaded by `promote()` once chosen
+		for name, results in self._aur_search_cached(virtual_targets):
+			for r in results:
+				# search results carry LastModified, which revalidates cached info results for free
+				self._last_modified[r.Name] = r.LastModified
+				self._add_provides(self._load_result(r), name)
+
+	def promote(self, pkgnames: abc.Iterable[Pkgname]):
+		targets = { p.pkgname for p in pkgnames if p.pkgbase.provider is self and not p.uptodate }
+		for results in self._aur_info_cached(targets, self._last_modified):
+			for r in results:
+				self._load_result(r)
+
+	def load_archive(self, source: str):
+		"""
+		Load the full AUR metadata archive (gzipped JSON array of info results) from a local file or an URL,
+		indexing packages as they are decoded. In offline mode, only local files are loaded.
+		"""
+		remote = urllib.parse.urlsplit(source).scheme in ('http', 'https')
+		if remote and self.offline:
+			raise self.Error(f'Cannot load archive {source} in offline mode')
+		try:
+			with contextlib.ExitStack() as stack:
+				if remote:
+					resp = stack.enter_context(self.session.get(source, stream=True, timeout=self.timeout))
+					resp.raise_for_status()
+					# decompress ourselves, regardless of Content-Encoding
+					resp.raw.decode_content = False
+					# let the buffered reader see EOF instead of a closed file
+					resp.raw.auto_close = False
+					f = stack.enter_context(io.BufferedReader(resp.raw))
+				else:
+					f = stack.enter_context(open(source, 'rb'))
+				if f.peek(2)[:2] == b'\x1f\x8b':
+					f = stack.enter_context(gzip.GzipFile(fileobj=f))
+				f = stack.enter_context(io.TextIOWrapper(f, encoding='utf-8'))
+
+				for obj in buildpy.util.iter_json_array(f):
+					self._load_result(_structure_info(obj))
+		except requests.HTTPError as e:
+			raise self.Error(e, req=e.request, resp=e.response) from e
+		except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+			raise self.Error(f'Cannot load archive {source}: {e}') from e
+		self.complete = True
+
+	def _map(self, fn: abc.Callable[[T], U], args: abc.Iterable[T]) -> abc.Iterator[U]:
+		"""
+		Like `map()`, but run up to `self.concurrency` calls concurrently. Results are yielded in order;
+		at most `self.concurrency` results are in flight (or waiting to be consumed) at any time.
+		"""
+		args = iter(args)
+		if self.concurrency <= 1:
+			yield from map(fn, args)
+			return
+		with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='aur') as pool:
+			pending = collections.deque(
+				pool.submit(fn, arg)
+				for arg in itertools.islice(args, self.concurrency)
+			)
+			try:
+				while pending:
+					result = pending.popleft().result()
+					for arg in itertools.islice(args, 1):
+						pending.append(pool.submit(fn, arg))
+					yield result
+			finally:
+				for f in pending:
+					f.cancel()
 
 	def _load_result(self, arg: SearchResult|InfoResult) -> Pkgname:
 		# lookup pkgbase and pkgname
@@ -194,11 +412,23 @@ class AURPackageProvider(PackageProvider):
 			pkgname.provides = arg.Provides
 			pkgname.uptodate = True
 			# update lookup dictionaries, step 2
-			for name in pkgname.provides:
-				self.by_provides.setdefault(name, []).append(pkgname)
+			for spec in pkgname.provides:
+				self._index_provides(pkgname, spec.name)
 
 		return pkgname
 
+	def _index_provides(self, pkgname: Pkgname, name: str):
+		pkgnames = self.by_provides.setdefault(name, [])
+		# partial pkgnames may already be indexed under a searched-for name
+		if pkgname not in pkgnames:
+			pkgnames.append(pkgname)
+
+	def _add_provides(self, pkgname: Pkgname, name: str):
+		spec = DepSpec.parse(name)
+		if not pkgname.uptodate and spec not in pkgname.provides:
+			pkgname.provides += (spec,)
+		self._index_provides(pkgname, name)
+
 	def _aur_search(self, field: str, query: str) -> list[SearchResult]:
 		resp = self._aur_query(
 			method='GET',
@@ -209,6 +439,81 @@ class AURPackageProvider(PackageProvider):
 			raise self.Error(f'Invalid response type: {resp}')
 		return resp.results
 
+	def _aur_search_cached(self, names: abc.Iterable[str]) -> abc.Iterator[tuple[str, list[SearchResult]]]:
+		"""
+		Search by provides for each of `names` in sorted order, answering from the metadata cache where possible.
+		Yields (name, results); in offline mode, names that are not cached are skipped.
+		"""
+		now = time.time()
+		names = sorted(names)
+		cached = {}
+		for name in names:
+			entry = self.metadata.provides.get(name)
+			if entry is not None and self._is_fresh(entry[0], now):
+				cached[name] = entry[1]
+		to_fetch = [] if self.offline else [ name for name in names if name not in cached ]
+		fetched = self._map(lambda name: self._aur_search(field='provides', query=name), to_fetch)
+
+		for name in names:
+			if name in cached:
+				yield name, cached[name]
+			elif not self.offline:
+				results = next(fetched)
+				self.metadata.provides[name] = (now, results)
+				self.metadata.dirty = True
+				yield name, results
+
+	def _aur_info_cached(
+		self,
+		pkgnames: abc.Iterable[str],
+		last_modified: Optional[abc.Mapping[str, int]] = None,
+	) -> abc.Iterator[list[InfoResult]]:
+		"""
+		Like `_aur_info_chunked()`, but answer from the metadata cache where possible. A cached result is used
+		if it is younger than the TTL, or if its LastModified matches `last_modified[name]` (e.g. as reported
+		by a fresh search). In offline mode, all cached results are used and nothing is fetched.
+		"""
+		if last_modified is None:
+			last_modified = {}
+		now = time.time()
+		cached = []
+		to_fetch = set()
+		for name in pkgnames:
+			entry = self.metadata.info.get(name)
+			if entry is not None:
+				fetched, result = entry
+				if self._is_fresh(fetched, now):
+					if result is not None:
+						cached.append(result)
+					continue
+				if result is not None and last_modified.get(name) == result.LastModified:
+					self.metadata.info[name] = (now, result)
+					self.metadata.dirty = True
+					cached.append(result)
+					continue
+			if not self.offline:
+				to_fetch.add(name)
+		if cached:
+			yield sorted(cached, key=lambda r: r.Name)
+
+		for results in self._aur_info_chunked(to_fetch):
+			for r in results:
+				self.metadata.info[r.Name] = (now, r)
+				to_fetch.discard(r.Name)
+			self.metadata.dirty = True
+			yield results
+		# remember names unknown to the RPC
+		for name in to_fetch:
+			self.metadata.info[name] = (now, None)
+			self.metadata.dirty = True
+
+	def _aur_info_chunked(self, pkgnames: abc.Iterable[str]) -> abc.Iterator[list[InfoResult]]:
+		"""
+		Like `_aur_info()`, but split `pkgnames` into requests of at most `self.info_chunk` names, dispatch
+		them concurrently and yield results of each request in order as they arrive.
+		"""
+		return self._map(self._aur_info, buildpy.util.batched(sorted(pkgnames), self.info_chunk))
+
 	def _aur_info(self, pkgnames: abc.Iterable[str]) -> list[InfoResult]:
 		resp = self._aur_query(
 			method='POST',
@@ -228,15 +533,16 @@ class AURPackageProvider(PackageProvider):
 	) -> Response:
 		resp = None
 		try:
-			resp = requests.request(
+			resp = self.session.request(
 				method=method,
 				url=self.base_url + url,
 				params=params,
 				data=data,
 				allow_redirects=False,
+				timeout=self.timeout,
 			)
 			resp.raise_for_status()
-			resp_obj: Response = BaseResponse.converter.structure(resp.json(), Response)
+			resp_obj = decode_response(resp.content)
 			if resp_obj.version != 5:
 				raise self.Error(f'Invalid response version', resp=resp)
 			if isinstance(resp_obj, ErrorResponse):
@@ -6,16 +6,35 @@ from typing import (
 from abc import ABC, abstractmethod
 
 if TYPE_CHECKING:
+	from collections import abc
 	from buildpy.context import AppContext
+	from buildpy.package import Pkgname
 
 
 class PackageProvider(ABC):
 	id: ClassVar[str]
+	# whether packages are installed as built binaries (with pacman handling their dependencies), as
+	# opposed to being built from source
+	binary: ClassVar[bool] = False
 
 	@abstractmethod
 	def __init__(self, _: 'AppContext'):
 		...
 
+	def load_packages(self, pkgnames: list[str]):
+		"""
+		Look up `pkgnames` (by name or by provides) and add whatever is found to the provider's indexes.
+		Providers that know all their packages upfront need not implement this.
+		"""
+		pass
+
+	def promote(self, pkgnames: 'abc.Iterable[Pkgname]'):
+		"""
+		Make sure that `pkgnames` found by this provider are fully loaded (i.e. `uptodate`), e.g. once they are
+		chosen to satisfy a dependency. Providers that never produce partial results need not implement this.
+		"""
+		pass
+
 	@classmethod
 	def get(cls, ctx: 'AppContext') -> Self:
 		return ctx.providers[cls]
@@ -25,42 +25,52 @@ class LocalPackageProvider(PackageProvider):
 
 	def load_pkgbuilds(self, pkgbuilds: list[PKGBUILD]):
 		for p in pkgbuilds:
-			pkgbase_section = p.srcinfo.sections[('pkgbase', p.pkgbase)]
-			assert len(p.pkgname) == 1 or 'provides' not in pkgbase_section
+			self.load_pkgbuild(p)
 
-			if 'epoch' in pkgbase_section:
-				version = f'{pkgbase_section["epoch"]}:{pkgbase_section["pkgver"]}-{pkgbase_section["pkgrel"]}'
-			else:
-				version = f'{pkgbase_section["pkgver"]}-{pkgbase_section["pkgrel"]}'
+	def load_pkgbuild(self, p: PKGBUILD) -> Pkgbase:
+		pkgbase_section = p.srcinfo.sections[('pkgbase', p.pkgbase)]
+		assert len(p.pkgname) == 1 or 'provides' not in pkgbase_section
 
-			pkgbase = Pkgbase(
-				pkgbase=p.pkgbase,
-				version=version,
-				pkgnames=[],
-				depends=pkgbase_section.get('depends', []),
-				optdepends=pkgbase_section.get('optdepends', []),
-				makedepends=pkgbase_section.get('makedepends', []),
-				provider=self,
+		if 'epoch' in pkgbase_section:
+			version = f'{pkgbase_section["epoch"]}:{pkgbase_section["pkgver"]}-{pkgbase_section["pkgrel"]}'
+		else:
+			version = f'{pkgbase_section["pkgver"]}-{pkgbase_section["pkgrel"]}'
+
+		pkgbase = Pkgbase(
+			pkgbase=p.pkgbase,
+			version=version,
+			pkgnames=[],
+			depends=pkgbase_section.get('depends', []),
+			optdepends=pkgbase_section.get('optdepends', []),
+			makedepends=pkgbase_section.get('makedepends', []),
+			provider=self,
+			uptodate=True,
+		)
+		for n in p.pkgname:
+			pkgname_section = p.srcinfo.sections[('pkgname', n)]
+
+			def get(key: str) -> list[str]:
+				# pkgname sections inherit values from pkgbase section unless overridden
+				return pkgname_section.get(key, pkgbase_section.get(key, []))
+
+			pkgname = Pkgname(
+				pkgbase=pkgbase,
+				pkgname=n,
+				depends=get('depends'),
+				optdepends=get('optdepends'),
+				makedepends=get('makedepends'),
+				provides=get('provides'),
 				uptodate=True,
 			)
-			for n in p.pkgname:
-				pkgname_section = p.srcinfo.sections[('pkgname', n)]
-				pkgname = Pkgname(
-					pkgbase=pkgbase,
-					pkgname=n,
-					depends=pkgname_section.get('depends', []),
-					optdepends=pkgname_section.get('depends', []),
-					makedepends=pkgname_section.get('makedepends', []),
-					provides=pkgname_section.get('provides', pkgbase_section.get('provides', [])),
-					uptodate=True,
-				)
-				pkgbase.pkgnames.append(pkgname)
+			pkgbase.pkgnames.append(pkgname)
 
-			self.pkgbases.append(pkgbase)
-			self.pkgnames.extend(pkgbase.pkgnames)
+		self.pkgbases.append(pkgbase)
+		self.pkgnames.extend(pkgbase.pkgnames)
 
 		# update lookup dictionaries
-		for pkgname in self.pkgnames:
+		for pkgname in pkgbase.pkgnames:
 			self.by_pkgname.setdefault(pkgname.pkgname, []).append(pkgname)
-			for name in pkgname.provides:
-				self.by_provides.setdefault(name, []).append(pkgname)
+			for spec in pkgname.provides:
+				self.by_provides.setdefault(spec.name, []).append(pkgname)
+
+		return pkgbase
@@ -1,4 +1,7 @@
+import fcntl
+import hashlib
 import tempfile
+import time
 from collections import abc
 from pathlib import Path
 import subprocess
@@ -17,6 +20,8 @@ import requests
 import buildpy.util
 from buildpy.config import Config, Auth
 from buildpy.package import Pkgbase, Pkgname
+from buildpy.syncdb import SyncDB, SyncRecord
+from buildpy.syncindex import RecordTable, SyncIndex
 from .base import PackageProvider
 if TYPE_CHECKING:
 	from buildpy.context import AppContext
@@ -24,34 +29,195 @@ if TYPE_CHECKING:
 attr.s, attr.ib = attrs.define, attrs.field
 
 
+class _IndexView(abc.Mapping[str, list[Pkgname]]):
+	"""
+	A read-only mapping over one of the tables of the provider's index that materialises `Pkgname`s on lookup.
+	"""
+	def __init__(self, provider: 'SyncPackageProvider', table: str):
+		self._provider = provider
+		self._table = table
+		self._results: dict[str, list[Pkgname]] = {}
+
+	def _get_table(self) -> Optional[RecordTable]:
+		index = self._provider._index
+		return getattr(index, self._table) if index is not None else None
+
+	def __getitem__(self, name: str) -> list[Pkgname]:
+		try:
+			return self._results[name]
+		except KeyError:
+			pass
+		table = self._get_table()
+		ids = table.get(name) if table is not None else None
+		if ids is None:
+			raise KeyError(name)
+		ret = self._results[name] = [ self._provider._materialize(i) for i in ids ]
+		return ret
+
+	def __contains__(self, name: object) -> bool:
+		table = self._get_table()
+		return table is not None and isinstance(name, str) and name in table
+
+	def __iter__(self) -> abc.Iterator[str]:
+		table = self._get_table()
+		return table.keys() if table is not None else iter(())
+
+	def __len__(self) -> int:
+		table = self._get_table()
+		return len(table) if table is not None else 0
+
+
 class SyncPackageProvider(PackageProvider):
 	id: ClassVar[str] = 'sync'
+	binary: ClassVar[bool] = True
 	work_dir: Path
 	db_dir: Path
 	pacman_conf: Path
+	# repositories in order of precedence
+	repos: list[str]
+	_conf_text: str
+	# packages materialised so far, keyed by (repo, pkgbase) and (repo, pkgname)
+	pkgbases: dict[tuple[str, str], Pkgbase]
+	pkgnames: dict[tuple[str, str], Pkgname]
+	# views of the index; candidates are listed in the order of repository precedence
+	by_pkgname: abc.Mapping[str, list[Pkgname]]
+	by_provides: abc.Mapping[str, list[Pkgname]]
+	_index: Optional[SyncIndex]
+	# materialised packages by index record number, and the other way around
+	_records: dict[int, Pkgname]
+	_record_ids: dict[Pkgname, int]
+	_config: Config
 	_uptodate: bool
+	_loaded: bool
 
 	def __init__(self, ctx: 'AppContext', without_custom=True):
-		self.work_dir = Path(ctx.tmpdir('SyncPackageProvider').name)
-
-		self.db_dir = self.work_dir/'db'
-		self.db_dir.mkdir()
+		self._index = None
+		self._reset()
+		self._config = ctx.config
 
 		if without_custom:
-			self.pacman_conf = buildpy.util.pacman_conf_remove_repo(
-				dir=self.work_dir,
+			conf_text = buildpy.util.pacman_conf_without_repos(
 				pacman_conf=ctx.config.pacman_conf,
 				repos=[ctx.config.repo_name],
 			)
 		else:
-			self.pacman_conf = ctx.config.pacman_conf
+			conf_text = ctx.config.pacman_conf.read_text()
+
+		# databases are kept across runs, so that `pacman -Sy` only fetches those that changed
+		conf_hash = hashlib.sha256(conf_text.encode()).hexdigest()
+		self.work_dir = ctx.config.sync_root/conf_hash[:16]
+		self.db_dir = self.work_dir/'db'
+		self.pacman_conf = self.work_dir/'pacman.conf'
+		self.repos = buildpy.util.pacman_conf_repos(conf_text)
+		self._conf_text = conf_text
 
 		self._uptodate = False
+		self._loaded = False
+
+	def _prepare(self):
+		self.db_dir.mkdir(parents=True, exist_ok=True)
+		try:
+			unchanged = self.pacman_conf.read_text() == self._conf_text
+		except FileNotFoundError:
+			unchanged = False
+		if not unchanged:
+			with buildpy.util.atomic_open(self.pacman_conf) as f:
+				f.write(self._conf_text)
 
-	def update(self, config: Config):
-		if self._uptodate:
+	def _is_fresh(self, config: Config) -> bool:
+		try:
+			st = (self.work_dir/'last-update').stat()
+		except FileNotFoundError:
+			return False
+		return time.time() - st.st_mtime < config.sync_refresh_interval
+
+	def update(self, config: Config, force: bool = False):
+		if self._uptodate and not force:
 			return
-		self.run_pacman([ '-Sy' ], auth=Auth.Fake, config=config)
+		self._prepare()
+		# serialize refreshes of the same dbpath by concurrent runs
+		with open(self.work_dir/'lock', 'w') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			if force or not self._is_fresh(config):
+				self.run_pacman([ '-Sy' ], auth=Auth.Fake, config=config)
+				(self.work_dir/'last-update').touch()
+		self._uptodate = True
+
+	def load_packages(self, pkgnames: list[str]):
+		# sync databases are loaded as a whole, afterwards all lookups are dict hits
+		if not self._loaded:
+			self.update(self._config)
+			self.load_dbs()
+
+	def dbs(self) -> list[SyncDB]:
+		"""
+		Sync databases present in `db_dir`, in order of repository precedence.
+		"""
+		return [
+			SyncDB(repo=repo, path=path)
+			for repo in self.repos
+			if (path := self.db_dir/'sync'/f'{repo}.db').exists()
+		]
+
+	def load_dbs(self):
+		"""
+		Map the index of all sync databases in `db_dir` (in order of repository precedence), rebuilding it
+		if the databases changed. Packages are materialised when they are looked up.
+		"""
+		self._index = SyncIndex.load(self.work_dir/'index', self.dbs())
+		self._reset()
+		self._loaded = True
+
+	def _reset(self):
+		self.pkgbases = dict()
+		self.pkgnames = dict()
+		self.by_pkgname = _IndexView(self, 'pkgnames')
+		self.by_provides = _IndexView(self, 'provides')
+		self._records = dict()
+		self._record_ids = dict()
+
+	def _materialize(self, i: int) -> Pkgname:
+		try:
+			return self._records[i]
+		except KeyError:
+			pass
+		ret = self._records[i] = self._load_record(self._index.record(i))
+		self._record_ids[ret] = i
+		return ret
+
+	def record(self, pkgname: Pkgname) -> SyncRecord:
+		"""
+		The database entry that `pkgname` (as looked up from this provider) was created from, e.g. for its sizes.
+		"""
+		return self._index.record(self._record_ids[pkgname])
+
+	def _load_record(self, arg: SyncRecord) -> Pkgname:
+		pkgbase = self.pkgbases.get((arg.repo, arg.base))
+		if pkgbase is None:
+			pkgbase = Pkgbase(
+				pkgbase=arg.base,
+				version=arg.version,
+				pkgnames=[],
+				depends=[],
+				makedepends=[],
+				optdepends=[],
+				provider=self,
+				uptodate=True,
+			)
+			self.pkgbases[(arg.repo, arg.base)] = pkgbase
+
+		pkgname = Pkgname(
+			pkgbase=pkgbase,
+			pkgname=arg.name,
+			depends=arg.depends,
+			makedepends=arg.makedepends,
+			optdepends=arg.optdepends,
+			provides=arg.provides,
+			uptodate=True,
+		)
+		pkgbase.pkgnames.append(pkgname)
+		self.pkgnames[(arg.repo, arg.name)] = pkgname
+		return pkgname
 
 	def _pacman_args(self, args: list[str], *, auth: Auth, config: Config) -> list[str]:
 		cmdline: list[str] = [ 'pacman' ]
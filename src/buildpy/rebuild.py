@@ -0,0 +1,95 @@
+import urllib.parse
+from pathlib import Path
+from typing import (
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+import buildpy.util
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.package import Pkgbase
+from buildpy.provider import LocalPackageProvider
+from buildpy.resolve import local_dependencies
+from buildpy.syncdb import SyncDB
+from buildpy.vercmp import vercmp
+
+
+@attr.s
+class RepoDB:
+	"""
+	Versions of the pkgbases published in the custom repository, read from its database in-process.
+	"""
+	class Error(RuntimeError):
+		pass
+
+	repo: str
+	path: Path
+	# pkgbase -> version
+	versions: dict[str, str] = attr.ib(factory=dict)
+
+	@staticmethod
+	def path_from_config(config: Config) -> Path:
+		if config.repo_db is not None:
+			return config.repo_db
+		servers = buildpy.util.pacman_conf_servers(config.pacman_conf.read_text(), config.repo_name)
+		for server in servers:
+			url = urllib.parse.urlsplit(server)
+			if url.scheme == 'file':
+				return Path(urllib.parse.unquote(url.path))/f'{config.repo_name}.db'
+		raise RepoDB.Error(f'no local (file://) Server for [{config.repo_name}] in {config.pacman_conf}')
+
+	@classmethod
+	def from_config(cls, config: Config) -> Self:
+		return cls.load(config.repo_name, cls.path_from_config(config))
+
+	@classmethod
+	def load(cls, repo: str, path: Path) -> Self:
+		"""
+		Read the database at `path`. A missing database is an empty repository.
+		"""
+		ret = cls(repo=repo, path=path)
+		if not path.exists():
+			return ret
+		for r in SyncDB(repo=repo, path=path).records():
+			# pkgnames of a pkgbase normally have the same version; after a partial update, the oldest one counts
+			v = ret.versions.get(r.base)
+			if v is None or vercmp(r.version, v) < 0:
+				ret.versions[r.base] = r.version
+		return ret
+
+
+def needs_rebuild(ctx: AppContext, repo: RepoDB) -> dict[Pkgbase, str]:
+	"""
+	Local pkgbases that need to be built, with the reason: those that are not published in `repo` or whose
+	version is newer than the published one, and (transitively) those depending on any of these. Only local
+	dependencies are considered, so this neither runs pacman nor queries the AUR.
+
+	The result is ordered as the local provider's pkgbases.
+	"""
+	local = LocalPackageProvider.get(ctx)
+
+	reasons: dict[Pkgbase, str] = {}
+	for pkgbase in local.pkgbases:
+		published = repo.versions.get(pkgbase.pkgbase)
+		if published is None:
+			reasons[pkgbase] = 'not in repository'
+		elif vercmp(pkgbase.version, published) > 0:
+			reasons[pkgbase] = f'{published} -> {pkgbase.version}'
+
+	rdeps: dict[Pkgbase, list[Pkgbase]] = {}
+	for pkgbase, deps in local_dependencies(local).items():
+		for dep in deps:
+			rdeps.setdefault(dep, []).append(pkgbase)
+
+	queue = list(reasons)
+	while queue:
+		dep = queue.pop(0)
+		for pkgbase in rdeps.get(dep, []):
+			if pkgbase not in reasons:
+				reasons[pkgbase] = f'depends on {dep.pkgbase}'
+				queue.append(pkgbase)
+
+	return { p: reasons[p] for p in local.pkgbases if p in reasons }
@@ -0,0 +1,188 @@
+import itertools
+from collections import abc
+from typing import (
+	ClassVar,
+	NamedTuple,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+from buildpy.context import AppContext
+from buildpy.package import DepSpec, Pkgbase, Pkgname
+from buildpy.provider import LocalPackageProvider, PackageProvider
+
+
+def satisfies(pkgname: Pkgname, spec: DepSpec) -> bool:
+	"""
+	Whether `pkgname` satisfies the dependency `spec`, by name or by provides. As in pacman, an unversioned
+	provision does not satisfy a versioned dependency.
+	"""
+	if pkgname.pkgname == spec.name and spec.satisfied_by(pkgname.pkgbase.version):
+		return True
+	for p in pkgname.provides:
+		if p.name == spec.name and (not spec.op or p.op == '=' and spec.satisfied_by(p.version)):
+			return True
+	return False
+
+
+class Requirement(NamedTuple):
+	kind: str
+	spec: DepSpec
+
+
+@attr.s(eq=False)
+class DepGraph:
+	"""
+	Dependencies of all local pkgbases, resolved across providers in order of precedence (`config.resolve_providers`).
+
+	Packages that are built from source (local and AUR) are nodes of the graph, and their dependencies are
+	resolved in turn. Binary packages (sync) are leaves: pacman takes care of their dependencies.
+	"""
+	KINDS: ClassVar[tuple[str, ...]] = ('depends', 'makedepends')
+
+	providers: list[PackageProvider]
+	# pkgbases to build -> their requirements
+	requires: dict[Pkgbase, list[Requirement]] = attr.ib(factory=dict)
+	# dependency -> chosen package, or None if no provider has it
+	resolved: dict[DepSpec, Optional[Pkgname]] = attr.ib(factory=dict)
+	# number of provider lookups, per provider id
+	lookups: dict[str, int] = attr.ib(factory=dict)
+	_nr_local: int = 0
+
+	@classmethod
+	def get(cls, ctx: AppContext) -> Self:
+		"""
+		The dependency graph of `ctx`, built once and rebuilt only if more local pkgbases were loaded since.
+		"""
+		local = LocalPackageProvider.get(ctx)
+		graph = ctx.depgraph
+		if graph is None or graph._nr_local != len(local.pkgbases):
+			graph = ctx.depgraph = cls.build(ctx)
+		return graph
+
+	@classmethod
+	def build(cls, ctx: AppContext) -> Self:
+		by_id = { p.id: p for p in ctx.providers.values() }
+		local = LocalPackageProvider.get(ctx)
+		graph = cls(providers=[ by_id[i] for i in ctx.config.resolve_providers if i in by_id ])
+		graph._nr_local = len(local.pkgbases)
+
+		# resolve breadth-first, one batch of new dependencies per round
+		pkgbases = list(local.pkgbases)
+		while pkgbases:
+			specs = graph._add_pkgbases(pkgbases)
+			pkgbases = [
+				p.pkgbase
+				for p in graph._resolve(specs)
+				if not p.pkgbase.provider.binary and p.pkgbase not in graph.requires
+			]
+			# split packages: several pkgnames of the same pkgbase may have been chosen
+			pkgbases = list(dict.fromkeys(pkgbases))
+		return graph
+
+	def _add_pkgbases(self, pkgbases: abc.Iterable[Pkgbase]) -> list[DepSpec]:
+		"""
+		Add `pkgbases` as nodes and return their requirements that were not resolved before.
+		"""
+		new = {}
+		for pkgbase in pkgbases:
+			requires = []
+			for kind in self.KINDS:
+				specs = itertools.chain(getattr(pkgbase, kind), *( getattr(p, kind) for p in pkgbase.pkgnames ))
+				for spec in dict.fromkeys(specs):
+					requires.append(Requirement(kind, spec))
+					if spec not in self.resolved:
+						new[spec] = None
+			self.requires[pkgbase] = requires
+		return list(new)
+
+	def _resolve(self, specs: list[DepSpec]) -> list[Pkgname]:
+		"""
+		Resolve `specs`, asking each provider (in order of precedence) at most once for the remaining ones.
+		Returns the chosen packages.
+		"""
+		chosen = []
+		pending = specs
+		for provider in self.providers:
+			if not pending:
+				break
+			provider.load_packages(list(dict.fromkeys(s.name for s in pending)))
+			self.lookups[provider.id] = self.lookups.get(provider.id, 0) + 1
+
+			# partially loaded candidates cannot be checked against version constraints
+			provider.promote([
+				p for s in pending if s.op for p in self._candidates(provider, s.name) if not p.uptodate
+			])
+			found = {}
+			for s in pending:
+				for p in self._candidates(provider, s.name):
+					if satisfies(p, s):
+						found[s] = p
+						break
+			provider.promote(found.values())
+
+			self.resolved.update(found)
+			chosen.extend(found.values())
+			pending = [ s for s in pending if s not in found ]
+
+		for s in pending:
+			self.resolved[s] = None
+		return chosen
+
+	@staticmethod
+	def _candidates(provider: PackageProvider, name: str) -> list[Pkgname]:
+		# packages by name come first
+		return provider.by_pkgname.get(name, []) + provider.by_provides.get(name, [])
+
+	@property
+	def pkgbases(self) -> list[Pkgbase]:
+		return list(self.requires)
+
+	def dependencies(self, pkgbase: Pkgbase, kinds: abc.Iterable[str] = KINDS) -> list[Pkgbase]:
+		"""
+		Pkgbases in the graph that must be built before `pkgbase`, i.e. that satisfy its requirements of `kinds`.
+		"""
+		kinds = set(kinds)
+		ret = {}
+		for r in self.requires[pkgbase]:
+			if r.kind not in kinds:
+				continue
+			p = self.resolved[r.spec]
+			if p is not None and p.pkgbase is not pkgbase and p.pkgbase in self.requires:
+				ret[p.pkgbase] = None
+		return list(ret)
+
+	def unresolved(self) -> dict[DepSpec, list[Pkgbase]]:
+		"""
+		Dependencies that no provider has, with the pkgbases requiring them.
+		"""
+		ret = {}
+		for pkgbase, requires in self.requires.items():
+			for r in requires:
+				if self.resolved[r.spec] is None:
+					ret.setdefault(r.spec, []).append(pkgbase)
+		return ret
+
+
+def local_dependencies(local: LocalPackageProvider, kinds: abc.Iterable[str] = DepGraph.KINDS) \
+		-> dict[Pkgbase, list[Pkgbase]]:
+	"""
+	For each local pkgbase, the other local pkgbases that satisfy its requirements of `kinds`. Unlike `DepGraph`,
+	this only looks at the local provider: no other provider is asked (and nothing is fetched).
+	"""
+	kinds = tuple(kinds)
+	ret = {}
+	for pkgbase in local.pkgbases:
+		deps = {}
+		for kind in kinds:
+			for spec in itertools.chain(getattr(pkgbase, kind), *( getattr(p, kind) for p in pkgbase.pkgnames )):
+				for p in DepGraph._candidates(local, spec.name):
+					if satisfies(p, spec):
+						if p.pkgbase is not pkgbase:
+							deps[p.pkgbase] = None
+						break
+		ret[pkgbase] = list(deps)
+	return ret
@@ -0,0 +1,157 @@
+import concurrent.futures
+import hashlib
+import os
+import time
+from collections import abc
+from pathlib import Path
+from typing import (
+	ClassVar,
+	NamedTuple,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+from buildpy.cache import Cache
+from buildpy.config import Config
+
+
+class DirRecord(NamedTuple):
+	mtime_ns: int
+	# path of the PKGBUILD relative to this directory, if this is a package root
+	pkgbuild: Optional[str]
+	# mtime of the directory containing the PKGBUILD, if it is not this directory (asp-style `trunk/`)
+	pkgbuild_dir_mtime_ns: Optional[int]
+	# subdirectories to descend into, if this is not a package root
+	subdirs: tuple[str, ...]
+
+
+@attr.s
+class ScanIndex:
+	"""
+	Persistent index of the pkgbuild tree: for each visited directory, remembers its mtime and whether it is
+	a package root (and where its PKGBUILD is) or which subdirectories to descend into.
+
+	A directory's mtime changes whenever entries are added to, removed from or renamed in it, so a directory
+	whose mtime did not change since the last scan does not need to be listed again.
+	"""
+	# bump when the layout of DirRecord changes to invalidate cached entries
+	CACHE_VERSION: ClassVar[int] = 1
+	# directories modified within this interval before the scan are not trusted
+	# (the modification might have happened within the same mtime granule after the scan)
+	RACY_INTERVAL_NS: ClassVar[int] = 2_000_000_000
+
+	root: Path
+	prune: frozenset[str]
+	# directory records by path relative to `root`
+	records: dict[str, DirRecord] = attr.ib(factory=dict)
+	# records collected during the current scan (this drops records of directories that are gone)
+	_new_records: dict[str, DirRecord] = attr.ib(factory=dict)
+	_racy_ns: int = 0
+
+	@staticmethod
+	def _cache_key(config: Config) -> str:
+		h = hashlib.sha256(str(config.pkgbuild_root).encode())
+		for p in sorted(config.scan_prune):
+			h.update(b'\0' + p.encode())
+		return f'{h.hexdigest()}-v{ScanIndex.CACHE_VERSION}'
+
+	@classmethod
+	def load(cls, config: Config) -> Self:
+		if config.scan_index:
+			records = Cache.from_config(config, 'scan').get(cls._cache_key(config), default={})
+		else:
+			records = {}
+		return cls(
+			root=config.pkgbuild_root,
+			prune=frozenset(config.scan_prune),
+			records=records,
+		)
+
+	def save(self, config: Config):
+		if config.scan_index:
+			Cache.from_config(config, 'scan').put(self._cache_key(config), self.records)
+
+	def _read_dir(self, path: str, st: os.stat_result) -> DirRecord:
+		subdirs = []
+		trunk = None
+		with os.scandir(path) as it:
+			for e in it:
+				# 1. trivial case: if PKGBUILD exists -> load it
+				if e.name == 'PKGBUILD' and not e.is_dir():
+					return DirRecord(st.st_mtime_ns, 'PKGBUILD', None, ())
+				if e.is_dir():
+					if e.name == 'trunk':
+						trunk = e
+					if not e.is_symlink() and e.name not in self.prune:
+						subdirs.append(e.name)
+
+		# 2. asp-style checkouts: if trunk/PKGBUILD exists -> load it and do not traverse further
+		if trunk is not None:
+			trunk_st = os.stat(trunk.path)
+			if os.path.isfile(os.path.join(trunk.path, 'PKGBUILD')):
+				return DirRecord(st.st_mtime_ns, os.path.join('trunk', 'PKGBUILD'), trunk_st.st_mtime_ns, ())
+
+		# 3. TODO: per-pkgbase config: if exists -> load indicated PKGBUILD, do not traverse further
+		# 4. TODO: multiple pkgbase per git repo: remember and save git dir
+		return DirRecord(st.st_mtime_ns, None, None, tuple(sorted(subdirs)))
+
+	def _is_fresh(self, path: str, st: os.stat_result, rec: Optional[DirRecord]) -> bool:
+		if rec is None or rec.mtime_ns != st.st_mtime_ns:
+			return False
+		if rec.pkgbuild_dir_mtime_ns is not None:
+			try:
+				pkgbuild_dir_st = os.stat(os.path.join(path, os.path.dirname(rec.pkgbuild)))
+			except FileNotFoundError:
+				return False
+			if rec.pkgbuild_dir_mtime_ns != pkgbuild_dir_st.st_mtime_ns:
+				return False
+		return True
+
+	def _is_racy(self, rec: DirRecord) -> bool:
+		return (rec.mtime_ns >= self._racy_ns
+		        or (rec.pkgbuild_dir_mtime_ns is not None and rec.pkgbuild_dir_mtime_ns >= self._racy_ns))
+
+	def _visit_dir(self, rel: str) -> DirRecord:
+		path = os.path.join(self.root, rel)
+		st = os.stat(path)
+		rec = self.records.get(rel)
+		if not self._is_fresh(path, st, rec):
+			rec = self._read_dir(path, st)
+		if not self._is_racy(rec):
+			self._new_records[rel] = rec
+		return rec
+
+	def _scan_dir(self, rel: str) -> abc.Iterator[tuple[Path, Path]]:
+		return self._scan_record(rel, self._visit_dir(rel))
+
+	def _scan_record(self, rel: str, rec: DirRecord) -> abc.Iterator[tuple[Path, Path]]:
+		if rec.pkgbuild is not None:
+			path = Path(self.root, rel)
+			yield path, path/rec.pkgbuild
+		else:
+			for d in rec.subdirs:
+				yield from self._scan_dir(os.path.join(rel, d))
+
+	def scan(self, jobs: int = 1) -> abc.Iterator[tuple[Path, Path]]:
+		"""
+		Walk the tree, yielding (base_dir, pkgbuild_file) for each package root, and update the index.
+
+		Subtrees of top-level directories are walked by up to `jobs` threads concurrently; results are yielded
+		in a deterministic order as soon as they are available.
+		"""
+		self._new_records = {}
+		self._racy_ns = time.time_ns() - self.RACY_INTERVAL_NS
+
+		rec = self._visit_dir('')
+		if rec.pkgbuild is not None or jobs <= 1 or len(rec.subdirs) <= 1:
+			yield from self._scan_record('', rec)
+		else:
+			with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='scan') as pool:
+				# map() submits everything at once but yields in the order of submission
+				for results in pool.map(lambda d: list(self._scan_dir(d)), rec.subdirs):
+					yield from results
+
+		self.records = self._new_records
@@ -0,0 +1,215 @@
+import concurrent.futures
+import enum
+import heapq
+import itertools
+import time
+from collections import abc
+from typing import (
+	Any,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+
+class JobState(enum.Enum):
+	Pending = enum.auto()
+	Running = enum.auto()
+	Done = enum.auto()
+	Failed = enum.auto()
+	# a dependency failed
+	Skipped = enum.auto()
+
+
+@attr.s(eq=False)
+class BuildJob:
+	name: str
+	# the object passed to the build function (e.g. a PKGBUILD)
+	target: Any
+	deps: 'list[BuildJob]' = attr.ib(factory=list)
+	# estimated duration (any unit), used to find the critical path
+	cost: float = 1.0
+	cpus: int = 1
+	memory: int = 0
+
+	rdeps: 'list[BuildJob]' = attr.ib(factory=list)
+	# length of the longest chain of jobs starting with this one, including its own cost
+	priority: float = 0.0
+	state: JobState = JobState.Pending
+	error: Optional[BaseException] = None
+	duration: Optional[float] = None
+
+	def __repr__(self):
+		return f'BuildJob({self.name!r})'
+
+
+@attr.s
+class BuildScheduler:
+	"""
+	Runs jobs in topological order of their dependencies, starting independent jobs concurrently as long as
+	they fit into the CPU and memory budget. Among ready jobs, those on the longest remaining (critical) path
+	go first; smaller ones fill in whatever budget is left.
+
+	Dependency cycles are reported when the scheduler is created, before anything runs.
+	"""
+	class Error(RuntimeError):
+		def __init__(self, cycles: list[list[BuildJob]], *args):
+			self.cycles = cycles
+			super().__init__(*args)
+
+	jobs: list[BuildJob]
+	cpus: int
+	# bytes, or None for no limit
+	memory: Optional[int] = None
+
+	def __attrs_post_init__(self):
+		for job in self.jobs:
+			job.rdeps = []
+		for job in self.jobs:
+			for dep in job.deps:
+				dep.rdeps.append(job)
+
+		order = self._toposort()
+		if len(order) != len(self.jobs):
+			cycles = self.cycles()
+			desc = '; '.join(' -> '.join(j.name for j in c + c[:1]) for c in cycles)
+			raise self.Error(cycles, f'dependency cycles: {desc}')
+
+		for job in reversed(order):
+			job.priority = job.cost + max(( r.priority for r in job.rdeps ), default=0.0)
+
+	def _toposort(self) -> list[BuildJob]:
+		remaining = { job: len(job.deps) for job in self.jobs }
+		ready = [ job for job in self.jobs if not job.deps ]
+		order = []
+		while ready:
+			job = ready.pop()
+			order.append(job)
+			for r in job.rdeps:
+				remaining[r] -= 1
+				if not remaining[r]:
+					ready.append(r)
+		return order
+
+	def cycles(self) -> list[list[BuildJob]]:
+		"""
+		Strongly connected components with more than one job (Tarjan's algorithm, iterative).
+		"""
+		index: dict[BuildJob, int] = {}
+		lowlink: dict[BuildJob, int] = {}
+		stack: list[BuildJob] = []
+		on_stack: set[BuildJob] = set()
+		ret = []
+		counter = itertools.count()
+
+		for root in self.jobs:
+			if root in index:
+				continue
+			work = [ (root, iter(root.deps)) ]
+			index[root] = lowlink[root] = next(counter)
+			stack.append(root)
+			on_stack.add(root)
+			while work:
+				job, deps = work[-1]
+				for dep in deps:
+					if dep not in index:
+						index[dep] = lowlink[dep] = next(counter)
+						stack.append(dep)
+						on_stack.add(dep)
+						work.append((dep, iter(dep.deps)))
+						break
+					if dep in on_stack:
+						lowlink[job] = min(lowlink[job], index[dep])
+				else:
+					work.pop()
+					if work:
+						parent = work[-1][0]
+						lowlink[parent] = min(lowlink[parent], lowlink[job])
+					if lowlink[job] == index[job]:
+						component = []
+						while True:
+							j = stack.pop()
+							on_stack.discard(j)
+							component.append(j)
+							if j is job:
+								break
+						if len(component) > 1:
+							ret.append(component[::-1])
+		return ret
+
+	def _fits(self, job: BuildJob, cpus: int, memory: int, running: int) -> bool:
+		# a job larger than the whole budget runs alone
+		if not running:
+			return True
+		if cpus + job.cpus > self.cpus:
+			return False
+		return self.memory is None or memory + job.memory <= self.memory
+
+	def run(self, build: abc.Callable[[BuildJob], None]) -> Self:
+		"""
+		Call `build(job)` for each job, from a pool of threads. A job whose build raises is marked as failed
+		and all jobs depending on it (transitively) are skipped; independent jobs keep going.
+		"""
+		remaining = { job: len(job.deps) for job in self.jobs }
+		seq = itertools.count()
+		ready = [ (-job.priority, next(seq), job) for job in self.jobs if not job.deps ]
+		heapq.heapify(ready)
+		running: dict[concurrent.futures.Future, BuildJob] = {}
+		cpus, memory = 0, 0
+
+		def timed(job: BuildJob):
+			start = time.monotonic()
+			try:
+				build(job)
+			finally:
+				job.duration = time.monotonic() - start
+
+		def skip(job: BuildJob):
+			for r in job.rdeps:
+				if r.state is JobState.Pending:
+					r.state = JobState.Skipped
+					skip(r)
+
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(self.cpus, 1),
+		                                           thread_name_prefix='build') as pool:
+			while ready or running:
+				deferred = []
+				while ready:
+					item = heapq.heappop(ready)
+					job = item[2]
+					if not self._fits(job, cpus, memory, len(running)):
+						deferred.append(item)
+						continue
+					job.state = JobState.Running
+					cpus += job.cpus
+					memory += job.memory
+					running[pool.submit(timed, job)] = job
+				for item in deferred:
+					heapq.heappush(ready, item)
+
+				done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+				for f in done:
+					job = running.pop(f)
+					cpus -= job.cpus
+					memory -= job.memory
+					if (e := f.exception()) is not None:
+						job.state = JobState.Failed
+						job.error = e
+						skip(job)
+						continue
+					job.state = JobState.Done
+					for r in job.rdeps:
+						remaining[r] -= 1
+						if not remaining[r] and r.state is JobState.Pending:
+							heapq.heappush(ready, (-r.priority, next(seq), r))
+		return self
+
+	@property
+	def failed(self) -> list[BuildJob]:
+		return [ job for job in self.jobs if job.state is JobState.Failed ]
+
+	@property
+	def skipped(self) -> list[BuildJob]:
+		return [ job for job in self.jobs if job.state is JobState.Skipped ]
@@ -1,9 +1,14 @@
 import collections
+import contextlib
+import enum
 import typing
 from collections import abc
+from pathlib import Path
 import re
 from typing import (
 	TYPE_CHECKING,
+	ClassVar,
+	Optional,
 	TypeAlias,
 	Self,
 )
@@ -11,8 +16,10 @@ from typing import (
 import attr, attrs
 attr.s, attr.ib = attrs.define, attrs.field
 
+import buildpy.util
 from buildpy.config import Config
 if TYPE_CHECKING:
+	from buildpy.cache import Cache
 	from buildpy.pkgbuild import PKGBUILD
 
 
@@ -23,6 +30,68 @@ SrcinfoValue: TypeAlias = str|list[str]
 SrcinfoSection: TypeAlias = dict[SrcinfoKey, SrcinfoValue]
 
 
+class _Kind(enum.Enum):
+	# section headers
+	Section = enum.auto()
+	# single-valued keys only allowed in pkgbase section
+	Pkgbase = enum.auto()
+	# single-valued keys
+	Single = enum.auto()
+	# list-valued keys, including arch-specific ones without arch suffix
+	List = enum.auto()
+	# anything else, possibly an arch-specific key with an arch suffix
+	ArchSuffixed = enum.auto()
+
+
+_ARCH_KEYS = frozenset((
+	'source',
+	'depends',
+	'checkdepends',
+	'makedepends',
+	'optdepends',
+	'provides',
+	'conflicts',
+	'replaces',
+	'md5sums',
+	'sha1sums',
+	'sha224sums',
+	'sha256sums',
+	'sha384sums',
+	'sha512sums',
+	'b2sums',
+))
+
+_KEY_KINDS: dict[str, _Kind] = {
+	**dict.fromkeys((
+		'pkgbase',
+		'pkgname',
+	), _Kind.Section),
+	**dict.fromkeys((
+		'pkgver',
+		'pkgrel',
+		'epoch',
+	), _Kind.Pkgbase),
+	**dict.fromkeys((
+		'pkgdesc',
+		'url',
+		'install',
+		'changelog',
+	), _Kind.Single),
+	**dict.fromkeys((
+		'arch',
+		'groups',
+		'license',
+		'noextract',
+		'options',
+		'backup',
+		'validpgpkeys',
+	), _Kind.List),
+	**dict.fromkeys(_ARCH_KEYS, _Kind.List),
+}
+
+_KEY_RE = re.compile(r'[a-zA-Z0-9_]+')
+
+
 @attr.s
 class SRCINFO:
 	# section of section headers
@@ -30,50 +99,11 @@ class SRCINFO:
 	# contents of actual sections
 	sections: dict[SrcinfoSectionHeader, SrcinfoSection]
 
+	# bump when the layout of parsed data changes to invalidate cached entries
+	CACHE_VERSION: ClassVar[int] = 1
+
 	@classmethod
 	def from_lines(cls, srcinfo_lines: abc.Iterable[str], pkgbuild: 'PKGBUILD') -> Self:
-		section_keys = (
-			'pkgbase',
-			'pkgname',
-		)
-		pkgbase_keys = (
-			'pkgver',
-			'pkgrel',
-			'epoch',
-		)
-		single_keys = (
-			'pkgdesc',
-			'url',
-			'install',
-			'changelog',
-		)
-		list_keys = (
-			'arch',
-			'groups',
-			'license',
-			'noextract',
-			'options',
-			'backup',
-			'validpgpkeys',
-		)
-		arch_keys = (
-			'source',
-			'depends',
-			'checkdepends',
-			'makedepends',
-			'optdepends',
-			'provides',
-			'conflicts',
-			'replaces',
-			'md5sums',
-			'sha1sums',
-			'sha224sums',
-			'sha256sums',
-			'sha384sums',
-			'sha512sums',
-			'b2sums',
-		)
-
 		# section of section headers
 		headers: SrcinfoSection = dict()
 		# contents of sections
@@ -82,6 +112,9 @@ class SRCINFO:
 		pkgbase_section: SrcinfoSection = None
 		cur_header: SrcinfoSectionHeader = None
 		cur_section: SrcinfoSection = None
+		# arch sets of sections, by id(section)
+		# (invalidated on any change to an `arch` key)
+		arch_cache: dict[int, frozenset[str]] = dict()
 
 		def get_value(section: SrcinfoSection, key: SrcinfoKey):
 			try:
@@ -89,6 +122,13 @@ class SRCINFO:
 			except KeyError:
 				return pkgbase_section[key]
 
+		def get_arch(section: SrcinfoSection) -> frozenset[str]:
+			try:
+				return arch_cache[id(section)]
+			except KeyError:
+				r = arch_cache[id(section)] = frozenset(get_value(section, 'arch'))
+				return r
+
 		def set_list_value(section: SrcinfoSection, key: SrcinfoKey, value: SrcinfoValue):
 			# special case: single empty list item overrides pkgbase-level list
 			# with an empty one
@@ -97,70 +137,103 @@ class SRCINFO:
 			else:
 				section.setdefault(key, list()).append(value)
 
+		key_match = _KEY_RE.fullmatch
+		key_kinds = _KEY_KINDS
+		arch_keys = _ARCH_KEYS
+
 		for line in srcinfo_lines:
-			# skip comments
-			if re.match(r'^\s*(#|$)', line):
-				pass
-			elif m := re.fullmatch(r'\s*([a-zA-Z0-9_]+)\s*=\s*(.*)', line):
-				key, value = m.group(1), m.group(2)
-				assert key.strip() == key
-				assert value.strip() == value
-
-				if key in section_keys:
-					cur_header = SrcinfoSectionHeader(key, value)
-					if cur_header in sections:
-						pkgbuild.r4ise(f'bad .SRCINFO: duplicate section {cur_header}')
-					cur_section = sections[cur_header] = dict()
-
-					if key == 'pkgbase':
-						if pkgbase_header is not None:
-							pkgbuild.r4ise(f'bad .SRCINFO: multiple pkgbase sections: {pkgbase_header} and {cur_header}')
-						pkgbase_header, pkgbase_section = cur_header, cur_section
-
-					# save section header as a key
-					if key == 'pkgbase':
-						headers[key] = value
-					else:
-						set_list_value(headers, key, value)
+			# equivalent to fullmatch(r'\s*([a-zA-Z0-9_]+)\s*=\s*(.*)', line)
+			key, sep, value = line.partition('=')
+			key = key.strip()
+			value = value.lstrip()
+			kind = key_kinds.get(key) if sep else None
+			if kind is None:
+				if sep and '\n' not in value and key_match(key):
+					kind = _Kind.ArchSuffixed
 				else:
-					if cur_header is None or cur_section is None:
-						pkgbuild.r4ise(f'bad .SRCINFO: non-section key {key} before any section')
-					if key in pkgbase_keys and cur_header.type != 'pkgbase':
-						pkgbuild.r4ise(f'bad .SRCINFO: pkgbase-only key {key} in section {cur_header}')
-
-					if key in pkgbase_keys or key in single_keys:
-						if key in cur_section:
-							pkgbuild.r4ise(f'bad .SRCINFO: non-unique key {key} in section {cur_header}')
-						cur_section[key] = value
-					elif key in list_keys or key in arch_keys:
-						set_list_value(cur_section, key, value)
-					elif ((arch_key := key.split('_', maxsplit=1))
-					      and len(arch_key) == 2
-					      and arch_key[0] in arch_keys
-					      and arch_key[1] in get_value(cur_section, 'arch')):
-						# FIXME: per-arch key handling
-						set_list_value(cur_section, key, value)
-					else:
-						pkgbuild.r4ise(f'bad .SRCINFO: unknown key {key}')
-			else:
+					# skip comments
+					stripped = line.lstrip()
+					if not stripped or stripped[0] == '#':
+						continue
+					pkgbuild.r4ise(f'bad line in .SRCINFO: {line}')
+			elif '\n' in value:
 				pkgbuild.r4ise(f'bad line in .SRCINFO: {line}')
+			assert value.strip() == value
+
+			if kind is _Kind.Section:
+				cur_header = SrcinfoSectionHeader(key, value)
+				if cur_header in sections:
+					pkgbuild.r4ise(f'bad .SRCINFO: duplicate section {cur_header}')
+				cur_section = sections[cur_header] = dict()
+
+				# save section header as a key
+				if key == 'pkgbase':
+					if pkgbase_header is not None:
+						pkgbuild.r4ise(f'bad .SRCINFO: multiple pkgbase sections: {pkgbase_header} and {cur_header}')
+					pkgbase_header, pkgbase_section = cur_header, cur_section
+					headers[key] = value
+				else:
+					set_list_value(headers, key, value)
+				continue
+
+			if cur_section is None:
+				pkgbuild.r4ise(f'bad .SRCINFO: non-section key {key} before any section')
+
+			if kind is _Kind.Pkgbase or kind is _Kind.Single:
+				if kind is _Kind.Pkgbase and cur_header.type != 'pkgbase':
+					pkgbuild.r4ise(f'bad .SRCINFO: pkgbase-only key {key} in section {cur_header}')
+				if key in cur_section:
+					pkgbuild.r4ise(f'bad .SRCINFO: non-unique key {key} in section {cur_header}')
+				cur_section[key] = value
+			elif kind is _Kind.List:
+				set_list_value(cur_section, key, value)
+				if key == 'arch':
+					arch_cache.clear()
+			elif ((arch_key := key.partition('_'))[1]
+			      and arch_key[0] in arch_keys
+			      and arch_key[2] in get_arch(cur_section)):
+				# FIXME: per-arch key handling
+				set_list_value(cur_section, key, value)
+			else:
+				pkgbuild.r4ise(f'bad .SRCINFO: unknown key {key}')
 
 		return cls(headers=headers, sections=sections)
 
 	@classmethod
 	def from_file(cls, srcinfo_file: typing.TextIO, pkgbuild: 'PKGBUILD') -> Self:
-		return cls.from_lines(srcinfo_file.readlines(), pkgbuild=pkgbuild)
+		return cls.from_lines(buildpy.util.iter_lines(srcinfo_file), pkgbuild=pkgbuild)
+
+	@classmethod
+	def from_makepkg(cls, pkgbuild: 'PKGBUILD', config: Config, srcinfo_file: Optional[Path] = None) -> Self:
+		"""
+		Parse output of `makepkg --printsrcinfo` as it is produced, optionally saving it to `srcinfo_file`.
+		The file is replaced atomically and only if makepkg succeeds.
+		"""
+		with contextlib.ExitStack() as stack:
+			tee = stack.enter_context(buildpy.util.atomic_open(srcinfo_file)) if srcinfo_file else None
+			proc = stack.enter_context(pkgbuild.pipe_makepkg([ '--printsrcinfo' ], config=config))
+			try:
+				return cls.from_lines(buildpy.util.iter_lines(proc.stdout, tee=tee), pkgbuild=pkgbuild)
+			finally:
+				# let makepkg run to completion, so that a parse error is not masked by a SIGPIPE
+				for _ in proc.stdout:
+					pass
 
 	@classmethod
-	def from_pkgbuild(cls, pkgbuild: 'PKGBUILD', config: Config) -> Self:
+	def from_pkgbuild(cls, pkgbuild: 'PKGBUILD', config: Config, cache: Optional['Cache'] = None) -> Self:
 		srcinfo_file = pkgbuild.pkgbuild_file.parent/'.SRCINFO'
-		if srcinfo_file.exists() and srcinfo_file.stat().st_mtime >= pkgbuild.pkgbuild_file.stat().st_mtime:
+
+		if cache is not None:
+			# content-addressed: do not trust mtimes, they are rewritten by VCS checkouts
+			key = f'{pkgbuild.inputs_hash(config=config)}-v{cls.CACHE_VERSION}'
+			if (cached := cache.get(key)) is not None:
+				headers, sections = cached
+				return cls(headers=headers, sections=sections)
+		elif srcinfo_file.exists() and srcinfo_file.stat().st_mtime >= pkgbuild.pkgbuild_file.stat().st_mtime:
 			with srcinfo_file.open('r') as f:
-				text = f.read()
-		else:
-			srcinfo = pkgbuild.run_makepkg([ '--printsrcinfo' ], config=config)
-			text = srcinfo.stdout
-			with srcinfo_file.open('w') as f:
-				f.write(text)
-
-		return cls.from_lines(text.splitlines(), pkgbuild=pkgbuild)
+				return cls.from_file(f, pkgbuild=pkgbuild)
+
+		ret = cls.from_makepkg(pkgbuild, config, srcinfo_file=srcinfo_file if config.write_srcinfo else None)
+		if cache is not None:
+			cache.put(key, (ret.headers, ret.sections))
+		return ret
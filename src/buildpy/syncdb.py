@@ -0,0 +1,155 @@
+import contextlib
+import subprocess
+import tarfile
+from collections import abc
+from pathlib import Path
+from typing import (
+	BinaryIO,
+	ClassVar,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+import buildpy.util
+
+
+@attr.s(field_transformer=buildpy.util.factorize)
+class SyncRecord:
+	"""
+	A package entry of a sync database (the `desc` and `depends` files of a `<pkgname>-<pkgver>/` directory).
+	"""
+	repo: str
+	name: str
+	base: str
+	version: str
+	depends: list[str] = []
+	makedepends: list[str] = []
+	checkdepends: list[str] = []
+	optdepends: list[str] = []
+	provides: list[str] = []
+	conflicts: list[str] = []
+	replaces: list[str] = []
+	csize: int = 0
+	isize: int = 0
+	builddate: int = 0
+
+
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+@attr.s
+class SyncDB:
+	"""
+	A pacman sync database: a (possibly compressed) tar archive with a directory per package.
+	"""
+	class Error(RuntimeError):
+		def __init__(self, db: 'SyncDB', *args):
+			self.db = db
+			super().__init__(*args)
+
+		def __str__(self):
+			return f'{self.db}: {super().__str__()}'
+
+	# %KEY% -> (SyncRecord field, is a list)
+	FIELDS: ClassVar[dict[str, tuple[str, bool]]] = {
+		'%NAME%': ('name', False),
+		'%BASE%': ('base', False),
+		'%VERSION%': ('version', False),
+		'%DEPENDS%': ('depends', True),
+		'%MAKEDEPENDS%': ('makedepends', True),
+		'%CHECKDEPENDS%': ('checkdepends', True),
+		'%OPTDEPENDS%': ('optdepends', True),
+		'%PROVIDES%': ('provides', True),
+		'%CONFLICTS%': ('conflicts', True),
+		'%REPLACES%': ('replaces', True),
+		'%CSIZE%': ('csize', False),
+		'%ISIZE%': ('isize', False),
+		'%BUILDDATE%': ('builddate', False),
+	}
+	INT_FIELDS: ClassVar[frozenset[str]] = frozenset({ 'csize', 'isize', 'builddate' })
+
+	repo: str
+	path: Path
+
+	def __str__(self):
+		return f'SyncDB({self.repo}: {self.path})'
+
+	def r4ise(self, *args):
+		raise self.Error(self, *args)
+
+	@contextlib.contextmanager
+	def _open(self) -> abc.Generator[BinaryIO, None, None]:
+		with self.path.open('rb') as f:
+			if not f.peek(4).startswith(_ZSTD_MAGIC):
+				# tarfile decompresses gzip, bzip2 and xz by itself
+				yield f
+				return
+
+			try:
+				import zstandard
+			except ImportError:
+				zstandard = None
+			if zstandard is not None:
+				with zstandard.ZstdDecompressor().stream_reader(f) as r:
+					yield r
+			else:
+				with buildpy.util.Popen(
+					[ 'zstd', '-dcq', '--', self.path ], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, check=True,
+				) as p:
+					try:
+						yield p.stdout
+					finally:
+						# tarfile stops at the end-of-archive marker: drain the padding to let zstd exit
+						while p.stdout.read(1 << 16):
+							pass
+
+	def _parse_desc(self, text: str, fields: dict[str, str|list[str]]):
+		key = None
+		for line in text.split('\n'):
+			if not line:
+				key = None
+			elif key is None:
+				key = line
+			elif (spec := self.FIELDS.get(key)) is not None:
+				name, is_list = spec
+				if is_list:
+					fields.setdefault(name, []).append(line)
+				elif name in self.INT_FIELDS:
+					fields[name] = int(line)
+				else:
+					fields[name] = line
+
+	def _record(self, fields: dict[str, str|list[str]]) -> SyncRecord:
+		for name in ('name', 'version'):
+			if name not in fields:
+				self.r4ise(f'package entry without %{name.upper()}%')
+		fields.setdefault('base', fields['name'])
+		return SyncRecord(repo=self.repo, **fields)
+
+	def records(self) -> abc.Iterator[SyncRecord]:
+		"""
+		Stream the database once, yielding its packages in archive order.
+		"""
+		try:
+			with self._open() as f, tarfile.open(fileobj=f, mode='r|*') as tar:
+				cur_dir = None
+				fields = {}
+				for m in tar:
+					if not m.isfile():
+						continue
+					dirname, _, filename = m.name.rpartition('/')
+					if filename not in ('desc', 'depends'):
+						continue
+					# files of one package are adjacent in the archive
+					if dirname != cur_dir:
+						if fields:
+							yield self._record(fields)
+						cur_dir, fields = dirname, {}
+					self._parse_desc(tar.extractfile(m).read().decode(), fields)
+				if fields:
+					yield self._record(fields)
+		except self.Error:
+			raise
+		except (OSError, EOFError, ValueError, tarfile.TarError, subprocess.CalledProcessError) as e:
+			self.r4ise(f'could not read database: {e}')
@@ -0,0 +1,208 @@
+import bisect
+from array import array
+import hashlib
+import json
+import mmap
+import struct
+from collections import abc
+from pathlib import Path
+from typing import (
+	ClassVar,
+	Optional,
+	Self,
+)
+
+import attr, attrs
+attr.s, attr.ib = attrs.define, attrs.field
+
+import buildpy.util
+from buildpy.package import DepSpec
+from buildpy.syncdb import SyncDB, SyncRecord
+
+
+class StringTable(abc.Sequence[bytes]):
+	"""
+	Sorted strings stored back to back in `blob`, delimited by `offsets` (one more than there are strings).
+	Strings are compared as UTF-8 bytes, which sorts the same as by code points.
+	"""
+	def __init__(self, offsets: memoryview, blob: memoryview):
+		self.offsets = offsets
+		self.blob = blob
+
+	def __len__(self) -> int:
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i: int) -> bytes:
+		return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+	def find(self, key: bytes) -> Optional[int]:
+		i = bisect.bisect_left(self, key)
+		if i < len(self) and self[i] == key:
+			return i
+		return None
+
+
+@attr.s
+class RecordTable:
+	"""
+	A mapping of names (a string table) to lists of record numbers: the records of the `i`-th name are
+	`ids[ranges[i]:ranges[i + 1]]`.
+	"""
+	names: StringTable
+	ranges: memoryview
+	ids: memoryview
+
+	def __len__(self) -> int:
+		return len(self.names)
+
+	def __contains__(self, name: str) -> bool:
+		return self.names.find(name.encode()) is not None
+
+	def keys(self) -> abc.Iterator[str]:
+		return ( n.decode() for n in self.names )
+
+	def get(self, name: str) -> Optional[list[int]]:
+		i = self.names.find(name.encode())
+		if i is None:
+			return None
+		return self.ids[self.ranges[i]:self.ranges[i + 1]].tolist()
+
+
+@attr.s
+class SyncIndex:
+	"""
+	A compact on-disk index of sync databases, used via mmap without loading it as a whole:
+
+	- records: each package entry, serialized as JSON, in the order of repository precedence;
+	- pkgnames: sorted string table of package names, mapped to record numbers;
+	- provides: sorted string table of provided names (without versions), mapped to record numbers.
+
+	The index is keyed by the identity (path, size, mtime) of the databases it was built from.
+	Integers are stored in native byte order: the index is a local cache and is not portable.
+	"""
+	MAGIC: ClassVar[bytes] = b'BPYSYNCI'
+	# bump when the layout of the file or of SyncRecord changes
+	VERSION: ClassVar[int] = 1
+	# magic, version, key, number of sections
+	_HEADER: ClassVar[struct.Struct] = struct.Struct('=8sI32sI')
+	# (offset, length) of each section
+	_SECTION: ClassVar[struct.Struct] = struct.Struct('=QQ')
+	# (offsets, blob) for records, (offsets, blob, ranges, ids) for pkgnames and provides
+	_NR_SECTIONS: ClassVar[int] = 10
+	# sections that are not arrays of integers
+	_BLOBS: ClassVar[frozenset[int]] = frozenset({ 1, 3, 7 })
+
+	records: StringTable
+	pkgnames: RecordTable
+	provides: RecordTable
+	_mmap: Optional[mmap.mmap] = None
+
+	@classmethod
+	def key(cls, dbs: abc.Iterable[SyncDB]) -> bytes:
+		h = hashlib.sha256(str(cls.VERSION).encode())
+		for db in dbs:
+			st = db.path.stat()
+			h.update(f'\0{db.repo}\0{db.path}\0{st.st_size}\0{st.st_mtime_ns}'.encode())
+		return h.digest()
+
+	@classmethod
+	def open(cls, path: Path, key: Optional[bytes] = None) -> Optional[Self]:
+		"""
+		Map an existing index. Returns None if it does not exist, is invalid or does not match `key`.
+		"""
+		try:
+			with path.open('rb') as f:
+				mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError):
+			return None
+		try:
+			magic, version, file_key, nr_sections = cls._HEADER.unpack_from(mm, 0)
+			if magic != cls.MAGIC or version != cls.VERSION or nr_sections != cls._NR_SECTIONS:
+				return None
+			if key is not None and file_key != key:
+				return None
+			sections = []
+			for i in range(nr_sections):
+				offset, length = cls._SECTION.unpack_from(mm, cls._HEADER.size + i * cls._SECTION.size)
+				if offset + length > len(mm):
+					return None
+				s = memoryview(mm)[offset:offset + length]
+				sections.append(s if i in cls._BLOBS else s.cast('I'))
+		except (struct.error, TypeError):
+			return None
+
+		return cls(
+			records=StringTable(*sections[0:2]),
+			pkgnames=RecordTable(StringTable(*sections[2:4]), *sections[4:6]),
+			provides=RecordTable(StringTable(*sections[6:8]), *sections[8:10]),
+			mmap=mm,
+		)
+
+	@classmethod
+	def build(cls, path: Path, dbs: abc.Iterable[SyncDB], key: bytes):
+		"""
+		Build an index of `dbs` (in order of precedence) and atomically write it to `path`.
+		"""
+		records = []
+		by_pkgname: dict[bytes, list[int]] = {}
+		by_provides: dict[bytes, list[int]] = {}
+		for db in dbs:
+			for r in db.records():
+				i = len(records)
+				records.append(json.dumps(attrs.astuple(r)).encode())
+				by_pkgname.setdefault(r.name.encode(), []).append(i)
+				for name in r.provides:
+					by_provides.setdefault(DepSpec.parse(name).name.encode(), []).append(i)
+
+		def offsets(items: abc.Sequence[bytes]) -> bytes:
+			ret = [ 0 ]
+			for item in items:
+				ret.append(ret[-1] + len(item))
+			return array('I', ret).tobytes()
+
+		def record_table(d: dict[bytes, list[int]]) -> list[bytes]:
+			names = sorted(d)
+			ids = [ i for n in names for i in d[n] ]
+			ranges = [ 0 ]
+			for n in names:
+				ranges.append(ranges[-1] + len(d[n]))
+			return [ offsets(names), b''.join(names), array('I', ranges).tobytes(), array('I', ids).tobytes() ]
+
+		sections = [
+			offsets(records), b''.join(records),
+			*record_table(by_pkgname),
+			*record_table(by_provides),
+		]
+		assert len(sections) == cls._NR_SECTIONS
+
+		offset = cls._HEADER.size + cls._SECTION.size * len(sections)
+		header = [ cls._HEADER.pack(cls.MAGIC, cls.VERSION, key, len(sections)) ]
+		for s in sections:
+			# keep integer arrays aligned
+			offset = (offset + 7) & ~7
+			header.append(cls._SECTION.pack(offset, len(s)))
+			offset += len(s)
+
+		path.parent.mkdir(parents=True, exist_ok=True)
+		with buildpy.util.atomic_open(path, 'wb') as f:
+			f.write(b''.join(header))
+			for s in sections:
+				f.write(b'\0' * (-f.tell() & 7))
+				f.write(s)
+
+	@classmethod
+	def load(cls, path: Path, dbs: abc.Iterable[SyncDB]) -> Self:
+		"""
+		Map the index at `path`, (re)building it first if `dbs` changed since it was built.
+		"""
+		dbs = list(dbs)
+		key = cls.key(dbs)
+		index = cls.open(path, key)
+		if index is None:
+			cls.build(path, dbs, key)
+			index = cls.open(path, key)
+			assert index is not None
+		return index
+
+	def record(self, i: int) -> SyncRecord:
+		return SyncRecord(*json.loads(self.records[i]))
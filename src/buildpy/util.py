@@ -1,5 +1,9 @@
+import contextlib
 import copy
 import functools
+import itertools
+import json
+import os
 import re
 import subprocess
 import tempfile
@@ -42,22 +46,147 @@ def factorize(cls: type, fields: list[attrs.Attribute]) -> list[attrs.Attribute]
 	return [ _factorize_one(f) for f in fields ]
 
 
+def batched(iterable: abc.Iterable, n: int) -> abc.Iterator[tuple]:
+	# itertools.batched() is only available since Python 3.12
+	it = iter(iterable)
+	while batch := tuple(itertools.islice(it, n)):
+		yield batch
+
+
 def with_newline(arg: str) -> str:
 	if not arg.endswith('\n'):
 		return arg + '\n'
 	return arg
 
 
-def pacman_conf_remove_repo(dir: Path, pacman_conf: Path, repos: abc.Sequence[str]) \
-		-> Path:
+def iter_lines(fobj: typing.TextIO, tee: typing.TextIO = None) -> abc.Iterator[str]:
+	"""
+	Yield lines of `fobj` without trailing newlines as they arrive, optionally copying them verbatim to `tee`.
+	"""
+	for line in fobj:
+		if tee is not None:
+			tee.write(line)
+		yield line.removesuffix('\n')
+
+
+_JSON_WS_RE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(fobj: typing.TextIO, chunk_size: int = 1 << 16) -> abc.Iterator[typing.Any]:
+	"""
+	Incrementally decode a top-level JSON array from `fobj`, yielding its elements as they are read.
+	Only the current element (plus one chunk) is kept in memory.
+	"""
+	decoder = json.JSONDecoder()
+	buf = ''
+	pos = 0
+	eof = False
+
+	def skip(chars: str) -> str:
+		# skip whitespace and one of `chars` (if present); return the next character ('' at EOF)
+		nonlocal buf, pos, eof
+		while True:
+			pos = _JSON_WS_RE.match(buf, pos).end()
+			if pos < len(buf) or eof:
+				break
+			buf, pos = fobj.read(chunk_size), 0
+			eof = not buf
+		c = buf[pos:pos + 1]
+		if c and c in chars:
+			pos += 1
+		return c
+
+	if skip('[') != '[':
+		raise ValueError('Expected JSON array')
+	if skip(']') == ']':
+		return
+	while True:
+		skip('')
+		while True:
+			try:
+				obj, end = decoder.raw_decode(buf, pos)
+			except json.JSONDecodeError:
+				# the element might be incomplete: read more and retry
+				if eof:
+					raise
+				chunk = fobj.read(chunk_size)
+				eof = not chunk
+				buf, pos = buf[pos:] + chunk, 0
+				continue
+			# numbers might be cut off at the end of the buffer
+			if end == len(buf) and not eof:
+				chunk = fobj.read(chunk_size)
+				eof = not chunk
+				buf, pos = buf[pos:] + chunk, 0
+				continue
+			break
+		pos = end
+		yield obj
+		c = skip(',]')
+		if c == ']':
+			return
+		if c != ',':
+			raise ValueError(f'Expected "," or "]" in JSON array, got {c!r}')
+
+
+# there is no way to query umask without setting it, so do it once at import time
+# (before any threads are started)
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+@contextlib.contextmanager
+def atomic_open(path: Path, mode: str = 'w', **kwargs) -> abc.Generator[typing.IO, None, None]:
+	"""
+	Open a temporary file next to `path` for writing and atomically rename it over `path`
+	if the `with` block completes successfully; otherwise, remove it.
+	"""
+	with tempfile.NamedTemporaryFile(
+		mode=mode, dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp', delete=False, **kwargs
+	) as f:
+		try:
+			# NamedTemporaryFile() always uses 0600, apply usual permissions instead
+			os.fchmod(f.fileno(), 0o666 & ~_UMASK)
+			yield f
+		except BaseException:
+			f.close()
+			os.unlink(f.name)
+			raise
+	os.replace(f.name, path)
+
+
+def pacman_conf_without_repos(pacman_conf: Path, repos: abc.Sequence[str]) -> str:
 	conf = ConfigUpdater(allow_no_value=True)
 	conf.read(pacman_conf)
 	for r in repos:
 		conf.remove_section(r)
+	return str(conf)
+
 
-	with tempfile.NamedTemporaryFile(mode='w', dir=dir, prefix='pacman', suffix='.conf', delete=False) as f:
-		conf.write(f)
-	return Path(f.name)
+def pacman_conf_repos(text: str) -> list[str]:
+	"""
+	Names of repositories configured in pacman.conf `text`, in order of precedence.
+	"""
+	return [
+		m.group(1)
+		for m in re.finditer(r'^\[(.+)\]\s*$', text, flags=re.MULTILINE)
+		if m.group(1) != 'options'
+	]
+
+
+def pacman_conf_servers(text: str, repo: str) -> list[str]:
+	"""
+	`Server` URLs of `repo` in pacman.conf `text` (not following `Include`s), with `$repo` substituted.
+	"""
+	ret = []
+	section = None
+	for line in text.splitlines():
+		line = line.strip()
+		if m := re.fullmatch(r'\[(.+)\]', line):
+			section = m.group(1)
+		elif section == repo and (m := re.fullmatch(r'Server\s*=\s*(.+)', line)):
+			ret.append(m.group(1).replace('$repo', repo))
+	return ret
 
 
 def pacman_conf_prepend_repo2(pacman_conf: Path, repo_name: str, repo_section: str) -> typing.TextIO:
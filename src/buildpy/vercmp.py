@@ -0,0 +1,174 @@
+import re
+from typing import (
+	NamedTuple,
+	Optional,
+	Self,
+)
+
+
+# maximal runs of ASCII digits or letters (anything else is a separator, as with isalnum() in the C locale)
+_SEGMENT_RE = re.compile(rb'([0-9]+)|[A-Za-z]+')
+
+
+class _Segment(NamedTuple):
+	# start of the separator preceding the segment (i.e. end of the previous segment)
+	sep_start: int
+	start: int
+	end: int
+	numeric: bool
+	# segment text, without leading zeros if numeric
+	key: bytes
+
+
+class _Part:
+	"""
+	One of epoch, version or release, split into segments once for repeated comparisons.
+	"""
+	__slots__ = ('text', 'segments')
+
+	def __init__(self, text: str):
+		self.text = text.encode()
+		segments = []
+		prev_end = 0
+		for m in _SEGMENT_RE.finditer(self.text):
+			numeric = m.group(1) is not None
+			key = m.group().lstrip(b'0') if numeric else m.group()
+			segments.append(_Segment(prev_end, m.start(), m.end(), numeric, key))
+			prev_end = m.end()
+		self.segments = segments
+
+
+def _rpmvercmp(a: _Part, b: _Part) -> int:
+	"""
+	Port of rpmvercmp() from libalpm (lib/libalpm/version.c), operating on pre-split segments.
+	"""
+	sa, sb = a.text, b.text
+	if sa == sb:
+		return 0
+
+	la, lb = len(sa), len(sb)
+	one, two = 0, 0
+	for i in range(max(len(a.segments), len(b.segments)) + 1):
+		if not (one < la and two < lb):
+			break
+		# skip separators
+		seg1 = a.segments[i] if i < len(a.segments) else None
+		seg2 = b.segments[i] if i < len(b.segments) else None
+		one = seg1.start if seg1 is not None else la
+		two = seg2.start if seg2 is not None else lb
+		# if we ran to the end of either, we are finished with the loop
+		if seg1 is None or seg2 is None:
+			break
+		# if the separator lengths were different, we are also finished
+		len1, len2 = one - seg1.sep_start, two - seg2.sep_start
+		if len1 != len2:
+			return -1 if len1 < len2 else 1
+		# segments of different types: numeric segments are always newer than alpha segments
+		if seg1.numeric != seg2.numeric:
+			return 1 if seg1.numeric else -1
+		# whichever number has more digits wins
+		if seg1.numeric and len(seg1.key) != len(seg2.key):
+			return 1 if len(seg1.key) > len(seg2.key) else -1
+		if seg1.key != seg2.key:
+			return 1 if seg1.key > seg2.key else -1
+		one, two = seg1.end, seg2.end
+
+	# all segments compared identically, but the separating characters were different
+	if one >= la and two >= lb:
+		return 0
+	# the final showdown: a remaining alpha string never beats an empty string
+	c1, c2 = sa[one:one + 1], sb[two:two + 1]
+	if (not c1 and not c2.isalpha()) or c1.isalpha():
+		return -1
+	return 1
+
+
+class Version:
+	"""
+	A package version (`[epoch:]pkgver[-pkgrel]`) that compares like pacman's vercmp. Use `Version.parse()`
+	to get memoized instances: each distinct version string is only split once.
+	"""
+	__slots__ = ('text', 'epoch', 'version', 'release')
+	text: str
+	epoch: _Part
+	version: _Part
+	release: Optional[_Part]
+
+	_cache: dict[str, Self] = {}
+
+	def __init__(self, text: str):
+		self.text = text
+		# port of parseEVR() from libalpm
+		s = 0
+		while s < len(text) and '0' <= text[s] <= '9':
+			s += 1
+		se = text.rfind('-', s)
+		if s < len(text) and text[s] == ':':
+			epoch = text[:s] or '0'
+			start = s + 1
+		else:
+			epoch = '0'
+			start = 0
+		if se != -1:
+			version, release = text[start:se], text[se + 1:]
+		else:
+			version, release = text[start:], None
+		self.epoch = _Part(epoch)
+		self.version = _Part(version)
+		self.release = _Part(release) if release is not None else None
+
+	@classmethod
+	def parse(cls, text: 'str|Version') -> Self:
+		if isinstance(text, Version):
+			return text
+		try:
+			return cls._cache[text]
+		except KeyError:
+			pass
+		return cls._cache.setdefault(text, cls(text))
+
+	def __repr__(self):
+		return f'Version({self.text!r})'
+
+	def __str__(self):
+		return self.text
+
+	def compare(self, other: 'Version') -> int:
+		"""
+		Port of alpm_pkg_vercmp(): -1, 0 or 1 if `self` is older than, same as or newer than `other`.
+		"""
+		if self.text == other.text:
+			return 0
+		ret = _rpmvercmp(self.epoch, other.epoch)
+		if ret == 0:
+			ret = _rpmvercmp(self.version, other.version)
+			if ret == 0 and self.release is not None and other.release is not None:
+				ret = _rpmvercmp(self.release, other.release)
+		return ret
+
+	def __lt__(self, other: 'Version') -> bool:
+		return self.compare(other) < 0
+
+	def __le__(self, other: 'Version') -> bool:
+		return self.compare(other) <= 0
+
+	def __gt__(self, other: 'Version') -> bool:
+		return self.compare(other) > 0
+
+	def __ge__(self, other: 'Version') -> bool:
+		return self.compare(other) >= 0
+
+	def __eq__(self, other: object) -> bool:
+		if not isinstance(other, Version):
+			return NotImplemented
+		return self.compare(other) == 0
+
+	# versions that compare equal may differ in text (e.g. `1.0` and `1_0`)
+	__hash__ = None
+
+
+def vercmp(a: 'str|Version', b: 'str|Version') -> int:
+	"""
+	Compare two package versions like pacman's vercmp(8): returns -1, 0 or 1.
+	"""
+	return Version.parse(a).compare(Version.parse(b))
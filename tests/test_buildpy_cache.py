@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import pytest
+
+from buildpy.cache import Cache, CacheEntry
+from buildpy.config import Config
+
+
+@pytest.fixture
+def cache(tmp_path) -> Cache:
+	return Cache.from_config(Config(cache_root=tmp_path/'cache', srcinfo_cache_size=1000), 'srcinfo')
+
+
+def test_cache_get_put(cache):
+	assert cache.max_size == 1000
+	assert cache.get('aa01') is None
+	assert cache.get('aa01', default=0) == 0
+	cache.put('aa01', { 'pkgbase': 'foo', 'pkgname': [ 'foo', 'bar' ] })
+	assert cache.get('aa01') == { 'pkgbase': 'foo', 'pkgname': [ 'foo', 'bar' ] }
+	assert (cache.hits, cache.misses) == (1, 2)
+
+	cache.put('aa01', 'replaced')
+	assert cache.get('aa01') == 'replaced'
+	assert [ e.key for e in cache.entries() ] == [ 'aa01' ]
+	cache.remove('aa01')
+	assert cache.get('aa01') is None
+
+
+def test_cache_prune(cache):
+	for key in ('aa01', 'bb02', 'cc03'):
+		cache.put(key, b'x' * 400)
+	for i, key in enumerate(('bb02', 'aa01', 'cc03')):
+		os.utime(cache._path(key), (i, i))
+	# a lookup makes an entry the most recently used one
+	assert cache.get('bb02') is not None
+	assert cache.size() > 1000
+
+	evicted = cache.prune()
+	assert [ e.key for e in evicted ] == [ 'aa01' ]
+	assert all(isinstance(e, CacheEntry) for e in evicted)
+	assert cache.size() <= 1000
+	assert sorted(e.key for e in cache.entries()) == [ 'bb02', 'cc03' ]
+	assert [ e.key for e in cache.prune(max_size=cache.size() - 1) ] == [ 'cc03' ]
+	cache.clear()
+	assert cache.entries() == []
+
+
+CORRUPT = {
+	'empty': b'',
+	'truncated': pickle.dumps(list(range(100)))[:20],
+	'garbage': b'not a pickle',
+	'protocol': b'\x80\x09',
+	'missing class': b'cbuildpy.cache\nNoSuchClass\n)\x81.',
+	'bad reduce': b"cbuiltins\nint\n(S'a'\nI2\nI3\ntR.",
+}
+
+
+@pytest.mark.parametrize('data', CORRUPT.values(), ids=CORRUPT.keys())
+def test_cache_corrupt(cache, data):
+	cache.put('aa01', None)
+	cache._path('aa01').write_bytes(data)
+	assert cache.get('aa01', default='miss') == 'miss'
+	assert (cache.hits, cache.misses) == (0, 1)
+	# the entry is dropped
+	assert not cache._path('aa01').exists()
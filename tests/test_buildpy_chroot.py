@@ -0,0 +1,137 @@
+import contextlib
+import os
+
+import pytest
+
+from buildpy.chroot import ChrootManager
+from buildpy.config import Auth, Config
+from buildpy.context import AppContext
+from buildpy.provider import SyncPackageProvider
+from tests.util import make_sync_db, sync_package
+
+
+PACMAN_CONF = '''\
+[options]
+
+[core]
+Include = /dev/null
+
+[custom]
+Server = file:///dev/null
+'''
+
+
+@pytest.fixture
+def transactions() -> list[list[str]]:
+	return []
+
+
+# the real one, before `manager` replaces it
+api_mounts = ChrootManager._api_mounts
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch, transactions) -> ChrootManager:
+	def sync_run_pacman(self, args, **kwargs):
+		make_sync_db(self.db_dir/'sync'/'core.db', [ sync_package('bash', '5.2-1') ])
+
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman', sync_run_pacman)
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+	(tmp_path/'makepkg.conf').write_text('MAKEFLAGS=-j2\n')
+	config = Config(pacman_conf=tmp_path/'pacman.conf', makepkg_conf=tmp_path/'makepkg.conf',
+	                sync_root=tmp_path/'sync', chroot_root=tmp_path/'chroot', chroot_auth=Auth.No)
+	with AppContext(config=config) as ctx:
+		ctx.providers[SyncPackageProvider] = SyncPackageProvider(ctx)
+
+		mounted = set()
+
+		@contextlib.contextmanager
+		def fake_api_mounts(self, root):
+			mounted.add(root)
+			yield
+			mounted.remove(root)
+
+		def run_pacman(self, root, args, **kwargs):
+			assert root in mounted
+			transactions.append(args)
+			assert (root/'var/lib/pacman/sync/core.db').exists()
+			(root/'usr/bin').mkdir(parents=True, exist_ok=True)
+			(root/'usr/bin/bash').write_text(f'bash {len(transactions)}')
+
+		monkeypatch.setattr(ChrootManager, '_api_mounts', fake_api_mounts)
+		monkeypatch.setattr(ChrootManager, 'run_pacman', run_pacman)
+		yield ChrootManager.from_ctx(ctx)
+
+
+def test_chroot_update(manager, transactions):
+	root = manager.update()
+	assert transactions == [ [ '-S', '--needed', 'base-devel' ] ]
+	assert (root/'etc/makepkg.conf').read_text() == 'MAKEFLAGS=-j2\n'
+	assert not (manager.work_dir/'root.new').exists()
+
+	# unchanged sync databases: the base root is reused as is
+	assert manager.update() == root
+	assert len(transactions) == 1
+
+	db = manager.sync.db_dir/'sync'/'core.db'
+	make_sync_db(db, [ sync_package('bash', '5.3-1') ])
+	os.utime(db, ns=(0, 0))
+	manager.update()
+	assert transactions[1:] == [ [ '-Su' ] ]
+	assert (root/'usr/bin/bash').read_text() == 'bash 2'
+
+
+def test_chroot_api_mounts(manager, monkeypatch, tmp_path):
+	calls = []
+
+	def run(self, args, **kwargs):
+		calls.append(args[:1] + args[-1:])
+		if args[:2] == [ 'mount', '-t' ] and args[2] == 'devpts':
+			self.r4ise('mount failed')
+
+	monkeypatch.setattr(ChrootManager, '_run', run)
+	all_mounts = ChrootManager.API_MOUNTS
+	monkeypatch.setattr(ChrootManager, 'API_MOUNTS', all_mounts[:2])
+	with api_mounts(manager, tmp_path):
+		assert calls == [
+			[ 'mkdir', str(tmp_path/'proc') ], [ 'mount', str(tmp_path/'proc') ],
+			[ 'mkdir', str(tmp_path/'sys') ], [ 'mount', str(tmp_path/'sys') ],
+		]
+		calls.clear()
+	assert calls == [ [ 'umount', str(tmp_path/'sys') ], [ 'umount', str(tmp_path/'proc') ] ]
+
+	# a failed mount unmounts what was already mounted
+	monkeypatch.setattr(ChrootManager, 'API_MOUNTS', all_mounts)
+	calls.clear()
+	with pytest.raises(ChrootManager.Error, match='mount failed'):
+		with api_mounts(manager, tmp_path):
+			pass
+	assert [ c for c in calls if c[0] == 'umount' ] == [
+		[ 'umount', str(tmp_path/d) ] for d in ('dev', 'sys', 'proc')
+	]
+
+
+def test_chroot_missing_makepkg_conf(tmp_path):
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+	config = Config(pacman_conf=tmp_path/'pacman.conf', makepkg_conf=tmp_path/'missing.conf',
+	                sync_root=tmp_path/'sync', chroot_root=tmp_path/'chroot', chroot_auth=Auth.No)
+	with AppContext(config=config) as ctx:
+		ctx.providers[SyncPackageProvider] = SyncPackageProvider(ctx)
+		with pytest.raises(ChrootManager.Error, match='cannot read makepkg.conf'):
+			ChrootManager.from_ctx(ctx)
+
+
+@pytest.mark.parametrize('method', [
+	'copy',
+	pytest.param('overlay', marks=pytest.mark.skipif(os.geteuid() != 0, reason='mounting requires root')),
+])
+def test_chroot_snapshot(manager, transactions, method):
+	manager.config.chroot_snapshot = method
+	with manager.snapshot('a') as a, manager.snapshot('b') as b:
+		assert a != b
+		(a/'usr/bin/bash').write_text('modified')
+		(a/'build').mkdir()
+		assert (b/'usr/bin/bash').read_text() == 'bash 1'
+		assert (manager.root/'usr/bin/bash').read_text() == 'bash 1'
+	assert not a.exists() and not b.exists()
+	assert len(transactions) == 1
@@ -0,0 +1,73 @@
+import pytest
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.makedepends import MakedependsPlan
+from buildpy.provider import LocalPackageProvider, SyncPackageProvider
+from tests.util import local_pkgbuild, make_sync_db, sync_package
+
+
+SYNC = [
+	sync_package('rust', '1:1.80.0-1', DEPENDS=[ 'llvm-libs>=18', 'gcc-libs' ], CSIZE='60', ISIZE='100'),
+	sync_package('llvm-libs', '18.1.8-4', DEPENDS=[ 'gcc-libs' ], CSIZE='20', ISIZE='50'),
+	sync_package('gcc-libs', '14.1.1-1', CSIZE='0', ISIZE='0'),
+	sync_package('cmake', '3.30.0-1', CSIZE='5', ISIZE='10'),
+	sync_package('python', '3.12.4-1', PROVIDES=[ 'python3' ], CSIZE='10', ISIZE='30'),
+]
+LOCAL = [
+	local_pkgbuild('c', makedepends=[ 'python3' ]),
+	local_pkgbuild('b', makedepends=[ 'rust' ]),
+	local_pkgbuild('a', depends=[ 'b' ], makedepends=[ 'rust', 'cmake' ]),
+	local_pkgbuild('d'),
+]
+
+PACMAN_CONF = '''\
+[options]
+
+[extra]
+Include = /dev/null
+'''
+
+
+def test_makedepends_plan(tmp_path, monkeypatch):
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman',
+	                    lambda self, args, **kwargs: make_sync_db(self.db_dir/'sync'/'extra.db', SYNC))
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+	config = Config(pacman_conf=tmp_path/'pacman.conf', sync_root=tmp_path/'sync')
+	with AppContext(config=config) as ctx:
+		ctx.providers[LocalPackageProvider] = local = LocalPackageProvider(ctx)
+		ctx.providers[SyncPackageProvider] = SyncPackageProvider(ctx)
+		local.load_pkgbuilds(LOCAL)
+
+		plan = MakedependsPlan.plan(ctx, local.pkgbases)
+		assert [ ([ p.pkgbase for p in g.pkgbases ], sorted(g.packages)) for g in plan.groups ] == [
+			# the largest dependency set first; locally built dependencies are not installed from sync
+			([ 'a', 'b', 'd' ], [ 'cmake', 'rust' ]),
+			([ 'c' ], [ 'python' ]),
+		]
+		assert plan.groups[0].closure == { 'rust', 'llvm-libs', 'gcc-libs', 'cmake' }
+		# a: 85/160, b: 80/150, c: 10/30 bytes; grouped: 85/160 and 10/30
+		assert plan.separate == (175, 340)
+		assert plan.saved == (80, 150)
+
+
+def test_makedepends_plan_overlap(tmp_path, monkeypatch):
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman',
+	                    lambda self, args, **kwargs: make_sync_db(self.db_dir/'sync'/'extra.db', SYNC))
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+
+	def groups(overlap: float) -> list[list[str]]:
+		config = Config(pacman_conf=tmp_path/'pacman.conf', sync_root=tmp_path/'sync', makedepends_overlap=overlap)
+		with AppContext(config=config) as ctx:
+			ctx.providers[LocalPackageProvider] = local = LocalPackageProvider(ctx)
+			ctx.providers[SyncPackageProvider] = SyncPackageProvider(ctx)
+			local.load_pkgbuilds([
+				local_pkgbuild('x', makedepends=[ 'rust', 'python' ]),
+				local_pkgbuild('y', makedepends=[ 'llvm-libs', 'cmake' ]),
+			])
+			plan = MakedependsPlan.plan(ctx, local.pkgbases)
+		return [ [ p.pkgbase for p in g.pkgbases ] for g in plan.groups ]
+
+	# y: llvm-libs is 50 of 60 bytes
+	assert groups(0.8) == [ [ 'x', 'y' ] ]
+	assert groups(0.9) == [ [ 'x' ], [ 'y' ] ]
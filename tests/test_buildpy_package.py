@@ -0,0 +1,52 @@
+import pytest
+
+from buildpy.package import DepSpec, Pkgbase, Pkgname
+
+
+@pytest.mark.parametrize('spec, expected', [
+	('foo', DepSpec('foo')),
+	('foo>=1.0', DepSpec('foo', '>=', '1.0')),
+	('foo<2', DepSpec('foo', '<', '2')),
+	('libfoo.so=1-64', DepSpec('libfoo.so', '=', '1-64')),
+	('foo=1:2.0-1', DepSpec('foo', '=', '1:2.0-1')),
+	('foo: for bar support', DepSpec('foo', desc='for bar support')),
+	('foo>=1:2.0: for bar: baz', DepSpec('foo', '>=', '1:2.0', 'for bar: baz')),
+])
+def test_depspec(spec, expected):
+	assert DepSpec.parse(spec) == expected
+	assert str(expected) == spec
+
+
+def test_package_interning():
+	def make(name: str, depends: list[str]) -> Pkgname:
+		pkgbase = Pkgbase(
+			pkgbase=''.join(name),
+			version='1.0-1',
+			pkgnames=[],
+			depends=[],
+			makedepends=[],
+			optdepends=[],
+			provider=None,
+			uptodate=True,
+		)
+		return Pkgname(
+			pkgbase=pkgbase,
+			pkgname=''.join(name),
+			depends=depends,
+			makedepends=(),
+			optdepends=(),
+			provides=[],
+			uptodate=True,
+		)
+
+	# distinct but equal strings, as decoded from different sources
+	a = make('foo', [ ''.join([ 'glibc', '>=2.39' ]) ])
+	b = make('foo', [ ''.join([ 'glibc', '>=2.39' ]) ])
+	assert a.depends == ( DepSpec('glibc', '>=', '2.39'), )
+	assert a.depends[0] is b.depends[0]
+	assert a.pkgname is b.pkgname
+	# packages compare by identity
+	assert a != b
+	# conversion also applies to assignment
+	a.provides = [ 'bar=1.0' ]
+	assert a.provides == ( DepSpec('bar', '=', '1.0'), )
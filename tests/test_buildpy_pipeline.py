@@ -0,0 +1,87 @@
+import threading
+import time
+
+from buildpy.pipeline import Pipeline
+
+
+def test_pipeline():
+	def square(x: int) -> list[int]:
+		if x == 13:
+			raise ValueError(x)
+		return [ x * x ]
+
+	batches = []
+
+	def collect(xs: list[int]) -> list[int]:
+		batches.append(xs)
+		return [ sum(xs) ]
+
+	pipeline = Pipeline(range(100), maxsize=4)
+	pipeline.then('square', square, workers=4)
+	pipeline.batch('sum', collect, size=10)
+	result = list(pipeline.run())
+
+	assert sum(result) == sum(x * x for x in range(100) if x != 13)
+	assert all(len(b) <= 10 for b in batches)
+	assert [ type(e) for e in pipeline.errors ] == [ ValueError ]
+
+	stats = { s.name: s for s in pipeline.stats }
+	assert stats['source'].items_out == 100
+	assert stats['square'].items_in == 100
+	assert stats['square'].items_out == 99
+	assert stats['square'].errors == 1
+	assert stats['sum'].items_in == 99
+	assert stats['sum'].batches == len(batches)
+	assert stats['square'].queue_max <= 4
+
+
+def test_pipeline_overlap():
+	# the second stage must see items before the source is exhausted
+	source_done = threading.Event()
+	seen_early = []
+
+	def source():
+		for i in range(10):
+			yield i
+			time.sleep(0.01)
+		source_done.set()
+
+	def check(x: int) -> list[int]:
+		seen_early.append(not source_done.is_set())
+		return [ x ]
+
+	pipeline = Pipeline(source())
+	pipeline.then('check', check)
+	assert sorted(pipeline.run()) == list(range(10))
+	assert any(seen_early)
+
+
+def test_pipeline_flush():
+	seen = []
+
+	def collect(x: int) -> list[int]:
+		seen.append(x)
+		return []
+
+	pipeline = Pipeline(range(10), maxsize=2)
+	pipeline.then('collect', collect, workers=2, flush=lambda: [ sum(seen) ])
+	pipeline.then('double', lambda x: [ 2 * x ])
+	assert list(pipeline.run()) == [ 90 ]
+	assert { s.name: s.items_out for s in pipeline.stats }['collect'] == 1
+
+
+def test_pipeline_cancel():
+	def source():
+		i = 0
+		while True:
+			yield i
+			i += 1
+
+	pipeline = Pipeline(source(), maxsize=2)
+	pipeline.then('slow', lambda x: [ x ], workers=2)
+	pipeline.batch('batch', lambda xs: xs, size=2)
+	items = pipeline.run()
+	assert len({ next(items) for _ in range(5) }) == 5
+	items.close()
+	# all stages were blocked on full queues
+	assert not [ t for t in threading.enumerate() if t.name.startswith('pipeline-') ]
@@ -0,0 +1,70 @@
+import os
+
+import buildpy.cache
+from buildpy.cache import BuildCache
+from buildpy.config import Config
+from buildpy.pkgbuild import PKGBUILD
+from tests.util import local_pkgbuild
+
+
+def test_local_sources(tmp_path):
+	pkgbuild = local_pkgbuild('foo', base_dir=tmp_path, source=[ 'foo.patch', 'bar::https://example.org/bar.tar.gz',
+	                                                             'git+https://example.org/foo.git', 'sub/foo.conf' ],
+	                          arch=[ 'x86_64' ], source_x86_64=[ 'x86.patch', 'foo.patch' ])
+	pkgbuild.srcinfo.sections[('pkgbase', 'foo')]['install'] = 'foo.install'
+	assert pkgbuild.local_sources() == [ tmp_path/n for n in ('foo.patch', 'foo.conf', 'x86.patch', 'foo.install') ]
+
+
+def test_build_cache(tmp_path):
+	config = Config(cache_root=tmp_path/'cache', build_cache_size=250)
+	cache = buildpy.cache.Cache.from_config(config, 'build')
+	assert isinstance(cache, BuildCache)
+
+	def package(name: str, size: int):
+		path = tmp_path/name
+		path.write_bytes(b'x' * size)
+		return path
+
+	assert cache.get('aa01') is None
+	cache.put('aa01', [ package('a-1-any.pkg.tar.zst', 100), package('a-debug-1-any.pkg.tar.zst', 50) ])
+	cache.put('bb02', [ package('b-1-any.pkg.tar.zst', 100) ])
+	# the cache holds copies: makepkg may overwrite its output in place
+	package('b-1-any.pkg.tar.zst', 10)
+	assert [ (f.name, f.stat().st_size) for f in cache.get('bb02') ] == [ ('b-1-any.pkg.tar.zst', 100) ]
+	assert (cache.hits, cache.misses) == (1, 1)
+	assert sorted((e.key, e.size) for e in cache.entries()) == [ ('aa01', 150), ('bb02', 100) ]
+
+	# least recently used entries are evicted first
+	os.utime(cache._path('aa01'), (0, 0))
+	cache.put('cc03', [ package('c-1-any.pkg.tar.zst', 50) ])
+	assert [ e.key for e in cache.prune() ] == [ 'aa01' ]
+	assert cache.get('aa01') is None
+	# `buildctl cache` sees the entries
+	[ c ] = buildpy.cache.caches(config)
+	assert isinstance(c, BuildCache)
+	assert sorted(e.key for e in c.entries()) == [ 'bb02', 'cc03' ]
+
+
+def test_inputs_hash(tmp_path):
+	(tmp_path/'PKGBUILD').write_text('source ./common.sh\n. "$startdir/lib/vars.sh"\nsource "$dynamic"\npkgname=foo\n')
+	(tmp_path/'common.sh').write_text('pkgver=1\n')
+	(tmp_path/'lib').mkdir()
+	(tmp_path/'lib/vars.sh').write_text('source ./common.sh\n')
+	(tmp_path/'unrelated').write_text('')
+	(tmp_path/'makepkg.conf').write_text('PKGEXT=.pkg.tar.zst\n')
+	pkgbuild = PKGBUILD.from_path(tmp_path, tmp_path/'PKGBUILD')
+	config = Config(makepkg_conf=tmp_path/'makepkg.conf')
+	assert pkgbuild.sourced_files() == [ tmp_path/'common.sh', tmp_path/'lib/vars.sh' ]
+
+	hashes = { pkgbuild.inputs_hash(config=config) }
+	(tmp_path/'unrelated').write_text('changed')
+	assert pkgbuild.inputs_hash(config=config) in hashes
+	for path, text in [ ('PKGBUILD', 'source ./common.sh\n. "$startdir/lib/vars.sh"\npkgname=bar\n'),
+	                    ('common.sh', 'pkgver=2\n'),
+	                    ('lib/vars.sh', 'source ./common.sh\n# changed\n'),
+	                    ('makepkg.conf', 'PKGEXT=.pkg.tar.xz\n') ]:
+		(tmp_path/path).write_text(text)
+		h = pkgbuild.inputs_hash(config=config)
+		assert h not in hashes, path
+		hashes.add(h)
+	assert pkgbuild.inputs_hash(config=Config(makepkg_conf=None)) not in hashes
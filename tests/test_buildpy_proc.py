@@ -0,0 +1,119 @@
+from pathlib import Path
+
+import pytest
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.pkgbuild import PKGBUILD
+import buildpy.proc
+import buildpy.provider
+from buildpy.provider import AURPackageProvider, LocalPackageProvider, SyncPackageProvider
+from tests.util import FakeAUR, aur_package, local_pkgbuild, make_sync_db, stub_makepkg, sync_package
+
+
+# prints the .SRCINFO kept next to the PKGBUILD as `srcinfo`, after `delay` seconds
+MAKEPKG = '''\
+#!/bin/sh
+name=$(basename "$PWD")
+if [ -e delay ]; then
+	sleep "$(cat delay)"
+fi
+echo "$name" >> "$MAKEPKG_LOG"
+if [ -e fail ]; then
+	echo "$name: broken PKGBUILD" >&2
+	exit 1
+fi
+cat srcinfo
+'''
+
+PACMAN_CONF = '''\
+[options]
+
+[core]
+Include = /dev/null
+'''
+
+
+@pytest.fixture
+def makepkg(stub_makepkg) -> Path:
+	return stub_makepkg(MAKEPKG)
+
+
+def write_pkgbuild(root: Path, pkgbase: str, **fields: list[str]) -> Path:
+	base_dir = root/pkgbase
+	base_dir.mkdir(parents=True)
+	(base_dir/'PKGBUILD').write_text(f'pkgname={pkgbase}\n')
+	lines = [ f'pkgbase = {pkgbase}', '\tpkgver = 1.0', '\tpkgrel = 1', '\tarch = any' ]
+	for key, values in fields.items():
+		lines += [ f'\t{key} = {v}' for v in values ]
+	lines += [ '', f'pkgname = {pkgbase}' ]
+	(base_dir/'srcinfo').write_text('\n'.join(lines) + '\n')
+	return base_dir/'PKGBUILD'
+
+
+def test_load_pkgbuilds(tmp_path, makepkg):
+	root = tmp_path/'pkgbuild'
+	pkgbuilds = []
+	for name, delay in [ ('slow', 0.3), ('broken', 0.0), ('fast', 0.0), ('medium', 0.1) ]:
+		pkgbuild_file = write_pkgbuild(root, name)
+		(pkgbuild_file.parent/'delay').write_text(str(delay))
+		pkgbuilds.append(PKGBUILD.from_path(root, pkgbuild_file))
+	(root/'broken'/'fail').touch()
+	config = Config(pkgbuild_root=root, makepkg_conf=None, cache_root=tmp_path/'cache', write_srcinfo=False)
+
+	loaded, errors = buildpy.proc.load_pkgbuilds(pkgbuilds, config, jobs=4)
+	# in the order of input, not of completion
+	assert makepkg.read_text().split() == [ 'broken', 'fast', 'medium', 'slow' ]
+	assert [ p.pkgbase for p in loaded ] == [ 'slow', 'fast', 'medium' ]
+	assert all(p.state & PKGBUILD.State.NameLoaded for p in loaded)
+	[ e ] = errors
+	assert isinstance(e, PKGBUILD.Error) and e.pkgbuild is pkgbuilds[1]
+	assert 'makepkg failed' in str(e)
+
+
+def test_load_pkgbuilds_preloaded(tmp_path, makepkg):
+	# a PKGBUILD with a .SRCINFO, but no names yet
+	pkgbuild = local_pkgbuild('foo', pkgnames=[ 'foo', 'foo-docs' ], base_dir=tmp_path/'foo')
+	pkgbuild.pkgbase = pkgbuild.pkgname = None
+	loaded, errors = buildpy.proc.load_pkgbuilds([ pkgbuild ], Config(cache_root=tmp_path/'cache'))
+	assert loaded == [ pkgbuild ] and errors == []
+	assert (pkgbuild.pkgbase, pkgbuild.pkgname) == ('foo', [ 'foo', 'foo-docs' ])
+	assert not makepkg.exists()
+
+
+@pytest.mark.parametrize('lookup', [ False, True ])
+def test_review_pipeline(tmp_path, monkeypatch, makepkg, lookup):
+	root = tmp_path/'pkgbuild'
+	write_pkgbuild(root, 'app', depends=[ 'zlib-local', 'python' ], makedepends=[ 'aur-tool', 'missing' ])
+	write_pkgbuild(root, 'zlib-local', provides=[ 'zlib' ])
+	write_pkgbuild(root, 'uses-zlib', depends=[ 'zlib', 'python' ])
+
+	lookups = []
+	for cls in (SyncPackageProvider, AURPackageProvider):
+		def load_packages(self, pkgnames, orig=cls.load_packages):
+			lookups.append((self.id, sorted(pkgnames)))
+			return orig(self, pkgnames)
+		monkeypatch.setattr(cls, 'load_packages', load_packages)
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman',
+	                    lambda self, args, **kwargs: make_sync_db(self.db_dir/'sync'/'core.db', [ sync_package('python') ]))
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+	config = Config(pkgbuild_root=root, pacman_conf=tmp_path/'pacman.conf', makepkg_conf=None,
+	                cache_root=tmp_path/'cache', sync_root=tmp_path/'sync', write_srcinfo=False, jobs=2)
+
+	with FakeAUR([ aur_package('aur-tool', id=1) ]) as aur, AppContext(config=config) as ctx:
+		buildpy.provider.setup(ctx)
+		AURPackageProvider.get(ctx).base_url = aur.url
+		pipeline = buildpy.proc.review_pipeline(ctx, lookup=lookup)
+		result = list(pipeline.run())
+		assert not pipeline.errors
+		local = LocalPackageProvider.get(ctx)
+		assert sorted(p.pkgbase for p in local.pkgbases) == [ 'app', 'uses-zlib', 'zlib-local' ]
+
+	if not lookup:
+		assert sorted(p.pkgbase for p in result) == [ 'app', 'uses-zlib', 'zlib-local' ]
+		assert lookups == []
+	else:
+		# dependencies on local PKGBUILDs are never looked up elsewhere, whatever the order of discovery
+		assert lookups == [ ('sync', [ 'aur-tool', 'missing', 'python' ]), ('aur', [ 'aur-tool', 'missing' ]) ]
+		assert [ n for batch in result for n in batch ] == [ 'aur-tool', 'missing' ]
+	assert sorted(makepkg.read_text().split()) == [ 'app', 'uses-zlib', 'zlib-local' ]
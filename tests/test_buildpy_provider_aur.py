@@ -0,0 +1,276 @@
+import contextlib
+import gzip
+import json
+import time
+from collections import abc
+
+import pytest
+
+from buildpy.config import Config
+from buildpy.package import DepSpec
+from buildpy.context import AppContext
+import buildpy.provider.aur
+from buildpy.provider.aur import AURPackageProvider
+from benchmarks.bench_aur_decode import structure_reference
+from tests.util import SEARCH_FIELDS, FakeAUR, aur_package
+
+
+VIRTUAL = [ f'virtual{i}' for i in range(8) ]
+
+PACKAGES = [
+	aur_package('foo', id=1, Depends=[ 'bar' ]),
+	aur_package('bar', id=2, Provides=[ 'virtual0' ]),
+	aur_package('bar-git', id=3, pkgbase='bar-git', Provides=[ 'bar=1.0', 'virtual0' ]),
+] + [
+	aur_package(f'impl{i}', id=10 + i, Provides=[ f'virtual{i}=1.0' ])
+	for i in range(1, len(VIRTUAL))
+]
+
+
+@pytest.fixture
+def make_provider(tmp_path) -> abc.Generator[abc.Callable[..., AURPackageProvider], None, None]:
+	with contextlib.ExitStack() as stack:
+		def _make_provider(aur: FakeAUR, **kwargs) -> AURPackageProvider:
+			kwargs.setdefault('cache_root', tmp_path/'cache')
+			ctx = stack.enter_context(AppContext(config=Config(**kwargs)))
+			provider = AURPackageProvider(ctx)
+			provider.base_url = aur.url
+			return provider
+		yield _make_provider
+
+
+def load_once(aur: FakeAUR, pkgnames: list[str], tmp_path, promote: bool = False, **kwargs) -> AURPackageProvider:
+	# a separate run, sharing the metadata cache with previous ones
+	with AppContext(config=Config(cache_root=tmp_path/'cache', **kwargs)) as ctx:
+		provider = AURPackageProvider(ctx)
+		provider.base_url = aur.url
+		provider.load_packages(pkgnames)
+		if promote:
+			provider.promote(p for name in pkgnames for p in provider.by_provides.get(name, []))
+	return provider
+
+
+def names(pkgnames) -> list[str]:
+	return sorted(p.pkgname for p in pkgnames)
+
+
+@pytest.mark.parametrize('concurrency', [ 1, 4 ])
+def test_aur_load_packages(make_provider, concurrency):
+	with FakeAUR(PACKAGES) as aur:
+		provider = make_provider(aur, aur_concurrency=concurrency)
+		provider.load_packages([ 'foo', 'missing' ] + VIRTUAL)
+
+		assert names(provider.by_pkgname['foo']) == [ 'foo' ]
+		assert provider.by_pkgname['foo'][0].depends == ( DepSpec('bar'), )
+		assert names(provider.by_provides['virtual0']) == [ 'bar', 'bar-git' ]
+		for i in range(1, len(VIRTUAL)):
+			assert names(provider.by_provides[f'virtual{i}']) == [ f'impl{i}' ]
+		assert 'missing' not in provider.by_pkgname
+
+		# candidates found by provides are only loaded partially, without any further requests
+		assert [ path for _, path in aur.requests if path == '/rpc/v5/info' ] == [ '/rpc/v5/info' ]
+		candidates = provider.by_provides['virtual0']
+		assert not any(p.uptodate for p in candidates)
+		assert 'bar' not in provider.by_provides
+
+		provider.promote(candidates)
+		assert all(p.uptodate for p in candidates)
+		assert names(provider.by_provides['virtual0']) == [ 'bar', 'bar-git' ]
+		assert names(provider.by_provides['bar']) == [ 'bar-git' ]
+		assert [ path for _, path in aur.requests if path == '/rpc/v5/info' ] == [ '/rpc/v5/info' ] * 2
+
+
+def test_aur_load_packages_deterministic(make_provider):
+	def load(concurrency: int) -> list[str]:
+		with FakeAUR(PACKAGES) as aur:
+			provider = make_provider(aur, aur_concurrency=concurrency)
+			provider.load_packages(VIRTUAL)
+		return [ p.pkgname for p in provider.pkgnames.values() ]
+
+	assert load(1) == load(8)
+
+
+def test_aur_load_packages_concurrency(make_provider):
+	latency = 0.1
+
+	def load(concurrency: int) -> tuple[float, FakeAUR]:
+		with FakeAUR(PACKAGES, latency=latency) as aur:
+			provider = make_provider(aur, aur_concurrency=concurrency)
+			start = time.perf_counter()
+			provider.load_packages(VIRTUAL)
+			return time.perf_counter() - start, aur
+
+	serial, aur = load(1)
+	nr_searches = sum(1 for _, path in aur.requests if path.startswith('/rpc/v5/search/'))
+	assert nr_searches == len(VIRTUAL)
+	assert aur.max_concurrent == 1
+	assert serial >= nr_searches * latency
+
+	parallel, aur = load(len(VIRTUAL))
+	assert aur.max_concurrent == len(VIRTUAL)
+	# searches overlap: wall time no longer grows with the number of targets
+	assert parallel < serial / 2
+
+
+def test_aur_info_chunked(make_provider):
+	packages = [ aur_package(f'pkg{i:03}', id=100 + i) for i in range(95) ]
+	with FakeAUR(packages) as aur:
+		provider = make_provider(aur, aur_info_chunk=10, aur_concurrency=3)
+		provider.load_packages([ p['Name'] for p in packages ])
+
+	assert names(provider.pkgnames.values()) == sorted(p['Name'] for p in packages)
+	info_requests = [ path for _, path in aur.requests if path == '/rpc/v5/info' ]
+	assert len(info_requests) == 10
+	assert aur.max_concurrent <= 3
+
+
+def test_aur_retry(make_provider):
+	with FakeAUR(PACKAGES) as aur:
+		aur.statuses = [ 429, 503 ]
+		provider = make_provider(aur, aur_retries=2, aur_backoff=0.01)
+		provider.load_packages([ 'foo' ])
+		assert names(provider.by_pkgname['foo']) == [ 'foo' ]
+		assert [ path for _, path in aur.requests ] == [ '/rpc/v5/info' ] * 3
+
+		# retries exhausted
+		aur.statuses = [ 503 ] * 3
+		provider = make_provider(aur, aur_retries=2, aur_backoff=0.01)
+		with pytest.raises(AURPackageProvider.Error, match='503'):
+			provider.load_packages([ 'bar' ])
+		assert aur.statuses == []
+
+
+def test_aur_timeout(make_provider, monkeypatch):
+	with FakeAUR(PACKAGES, latency=0.5) as aur:
+		provider = make_provider(aur, aur_timeout=0.1, aur_retries=0)
+		timeouts = []
+		orig = provider.session.request
+
+		def request(*args, **kwargs):
+			timeouts.append(kwargs.get('timeout'))
+			return orig(*args, **kwargs)
+
+		monkeypatch.setattr(provider.session, 'request', request)
+		start = time.perf_counter()
+		with pytest.raises(AURPackageProvider.Error, match='timed out'):
+			provider.load_packages([ 'foo' ])
+		assert time.perf_counter() - start < 0.5
+		assert timeouts == [ 0.1 ]
+
+
+def test_aur_metadata_cache(tmp_path):
+	targets = [ 'foo', 'missing', 'virtual1' ]
+	with FakeAUR(PACKAGES) as aur:
+		load_once(aur, targets, tmp_path)
+		assert aur.requests
+		aur.requests.clear()
+
+		# warm run: everything (including negative results) is answered from the cache
+		provider = load_once(aur, targets, tmp_path)
+		assert aur.requests == []
+		assert names(provider.by_provides['virtual1']) == [ 'impl1' ]
+		assert 'missing' not in provider.by_pkgname
+
+		# stale entries are fetched again
+		load_once(aur, targets, tmp_path, aur_cache_ttl=0)
+		assert aur.requests
+
+
+def test_aur_metadata_cache_revalidate(tmp_path):
+	packages = [ aur_package('impl', id=1, Provides=[ 'virtual' ]) ]
+
+	def load(**kwargs) -> AURPackageProvider:
+		return load_once(aur, [ 'virtual' ], tmp_path, promote=True, **kwargs)
+
+	with FakeAUR(packages) as aur:
+		load()
+		aur.requests.clear()
+
+		# unchanged LastModified in the search result: the cached info result is reused
+		load(aur_cache_ttl=0)
+		assert [ path for _, path in aur.requests ] == [ '/rpc/v5/info', '/rpc/v5/search/virtual' ]
+		aur.requests.clear()
+
+		packages[0]['LastModified'] += 1
+		packages[0]['Provides'] = [ 'virtual', 'other' ]
+		provider = load(aur_cache_ttl=0)
+		assert [ path for _, path in aur.requests ] == [ '/rpc/v5/info', '/rpc/v5/search/virtual', '/rpc/v5/info' ]
+		assert names(provider.by_provides['other']) == [ 'impl' ]
+
+
+def test_aur_metadata_cache_offline(tmp_path):
+	with FakeAUR(PACKAGES) as aur:
+		load_once(aur, [ 'foo', 'virtual1' ], tmp_path)
+	# the server is gone
+	provider = load_once(aur, [ 'foo', 'virtual1', 'bar' ], tmp_path, aur_offline=True, aur_cache_ttl=0)
+	assert names(provider.by_pkgname['foo']) == [ 'foo' ]
+	assert names(provider.by_provides['virtual1']) == [ 'impl1' ]
+	# not cached: unknown
+	assert 'bar' not in provider.by_pkgname
+
+
+@pytest.mark.parametrize('remote', [ False, True ])
+def test_aur_load_archive(make_provider, tmp_path, remote):
+	with FakeAUR(PACKAGES) as aur:
+		if remote:
+			archive = aur.url + AURPackageProvider.archive_path
+		else:
+			archive = tmp_path/'packages-meta-ext-v1.json.gz'
+			archive.write_bytes(aur.archive())
+		provider = make_provider(aur, aur_archive=str(archive))
+		provider.load_packages([ 'foo', 'missing' ])
+		provider.load_packages(VIRTUAL)
+
+	assert provider.complete
+	# the archive is fetched at most once, the RPC is not used
+	assert [ path for _, path in aur.requests ] == ([ AURPackageProvider.archive_path ] if remote else [])
+	assert names(provider.pkgnames.values()) == sorted(p['Name'] for p in PACKAGES)
+	assert provider.by_pkgname['foo'][0].depends == ( DepSpec('bar'), )
+	assert names(provider.by_provides['virtual0']) == [ 'bar', 'bar-git' ]
+	assert 'missing' not in provider.by_pkgname
+
+
+def test_aur_load_archive_offline(make_provider, tmp_path):
+	with FakeAUR(PACKAGES) as aur:
+		provider = make_provider(aur, aur_archive=aur.url + AURPackageProvider.archive_path, aur_offline=True)
+		with pytest.raises(AURPackageProvider.Error, match='offline'):
+			provider.load_packages([ 'foo' ])
+		assert aur.requests == []
+
+		# local files are fine
+		archive = tmp_path/'packages-meta-ext-v1.json.gz'
+		archive.write_bytes(aur.archive())
+		provider = make_provider(aur, aur_archive=str(archive), aur_offline=True)
+		provider.load_packages([ 'foo' ])
+		assert names(provider.by_pkgname['foo']) == [ 'foo' ]
+
+
+def test_aur_load_archive_invalid(make_provider, tmp_path):
+	archive = tmp_path/'packages-meta-ext-v1.json.gz'
+	archive.write_bytes(gzip.compress(b'[{"Name": "foo"'))
+	with FakeAUR([]) as aur:
+		provider = make_provider(aur, aur_archive=str(archive))
+		with pytest.raises(AURPackageProvider.Error, match='Cannot load archive'):
+			provider.load_packages([ 'foo' ])
+
+
+def test_aur_decode_response():
+	results = PACKAGES + [ aur_package('minimal', id=100) ]
+	for obj in [
+		{ 'version': 5, 'type': 'multiinfo', 'resultcount': len(results), 'results': results },
+		{ 'version': 5, 'type': 'search', 'resultcount': len(results),
+		  'results': [ { k: p[k] for k in SEARCH_FIELDS } for p in results ] },
+		{ 'version': 5, 'type': 'error', 'resultcount': 0, 'results': [], 'error': 'Incorrect request type specified.' },
+	]:
+		fast = buildpy.provider.aur.decode_response(json.dumps(obj).encode())
+		full = structure_reference(obj)
+		assert type(fast) is type(full)
+		assert (fast.version, fast.resultcount) == (full.version, full.resultcount)
+		for f, r in zip(fast.results, full.results, strict=True):
+			# fields used by the provider are decoded identically
+			for name in ('ID', 'Name', 'PackageBaseID', 'PackageBase', 'Version', 'LastModified',
+			             'Depends', 'MakeDepends', 'OptDepends', 'Provides'):
+				assert getattr(f, name, None) == getattr(r, name, None)
+
+	with pytest.raises(ValueError):
+		buildpy.provider.aur.decode_response(b'{"version": 5, "type": "bogus"}')
@@ -0,0 +1,61 @@
+import pytest
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+import buildpy.provider
+from buildpy.provider import LocalPackageProvider
+from buildpy.rebuild import RepoDB, needs_rebuild
+from tests.util import local_pkgbuild, make_sync_db, no_external, sync_package
+
+
+LOCAL = [
+	local_pkgbuild('app', '1.0-1', depends=[ 'libfoo', 'glibc' ]),
+	local_pkgbuild('foo', '2.0-1', pkgnames=[ 'libfoo', 'foo-utils' ]),
+	local_pkgbuild('tool', '1.1-1', makedepends=[ 'app', 'aur-tool' ]),
+	local_pkgbuild('bar', '1.0-2'),
+	local_pkgbuild('new', '0.1-1'),
+	local_pkgbuild('old', '1.0-1'),
+]
+REPO = [
+	sync_package('app', '1.0-1'),
+	sync_package('libfoo', '1.9-1', BASE='foo'),
+	sync_package('foo-utils', '1.9-1', BASE='foo'),
+	sync_package('tool', '1.1-1'),
+	sync_package('bar', '1.0-1'),
+	sync_package('old', '1:0.5-1'),
+]
+
+
+def test_needs_rebuild(tmp_path, no_external):
+	repo = RepoDB.load('custom', make_sync_db(tmp_path/'custom.db', REPO))
+	assert repo.versions['foo'] == '1.9-1'
+
+	(tmp_path/'pacman.conf').write_text('[options]\n\n[core]\nInclude = /dev/null\n')
+	config = Config(pacman_conf=tmp_path/'pacman.conf', sync_root=tmp_path/'sync', cache_root=tmp_path/'cache')
+	with AppContext(config=config) as ctx:
+		# all providers are there, but only local dependencies matter: nothing is run or fetched
+		buildpy.provider.setup(ctx)
+		LocalPackageProvider.get(ctx).load_pkgbuilds(LOCAL)
+		needed = { p.pkgbase: reason for p, reason in needs_rebuild(ctx, repo).items() }
+	assert no_external == []
+
+	assert needed == {
+		'app': 'depends on foo',
+		'foo': '1.9-1 -> 2.0-1',
+		'tool': 'depends on app',
+		'bar': '1.0-1 -> 1.0-2',
+		'new': 'not in repository',
+	}
+
+
+def test_repo_db_path(tmp_path):
+	pacman_conf = tmp_path/'pacman.conf'
+	pacman_conf.write_text(f'[options]\n\n[core]\nServer = file:///srv/core\n\n[custom]\nServer = file://{tmp_path}/$repo\n')
+	assert RepoDB.path_from_config(Config(pacman_conf=pacman_conf)) == tmp_path/'custom'/'custom.db'
+	assert RepoDB.path_from_config(Config(pacman_conf=pacman_conf, repo_db=tmp_path/'x.db')) == tmp_path/'x.db'
+	# a repository that does not exist yet is empty
+	assert RepoDB.from_config(Config(pacman_conf=pacman_conf)).versions == {}
+
+	pacman_conf.write_text('[options]\n\n[custom]\nServer = https://example.org/custom\n')
+	with pytest.raises(RepoDB.Error, match='no local'):
+		RepoDB.from_config(Config(pacman_conf=pacman_conf))
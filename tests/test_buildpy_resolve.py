@@ -0,0 +1,90 @@
+import pytest
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.package import DepSpec
+import buildpy.provider
+from buildpy.provider import AURPackageProvider, LocalPackageProvider, SyncPackageProvider
+from buildpy.resolve import DepGraph
+from tests.util import FakeAUR, aur_package, local_pkgbuild, make_sync_db, sync_package
+
+
+LOCAL = [
+	local_pkgbuild('app', depends=[ 'libfoo', 'python>=3', 'missing' ], makedepends=[ 'cmake', 'aur-tool', 'bar>=2' ]),
+	local_pkgbuild('foo', pkgnames=[ 'libfoo', 'foo-docs' ], makedepends=[ 'python' ]),
+]
+SYNC = [
+	sync_package('libfoo', '0.9-1'),
+	sync_package('python', '3.12.4-1'),
+	sync_package('cmake', '3.30.0-1', DEPENDS=[ 'not-in-graph' ]),
+	sync_package('glibc', '2.39-1'),
+	sync_package('bar', '1.0-1'),
+]
+AUR = [
+	aur_package('aur-tool', id=1, Depends=[ 'aur-lib' ]),
+	aur_package('aur-lib', id=2, Depends=[ 'glibc' ], MakeDepends=[ 'virtual-dep>=2' ]),
+	aur_package('impl-old', id=3, Provides=[ 'virtual-dep=1.0' ]),
+	aur_package('impl', id=4, Provides=[ 'virtual-dep=2.0' ]),
+	aur_package('bar', id=5, version='2.0-1'),
+]
+
+PACMAN_CONF = '''\
+[options]
+
+[core]
+Include = /dev/null
+'''
+
+
+@pytest.fixture
+def ctx(tmp_path, monkeypatch):
+	def run_pacman(self, args, **kwargs):
+		make_sync_db(self.db_dir/'sync'/'core.db', SYNC)
+
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman', run_pacman)
+	(tmp_path/'pacman.conf').write_text(PACMAN_CONF)
+	config = Config(pacman_conf=tmp_path/'pacman.conf', sync_root=tmp_path/'sync', cache_root=tmp_path/'cache')
+	with FakeAUR(AUR) as aur, AppContext(config=config) as ctx:
+		buildpy.provider.setup(ctx)
+		AURPackageProvider.get(ctx).base_url = aur.url
+		LocalPackageProvider.get(ctx).load_pkgbuilds(LOCAL)
+		yield ctx
+
+
+def test_depgraph(ctx):
+	graph = DepGraph.get(ctx)
+	local = LocalPackageProvider.get(ctx)
+	app, foo = local.pkgbases
+
+	def provider(spec: str) -> str:
+		return graph.resolved[DepSpec.parse(spec)].pkgbase.provider.id
+
+	# local > sync > AUR
+	assert provider('libfoo') == 'local'
+	assert provider('python>=3') == 'sync'
+	assert provider('aur-tool') == 'aur'
+	# version constraints are checked, also for provisions
+	assert provider('bar>=2') == 'aur'
+	assert graph.resolved[DepSpec.parse('virtual-dep>=2')].pkgname == 'impl'
+
+	# AUR packages are built too, so their dependencies are resolved in turn; those of sync packages are not
+	assert [ p.pkgbase for p in graph.pkgbases ] == [ 'app', 'foo', 'aur-tool', 'bar', 'aur-lib', 'impl' ]
+	assert provider('glibc') == 'sync'
+	assert DepSpec.parse('not-in-graph') not in graph.resolved
+	assert [ p.pkgbase for p in graph.dependencies(app) ] == [ 'foo', 'aur-tool', 'bar' ]
+	assert [ p.pkgbase for p in graph.dependencies(app, kinds=[ 'depends' ]) ] == [ 'foo' ]
+	assert graph.dependencies(foo) == []
+	assert graph.unresolved() == { DepSpec('missing'): [ app ] }
+
+	# one batched lookup per provider and round
+	assert graph.lookups == { 'local': 3, 'sync': 3, 'aur': 3 }
+
+
+def test_depgraph_memoized(ctx):
+	graph = DepGraph.get(ctx)
+	assert DepGraph.get(ctx) is graph
+
+	LocalPackageProvider.get(ctx).load_pkgbuild(local_pkgbuild('missing'))
+	graph = DepGraph.get(ctx)
+	assert DepGraph.get(ctx) is graph
+	assert graph.unresolved() == {}
@@ -0,0 +1,115 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+import buildpy.scan
+from buildpy.config import Config
+from buildpy.scan import ScanIndex
+
+
+PKGBUILDS = [
+	'foo/PKGBUILD',
+	'group/bar/PKGBUILD',
+	'group/baz/trunk/PKGBUILD',
+	'group/deep/er/qux/PKGBUILD',
+]
+OTHER_FILES = [
+	'README',
+	'foo/src/nested/PKGBUILD',
+	'group/bar/pkg/bar/PKGBUILD',
+	'.git/objects/PKGBUILD',
+	'src/ignored/PKGBUILD',
+	'empty/.keep',
+]
+
+
+def age(*paths: Path):
+	# make directories old enough not to be considered racy
+	# (but keep mtimes distinct between calls)
+	t = time.time_ns() - 3600 * 10**9
+	for p in paths:
+		os.utime(p, ns=(t, t))
+
+
+@pytest.fixture
+def config(tmp_path) -> Config:
+	root = tmp_path/'pkgbuild'
+	for f in PKGBUILDS + OTHER_FILES:
+		(root/f).parent.mkdir(parents=True, exist_ok=True)
+		(root/f).touch()
+	age(*( Path(path) for path, dirs, files in os.walk(root) ))
+	return Config(pkgbuild_root=root, cache_root=tmp_path/'cache')
+
+
+@pytest.fixture
+def scandir_calls(monkeypatch) -> list[str]:
+	calls = []
+	orig = os.scandir
+
+	def scandir(path):
+		calls.append(os.path.relpath(path, os.path.dirname(path)))
+		return orig(path)
+
+	monkeypatch.setattr(buildpy.scan.os, 'scandir', scandir)
+	return calls
+
+
+def scan(config: Config, jobs: int = 1) -> list[str]:
+	index = ScanIndex.load(config)
+	ret = [ str(pkgbuild_file.relative_to(config.pkgbuild_root)) for _, pkgbuild_file in index.scan(jobs=jobs) ]
+	index.save(config)
+	return sorted(ret)
+
+
+@pytest.mark.parametrize('jobs', [ 1, 4 ])
+def test_scan(config, jobs):
+	assert scan(config, jobs=jobs) == PKGBUILDS
+	assert scan(config, jobs=jobs) == PKGBUILDS
+
+
+def test_scan_no_index(config, scandir_calls):
+	config.scan_index = False
+	assert scan(config, jobs=4) == PKGBUILDS
+	nr_calls = len(scandir_calls)
+	assert scan(config, jobs=4) == PKGBUILDS
+	assert len(scandir_calls) == 2 * nr_calls
+
+
+def test_scan_index_reused(config, scandir_calls):
+	scan(config)
+	assert scandir_calls
+	scandir_calls.clear()
+	assert scan(config) == PKGBUILDS
+	assert scandir_calls == []
+
+
+@pytest.mark.parametrize('jobs', [ 1, 4 ])
+def test_scan_index_changes(config, scandir_calls, jobs):
+	root = config.pkgbuild_root
+	scan(config, jobs=jobs)
+
+	(root/'group'/'new').mkdir()
+	(root/'group'/'new'/'PKGBUILD').touch()
+	(root/'foo'/'PKGBUILD').unlink()
+	(root/'group'/'baz'/'trunk'/'PKGBUILD').rename(root/'group'/'baz'/'trunk'/'PKGBUILD.old')
+	age(root/'group', root/'group'/'new', root/'foo', root/'group'/'baz'/'trunk')
+	scandir_calls.clear()
+
+	assert scan(config, jobs=jobs) == [
+		'group/bar/PKGBUILD',
+		'group/deep/er/qux/PKGBUILD',
+		'group/new/PKGBUILD',
+	]
+	# only changed directories are listed again
+	assert sorted(scandir_calls) == [ 'baz', 'foo', 'group', 'new', 'trunk' ]
+
+
+def test_scan_racy(config, scandir_calls):
+	scan(config)
+	(config.pkgbuild_root/'foo'/'PKGBUILD').unlink()
+	scandir_calls.clear()
+	assert scan(config) == PKGBUILDS[1:]
+	(config.pkgbuild_root/'foo'/'PKGBUILD').touch()
+	assert scan(config) == PKGBUILDS
@@ -0,0 +1,219 @@
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from buildpy.config import Config
+from buildpy.context import AppContext
+from buildpy.cache import BuildCache
+import buildpy.proc
+import buildpy.provider
+from buildpy.provider import LocalPackageProvider
+from buildpy.schedule import BuildJob, BuildScheduler, JobState
+from tests.util import local_pkgbuild, no_external, stub_makepkg
+
+
+def jobs(deps: dict[str, list[str]]) -> dict[str, BuildJob]:
+	ret = { name: BuildJob(name=name, target=None) for name in deps }
+	for name, names in deps.items():
+		ret[name].deps = [ ret[n] for n in names ]
+	return ret
+
+
+def test_scheduler_cycles():
+	j = jobs({ 'a': [ 'b' ], 'b': [ 'c' ], 'c': [ 'a' ], 'd': [ 'a', 'e' ], 'e': [ 'f' ], 'f': [ 'e' ], 'g': [] })
+	with pytest.raises(BuildScheduler.Error) as e:
+		BuildScheduler(list(j.values()), cpus=2)
+	assert sorted(sorted(job.name for job in c) for c in e.value.cycles) == [ [ 'a', 'b', 'c' ], [ 'e', 'f' ] ]
+	assert 'dependency cycles' in str(e.value)
+
+
+def test_scheduler_budget():
+	j = jobs({ 'a': [], 'b': [], 'c': [], 'big': [], 'd': [ 'a' ] })
+	j['big'].cpus = 8
+	j['a'].memory = j['b'].memory = j['c'].memory = 3
+	started = []
+	scheduler = BuildScheduler(list(j.values()), cpus=4, memory=6)
+	# critical path first
+	assert j['a'].priority == 2.0
+
+	running = set()
+	concurrent = []
+	lock = threading.Lock()
+
+	def build(job: BuildJob):
+		with lock:
+			running.add(job.name)
+			started.append(job.name)
+			concurrent.append(sorted(running))
+		try:
+			time.sleep(0.05)
+			if job.name == 'c':
+				raise RuntimeError('failed')
+		finally:
+			with lock:
+				running.discard(job.name)
+
+	scheduler.run(build)
+	assert started[0] == 'a'
+	# memory: at most two of a, b, c at a time; the job larger than the budget runs alone
+	assert all(len(set(r) & { 'a', 'b', 'c' }) <= 2 for r in concurrent)
+	assert [ 'big' ] in concurrent
+	assert scheduler.failed == [ j['c'] ]
+	assert str(j['c'].error) == 'failed'
+	assert j['d'].state is JobState.Done
+
+
+def test_build_scheduler_local_only(tmp_path, no_external):
+	pkgbuilds = [
+		local_pkgbuild('app', depends=[ 'libfoo>=2', 'glibc' ], makedepends=[ 'aur-tool' ]),
+		local_pkgbuild('foo', '2.0-1', pkgnames=[ 'libfoo', 'foo-docs' ], makedepends=[ 'cmake' ]),
+		local_pkgbuild('old-dep', depends=[ 'libfoo<2' ]),
+	]
+	(tmp_path/'pacman.conf').write_text('[options]\n\n[core]\nInclude = /dev/null\n')
+	config = Config(pacman_conf=tmp_path/'pacman.conf', sync_root=tmp_path/'sync', cache_root=tmp_path/'cache')
+	with AppContext(config=config) as ctx:
+		buildpy.provider.setup(ctx)
+		LocalPackageProvider.get(ctx).load_pkgbuilds(pkgbuilds)
+		scheduler = buildpy.proc.build_scheduler(ctx, pkgbuilds)
+
+	deps = { j.name: [ d.name for d in j.deps ] for j in scheduler.jobs }
+	assert deps == { 'app': [ 'foo' ], 'foo': [], 'old-dep': [] }
+	# dependencies on other providers' packages are left to the build
+	assert no_external == []
+
+
+MAKEPKG = '''\
+#!/bin/sh
+name=$(basename "$PWD")
+for arg; do
+	if [ "$arg" = --packagelist ]; then
+		echo "$PWD/$name-1.0-1-any.pkg.tar.zst"
+		exit 0
+	fi
+done
+echo "start $name $MAKEFLAGS" >> "$MAKEPKG_LOG"
+sleep "$(cat duration)"
+echo "end $name" >> "$MAKEPKG_LOG"
+if [ -e fail ]; then
+	echo "$name: build failed"
+	exit 1
+fi
+echo "$name $(cat version 2>/dev/null)" > "$name-1.0-1-any.pkg.tar.zst"
+'''
+
+
+@pytest.fixture
+def makepkg(stub_makepkg) -> Path:
+	return stub_makepkg(MAKEPKG)
+
+
+def test_build_pkgbuilds(tmp_path, makepkg):
+	def pkgbuild(name: str, duration: float, fail: bool = False, **fields):
+		base_dir = tmp_path/'pkgbuild'/name
+		base_dir.mkdir(parents=True)
+		(base_dir/'duration').write_text(str(duration))
+		if fail:
+			(base_dir/'fail').touch()
+		return local_pkgbuild(name, base_dir=base_dir, **fields)
+
+	pkgbuilds = [
+		pkgbuild('app', 0.1, depends=[ 'lib2', 'small' ]),
+		pkgbuild('small', 0.1),
+		pkgbuild('lib2', 0.3, makedepends=[ 'lib1' ]),
+		pkgbuild('lib1', 0.3),
+		pkgbuild('other', 0.1),
+		pkgbuild('broken', 0.1, fail=True),
+		pkgbuild('needs-broken', 0.1, depends=[ 'broken' ]),
+	]
+	config = Config(cache_root=tmp_path/'cache', build_log_root=tmp_path/'logs', makepkg_conf=None, jobs=2)
+
+	def build() -> tuple[BuildScheduler, list[list[str]]]:
+		makepkg.unlink(missing_ok=True)
+		with AppContext(config=config) as ctx:
+			ctx.providers[LocalPackageProvider] = LocalPackageProvider(ctx)
+			LocalPackageProvider.get(ctx).load_pkgbuilds(pkgbuilds)
+			scheduler = buildpy.proc.build_scheduler(ctx, pkgbuilds)
+			buildpy.proc.build_pkgbuilds(ctx, scheduler)
+		return scheduler, [ line.split() for line in makepkg.read_text().splitlines() ]
+
+	scheduler, log = build()
+	events = [ (e[0], e[1]) for e in log ]
+
+	# dependencies finish before dependants start
+	for name, deps in [ ('app', [ 'lib2', 'small' ]), ('lib2', [ 'lib1' ]) ]:
+		for dep in deps:
+			assert events.index(('end', dep)) < events.index(('start', name))
+	# the critical path goes first; no more than `jobs` builds at a time
+	assert sorted(events[:2]) == [ ('start', 'lib1'), ('start', 'small') ]
+	running = 0
+	for kind, _ in events:
+		running += 1 if kind == 'start' else -1
+		assert running <= 2
+	assert all(e[2] == '-j1' for e in log if e[0] == 'start')
+
+	assert [ j.name for j in scheduler.failed ] == [ 'broken' ]
+	# output goes to per-pkgbase logs, which errors refer to
+	assert str(tmp_path/'logs'/'broken.log') in str(scheduler.failed[0].error)
+	assert (tmp_path/'logs'/'broken.log').read_text() == 'broken: build failed\n'
+	assert (tmp_path/'logs'/'app.log').exists()
+	assert [ j.name for j in scheduler.skipped ] == [ 'needs-broken' ]
+	assert ('start', 'needs-broken') not in events
+
+	# durations of previous builds are used for planning
+	scheduler, log = build()
+	jobs = { j.name: j for j in scheduler.jobs }
+	assert jobs['lib1'].cost > jobs['small'].cost
+	assert jobs['lib1'].priority == pytest.approx(jobs['lib1'].cost + jobs['lib2'].cost + jobs['app'].cost)
+
+
+def test_build_pkgbuilds_cache(tmp_path, monkeypatch, makepkg):
+	monkeypatch.delenv('PACKAGER', raising=False)
+
+	def pkgbuild(name: str, **fields):
+		base_dir = tmp_path/'pkgbuild'/name
+		base_dir.mkdir(parents=True)
+		(base_dir/'PKGBUILD').write_text(f'pkgname={name}\n')
+		(base_dir/'duration').write_text('0')
+		return local_pkgbuild(name, base_dir=base_dir, **fields)
+
+	pkgbuilds = [ pkgbuild('lib'), pkgbuild('app', depends=[ 'lib' ]), pkgbuild('other') ]
+	config = Config(cache_root=tmp_path/'cache', build_log_root=tmp_path/'logs', makepkg_conf=None)
+
+	def build(local: list = pkgbuilds, makepkg_args: tuple[str, ...] = ()) -> list[str]:
+		makepkg.unlink(missing_ok=True)
+		with AppContext(config=config) as ctx:
+			ctx.providers[LocalPackageProvider] = LocalPackageProvider(ctx)
+			LocalPackageProvider.get(ctx).load_pkgbuilds(local)
+			scheduler = buildpy.proc.build_scheduler(ctx, pkgbuilds)
+			cache = BuildCache.from_config(config, 'build')
+			buildpy.proc.build_pkgbuilds(ctx, scheduler, makepkg_args, cache=cache)
+			assert not scheduler.failed
+		return sorted(line.split()[1] for line in makepkg.read_text().splitlines() if line.startswith('start')) \
+			if makepkg.exists() else []
+
+	assert build() == [ 'app', 'lib', 'other' ]
+	package = tmp_path/'pkgbuild'/'app'/'app-1.0-1-any.pkg.tar.zst'
+	package.unlink()
+	# identical inputs: packages are restored from the cache
+	assert build() == []
+	assert package.read_text() == 'app \n'
+
+	# changed inputs: the PKGBUILD itself, or a local source
+	(tmp_path/'pkgbuild'/'other'/'PKGBUILD').write_text('pkgname=other\npkgrel=2\n')
+	(tmp_path/'pkgbuild'/'lib'/'version').write_text('2')
+	pkgbuilds[0].srcinfo.sections[('pkgbase', 'lib')]['source'] = [ 'version' ]
+	assert build() == [ 'lib', 'other' ]
+	assert package.read_text() == 'app \n'
+
+	# changed dependency versions
+	(tmp_path/'pkgbuild'/'lib'/'PKGBUILD').write_text('pkgname=lib\npkgrel=2\n')
+	pkgbuilds[0].srcinfo.sections[('pkgbase', 'lib')]['pkgrel'] = '2'
+	assert build() == [ 'app', 'lib' ]
+
+	# different makepkg arguments or environment
+	assert build(makepkg_args=('--nocheck',)) == [ 'app', 'lib', 'other' ]
+	assert build(makepkg_args=('--nocheck',)) == []
+	monkeypatch.setenv('PACKAGER', 'Someone Else <else@example.org>')
+	assert build() == [ 'app', 'lib', 'other' ]
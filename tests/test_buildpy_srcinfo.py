@@ -0,0 +1,183 @@
+import os
+from pathlib import Path
+import subprocess
+
+import pytest
+
+import buildpy.util
+from buildpy.cache import Cache
+from buildpy.config import Config
+from buildpy.pkgbuild import PKGBUILD
+from buildpy.srcinfo import SRCINFO, SrcinfoSectionHeader
+from benchmarks.bench_srcinfo import from_lines_reference
+from tests.util import stub_makepkg
+
+
+CORPUS = Path(__file__).parent/'data'/'srcinfo'
+
+
+@pytest.fixture
+def pkgbuild(tmp_path) -> PKGBUILD:
+	return PKGBUILD.from_path(tmp_path, tmp_path/'PKGBUILD')
+
+
+def parse(text: str, pkgbuild: PKGBUILD) -> SRCINFO:
+	return SRCINFO.from_lines(text.splitlines(), pkgbuild=pkgbuild)
+
+
+def parse_result(fn, text: str, pkgbuild: PKGBUILD):
+	try:
+		return fn(text.splitlines(), pkgbuild=pkgbuild)
+	except Exception as e:
+		return type(e), str(e)
+
+
+@pytest.mark.parametrize('path', sorted(CORPUS.iterdir()), ids=lambda p: p.name)
+def test_srcinfo_corpus(path, pkgbuild):
+	text = path.read_text()
+	assert parse(text, pkgbuild) == from_lines_reference(text.splitlines(), pkgbuild=pkgbuild)
+
+
+def test_srcinfo_split(pkgbuild):
+	srcinfo = parse((CORPUS/'python-pyqt5.SRCINFO').read_text(), pkgbuild)
+	assert srcinfo.headers == {
+		'pkgbase': 'pyqt5',
+		'pkgname': [ 'python-pyqt5', 'python-pyqt5-webkit', 'python-pyqt5-3d' ],
+	}
+	pkgbase = srcinfo.sections[SrcinfoSectionHeader('pkgbase', 'pyqt5')]
+	assert pkgbase['pkgver'] == '5.15.10'
+	assert pkgbase['source'][1] == 'restore-qt5-webkit.patch'
+	# empty value overrides pkgbase-level list
+	assert srcinfo.sections[SrcinfoSectionHeader('pkgname', 'python-pyqt5-3d')]['groups'] == []
+
+
+def test_srcinfo_arch(pkgbuild):
+	srcinfo = parse((CORPUS/'visual-studio-code-bin.SRCINFO').read_text(), pkgbuild)
+	pkgbase = srcinfo.sections[SrcinfoSectionHeader('pkgbase', 'visual-studio-code-bin')]
+	assert pkgbase['epoch'] == '1'
+	assert pkgbase['source_aarch64'] == [ 'code_arm64_1.92.2.tar.gz::https://update.code.visualstudio.com/1.92.2/linux-arm64/stable' ]
+
+
+BAD_SRCINFO = {
+	'bad line': 'pkgbase = foo\n\tfoo bar\n',
+	'bad key': 'pkgbase = foo\n\tfoo-bar = baz\n',
+	'no key': 'pkgbase = foo\n\t= baz\n',
+	'key without value': 'pkgbase\n',
+	'duplicate section': 'pkgbase = foo\n\npkgname = foo\n\npkgname = foo\n',
+	'multiple pkgbase': 'pkgbase = foo\n\npkgbase = bar\n',
+	'key before section': '\tpkgver = 1\npkgbase = foo\n',
+	'pkgbase-only key': 'pkgbase = foo\n\tarch = any\n\npkgname = foo\n\tpkgrel = 1\n',
+	'non-unique key': 'pkgbase = foo\n\tpkgdesc = a\n\tpkgdesc = b\n',
+	'unknown key': 'pkgbase = foo\n\tarch = any\n\tfoo = bar\n',
+	'unknown arch': 'pkgbase = foo\n\tarch = any\n\tdepends_x86_64 = bar\n',
+	'unknown arch key': 'pkgbase = foo\n\tarch = x86_64\n\tpkgdesc_x86_64 = bar\n',
+	'arch after key': 'pkgbase = foo\n\tdepends_x86_64 = bar\n\tarch = x86_64\n',
+	'pkgname arch': 'pkgbase = foo\n\tarch = any\n\npkgname = foo\n\tarch = x86_64\n\tdepends_x86_64 = bar\n',
+	'pkgname no arch': 'pkgbase = foo\n\tarch = x86_64\n\npkgname = foo\n\tdepends_x86_64 = bar\n\tdepends_i686 = bar\n',
+}
+
+
+@pytest.mark.parametrize('text', BAD_SRCINFO.values(), ids=BAD_SRCINFO.keys())
+def test_srcinfo_errors(text, pkgbuild):
+	assert parse_result(SRCINFO.from_lines, text, pkgbuild) == parse_result(from_lines_reference, text, pkgbuild)
+
+
+def test_srcinfo_error_type(pkgbuild):
+	with pytest.raises(PKGBUILD.Error, match='duplicate section'):
+		parse(BAD_SRCINFO['duplicate section'], pkgbuild)
+
+
+# prints `srcinfo` from the PKGBUILD directory; with a `wait` file, only once a `go` file appears after the
+# first line, and with a `fail` file, fails after printing it
+MAKEPKG = '''\
+#!/bin/sh
+echo "$(basename "$PWD")" >> "$MAKEPKG_LOG"
+head -n 1 srcinfo
+if [ -e wait ]; then
+	i=0
+	while [ ! -e go ]; do
+		i=$((i + 1))
+		if [ $i -gt 100 ]; then
+			exit 2
+		fi
+		sleep 0.05
+	done
+fi
+tail -n +2 srcinfo
+if [ -e fail ]; then
+	exit 1
+fi
+'''
+
+SIMPLE_SRCINFO = '''\
+pkgbase = foo
+\tpkgver = 1.0
+\tpkgrel = 1
+\tarch = any
+
+pkgname = foo
+'''
+
+
+@pytest.fixture
+def makepkg(stub_makepkg) -> Path:
+	return stub_makepkg(MAKEPKG)
+
+
+def test_srcinfo_cache(tmp_path, pkgbuild, makepkg):
+	(tmp_path/'PKGBUILD').write_text('pkgname=foo\n')
+	(tmp_path/'srcinfo').write_text(SIMPLE_SRCINFO)
+	config = Config(cache_root=tmp_path/'cache', makepkg_conf=None, write_srcinfo=False)
+	cache = Cache.from_config(config, 'srcinfo')
+
+	def load() -> SRCINFO:
+		return SRCINFO.from_pkgbuild(pkgbuild, config, cache=cache)
+
+	def runs() -> int:
+		return len(makepkg.read_text().splitlines()) if makepkg.exists() else 0
+
+	srcinfo = load()
+	assert (runs(), cache.hits, cache.misses) == (1, 0, 1)
+	assert load() == srcinfo
+	assert (runs(), cache.hits, cache.misses) == (1, 1, 1)
+
+	# the cache is keyed by content, not by mtimes
+	os.utime(tmp_path/'PKGBUILD', (0, 0))
+	load()
+	assert runs() == 1
+	(tmp_path/'PKGBUILD').write_text('pkgname=foo\npkgrel=2\n')
+	(tmp_path/'srcinfo').write_text(SIMPLE_SRCINFO.replace('pkgrel = 1', 'pkgrel = 2'))
+	assert load().sections[('pkgbase', 'foo')]['pkgrel'] == '2'
+	assert (runs(), cache.hits, cache.misses) == (2, 2, 2)
+
+
+def test_srcinfo_from_makepkg(tmp_path, pkgbuild, makepkg, monkeypatch):
+	(tmp_path/'PKGBUILD').write_text('pkgname=foo\n')
+	(tmp_path/'srcinfo').write_text(SIMPLE_SRCINFO)
+	(tmp_path/'wait').touch()
+	config = Config(makepkg_conf=None)
+
+	# makepkg only completes once the first line has been parsed
+	orig = buildpy.util.iter_lines
+
+	def iter_lines(*args, **kwargs):
+		for line in orig(*args, **kwargs):
+			yield line
+			(tmp_path/'go').touch()
+
+	monkeypatch.setattr(buildpy.util, 'iter_lines', iter_lines)
+	srcinfo = SRCINFO.from_makepkg(pkgbuild, config, srcinfo_file=tmp_path/'.SRCINFO')
+	assert srcinfo == parse(SIMPLE_SRCINFO, pkgbuild)
+	assert (tmp_path/'.SRCINFO').read_text() == SIMPLE_SRCINFO
+
+
+def test_srcinfo_from_makepkg_error(tmp_path, pkgbuild, makepkg):
+	(tmp_path/'PKGBUILD').write_text('pkgname=foo\n')
+	(tmp_path/'srcinfo').write_text(SIMPLE_SRCINFO.split('\n\n')[0] + '\n')
+	(tmp_path/'.SRCINFO').write_text('old\n')
+	(tmp_path/'fail').touch()
+	with pytest.raises(subprocess.CalledProcessError):
+		SRCINFO.from_makepkg(pkgbuild, Config(makepkg_conf=None), srcinfo_file=tmp_path/'.SRCINFO')
+	# the previous file is left as is, and no temporary file is left behind
+	assert (tmp_path/'.SRCINFO').read_text() == 'old\n'
+	assert sorted(p.name for p in tmp_path.iterdir()) == [ '.SRCINFO', 'PKGBUILD', 'bin', 'fail', 'makepkg.log', 'srcinfo' ]
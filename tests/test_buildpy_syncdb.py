@@ -0,0 +1,177 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from buildpy.config import Config
+from buildpy.package import DepSpec
+from buildpy.context import AppContext
+from buildpy.provider.sync import SyncPackageProvider
+from buildpy.syncdb import SyncDB, SyncRecord
+from buildpy.syncindex import SyncIndex
+from tests.util import make_sync_db, sync_package
+
+
+CORE = [
+	sync_package('glibc', '2.39-1', DEPENDS=[ 'linux-api-headers>=4.10', 'tzdata' ], CSIZE='10000', ISIZE='50000'),
+	sync_package('bash', '5.2.026-2', DEPENDS=[ 'glibc', 'readline' ], PROVIDES=[ 'sh' ],
+	             OPTDEPENDS=[ 'bash-completion: for tab completion' ]),
+	sync_package('gcc-libs', '14.1.1-1', BASE='gcc', PROVIDES=[ 'libgcc', 'libstdc++' ], split_depends=True),
+]
+EXTRA = [
+	sync_package('bash', '5.3-1'),
+	sync_package('gcc', '14.1.1-1', DEPENDS=[ 'gcc-libs=14.1.1-1' ], MAKEDEPENDS=[ 'python' ]),
+	sync_package('zsh', '5.9-5', PROVIDES=[ 'sh' ]),
+]
+
+COMPRESSIONS = [ '', 'gz', 'bz2', 'xz' ]
+if shutil.which('zstd'):
+	COMPRESSIONS.append('zst')
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_syncdb_records(tmp_path, compression):
+	db = SyncDB(repo='core', path=make_sync_db(tmp_path/'core.db', CORE, compression=compression))
+	records = list(db.records())
+
+	assert [ r.name for r in records ] == [ 'glibc', 'bash', 'gcc-libs' ]
+	assert records[0] == SyncRecord(
+		repo='core',
+		name='glibc',
+		base='glibc',
+		version='2.39-1',
+		depends=[ 'linux-api-headers>=4.10', 'tzdata' ],
+		csize=10000,
+		isize=50000,
+	)
+	assert records[1].optdepends == [ 'bash-completion: for tab completion' ]
+	# old format: dependencies in a separate file
+	assert records[2].base == 'gcc'
+	assert records[2].provides == [ 'libgcc', 'libstdc++' ]
+
+
+def test_syncdb_invalid(tmp_path):
+	path = tmp_path/'core.db'
+	path.write_bytes(b'not a database')
+	with pytest.raises(SyncDB.Error, match='could not read database'):
+		list(SyncDB(repo='core', path=path).records())
+
+
+PACMAN_CONF = '''\
+[options]
+Architecture = auto
+
+[core]
+Include = /dev/null
+
+[extra]
+Include = /dev/null
+
+[custom]
+Server = file:///dev/null
+'''
+
+
+@pytest.fixture
+def pacman_conf(tmp_path) -> Path:
+	path = tmp_path/'pacman.conf'
+	path.write_text(PACMAN_CONF)
+	return path
+
+
+def test_sync_provider(tmp_path, pacman_conf):
+	with AppContext(config=Config(pacman_conf=pacman_conf, sync_root=tmp_path/'sync')) as ctx:
+		provider = SyncPackageProvider(ctx)
+		make_sync_db(provider.db_dir/'sync'/'core.db', CORE)
+		make_sync_db(provider.db_dir/'sync'/'extra.db', EXTRA, compression='xz')
+		provider.load_dbs()
+
+	def names(pkgnames) -> list[tuple[str, str]]:
+		return [ (p.pkgname, p.pkgbase.version) for p in pkgnames ]
+
+	# candidates are ordered by repository precedence
+	assert names(provider.by_pkgname['bash']) == [ ('bash', '5.2.026-2'), ('bash', '5.3-1') ]
+	assert names(provider.by_provides['sh']) == [ ('bash', '5.2.026-2'), ('zsh', '5.9-5') ]
+	assert names(provider.by_provides['libgcc']) == [ ('gcc-libs', '14.1.1-1') ]
+	# pkgbases are per repository
+	assert provider.pkgbases[('core', 'gcc')].pkgnames[0].pkgname == 'gcc-libs'
+	assert provider.by_pkgname['gcc'][0].pkgbase is provider.pkgbases[('extra', 'gcc')]
+	assert provider.by_pkgname['gcc'][0].makedepends == ( DepSpec('python'), )
+	assert 'readline' not in provider.by_pkgname
+	with pytest.raises(KeyError):
+		provider.by_provides['readline']
+	assert sorted(provider.by_provides) == [ 'libgcc', 'libstdc++', 'sh' ]
+
+	# packages are materialised on lookup only, and only once
+	assert sorted(provider.pkgnames) == [ ('core', 'bash'), ('core', 'gcc-libs'), ('extra', 'bash'), ('extra', 'gcc'),
+	                                      ('extra', 'zsh') ]
+	assert provider.by_provides['sh'][0] is provider.by_pkgname['bash'][0]
+
+
+def test_sync_provider_dbpath(tmp_path, pacman_conf, monkeypatch):
+	refreshes = []
+
+	def run_pacman(self, args, **kwargs):
+		refreshes.append((self.db_dir, args))
+		make_sync_db(self.db_dir/'sync'/'core.db', CORE)
+
+	monkeypatch.setattr(SyncPackageProvider, 'run_pacman', run_pacman)
+
+	def load(**kwargs) -> SyncPackageProvider:
+		config = Config(pacman_conf=pacman_conf, sync_root=tmp_path/'sync', **kwargs)
+		with AppContext(config=config) as ctx:
+			provider = SyncPackageProvider(ctx)
+			provider.load_packages([ 'bash' ])
+		return provider
+
+	provider = load()
+	assert refreshes == [ (provider.db_dir, [ '-Sy' ]) ]
+	assert provider.repos == [ 'core', 'extra' ]
+	assert '[custom]' not in provider.pacman_conf.read_text()
+	assert 'bash' in provider.by_pkgname
+
+	# same configuration within the refresh interval: the dbpath is reused as is
+	assert load().db_dir == provider.db_dir
+	assert len(refreshes) == 1
+	load(sync_refresh_interval=0)
+	assert len(refreshes) == 2
+
+	# different configuration: different dbpath
+	pacman_conf.write_text(PACMAN_CONF.replace('[extra]', '[multilib]'))
+	assert load().db_dir != provider.db_dir
+	assert len(refreshes) == 3
+
+
+def test_sync_index_rebuild(tmp_path, monkeypatch):
+	reads = []
+	orig = SyncDB.records
+
+	def records(self):
+		reads.append(self.repo)
+		return orig(self)
+
+	monkeypatch.setattr(SyncDB, 'records', records)
+
+	path = tmp_path/'index'
+	dbs = [
+		SyncDB(repo='core', path=make_sync_db(tmp_path/'core.db', CORE)),
+		SyncDB(repo='extra', path=make_sync_db(tmp_path/'extra.db', EXTRA)),
+	]
+	index = SyncIndex.load(path, dbs)
+	assert reads == [ 'core', 'extra' ]
+	assert [ index.record(i).repo for i in index.pkgnames.get('bash') ] == [ 'core', 'extra' ]
+	assert index.provides.get('sh') == index.pkgnames.get('bash')[:1] + index.pkgnames.get('zsh')
+
+	# unchanged databases: the index is reused
+	SyncIndex.load(path, dbs)
+	assert reads == [ 'core', 'extra' ]
+
+	make_sync_db(dbs[1].path, EXTRA[:1])
+	index = SyncIndex.load(path, dbs)
+	assert reads == [ 'core', 'extra' ] * 2
+	assert 'zsh' not in index.pkgnames
+
+	# a corrupt index is rebuilt
+	path.write_bytes(b'garbage')
+	SyncIndex.load(path, dbs)
+	assert reads == [ 'core', 'extra' ] * 3
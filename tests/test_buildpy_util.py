@@ -1,3 +1,5 @@
+import io
+import json
 import subprocess
 from pathlib import Path
 
@@ -324,3 +326,40 @@ def test_popen_nonzero_check_raises(popen_files):
 
 	assert type(exc_info.value) is subprocess.CalledProcessError
 	assert type(exc_info.value.__context__) is RuntimeError
+
+
+def test_iter_lines_tee():
+	text = 'a\nb\n\nc'
+	tee = io.StringIO()
+	assert list(buildpy.util.iter_lines(io.StringIO(text), tee=tee)) == [ 'a', 'b', '', 'c' ]
+	assert tee.getvalue() == text
+
+
+def test_atomic_open(tmp_path):
+	path = tmp_path/'file'
+	path.write_text('old')
+
+	with pytest.raises(RuntimeError):
+		with buildpy.util.atomic_open(path) as f:
+			f.write('new')
+			raise RuntimeError()
+	assert path.read_text() == 'old'
+	assert list(tmp_path.iterdir()) == [ path ]
+
+	with buildpy.util.atomic_open(path) as f:
+		f.write('new')
+		assert path.read_text() == 'old'
+	assert path.read_text() == 'new'
+	assert list(tmp_path.iterdir()) == [ path ]
+
+
+@pytest.mark.parametrize('chunk_size', [ 1, 3, 1 << 16 ])
+def test_iter_json_array(chunk_size):
+	data = [ { 'a': [ 1, 2.5, 'x,]' ] }, 12345, 'str', [], None, True ]
+	text = ' [ ' + ' ,\n'.join(json.dumps(x) for x in data) + ' ]\n'
+	assert list(buildpy.util.iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == data
+	assert list(buildpy.util.iter_json_array(io.StringIO('[]'), chunk_size=chunk_size)) == []
+	with pytest.raises(ValueError):
+		list(buildpy.util.iter_json_array(io.StringIO('[1 2]'), chunk_size=chunk_size))
+	with pytest.raises(ValueError):
+		list(buildpy.util.iter_json_array(io.StringIO('{}'), chunk_size=chunk_size))
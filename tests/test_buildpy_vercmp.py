@@ -0,0 +1,200 @@
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from buildpy.package import DepSpec
+from buildpy.vercmp import Version, vercmp
+
+
+# pacman's test/util/vercmptest.sh
+VERCMP_TESTS = [
+	# all similar length, no pkgrel
+	('1.5.0', '1.5.0', 0),
+	('1.5.1', '1.5.0', 1),
+	# mixed length
+	('1.5.1', '1.5', 1),
+	# with pkgrel, simple
+	('1.5.0-1', '1.5.0-1', 0),
+	('1.5.0-1', '1.5.0-2', -1),
+	('1.5.0-1', '1.5.1-1', -1),
+	('1.5.0-2', '1.5.1-1', -1),
+	# with pkgrel, mixed lengths
+	('1.5-1', '1.5.1-1', -1),
+	('1.5-2', '1.5.1-1', -1),
+	('1.5-2', '1.5.1-2', -1),
+	# mixed pkgrel inclusion
+	('1.5', '1.5-1', 0),
+	('1.5-1', '1.5', 0),
+	('1.1-1', '1.1', 0),
+	('1.0-1', '1.1', -1),
+	('1.1-1', '1.0', 1),
+	# alphanumeric versions
+	('1.5b-1', '1.5-1', -1),
+	('1.5b', '1.5', -1),
+	('1.5b-1', '1.5', -1),
+	('1.5b', '1.5.1', -1),
+	# from the manpage
+	('1.0a', '1.0alpha', -1),
+	('1.0alpha', '1.0b', -1),
+	('1.0b', '1.0beta', -1),
+	('1.0beta', '1.0rc', -1),
+	('1.0rc', '1.0', -1),
+	# going crazy? alpha-dotted versions
+	('1.5.a', '1.5', 1),
+	('1.5.b', '1.5.a', 1),
+	('1.5.1', '1.5.b', 1),
+	# alpha dots and dashes
+	('1.5.b-1', '1.5.b', 0),
+	('1.5-1', '1.5.b', -1),
+	# same/similar content, differing separators
+	('2.0', '2_0', 0),
+	('2.0_a', '2_0.a', 0),
+	('2.0a', '2.0.a', -1),
+	('2___a', '2_a', 1),
+	# epoch included version comparisons
+	('0:1.0', '0:1.0', 0),
+	('0:1.0', '0:1.1', -1),
+	('1:1.0', '0:1.0', 1),
+	('1:1.0', '0:1.1', 1),
+	('1:1.0', '2:1.1', -1),
+	# epoch + sometimes present pkgrel
+	('1:1.0', '0:1.0-1', 1),
+	('1:1.0-1', '0:1.1-1', 1),
+	# epoch included on one version
+	('0:1.0', '1.0', 0),
+	('0:1.0', '1.1', -1),
+	('0:1.1', '1.0', 1),
+	('1:1.0', '1.0', 1),
+	('1:1.0', '1.1', 1),
+	('1:1.1', '1.1', 1),
+]
+
+
+@pytest.mark.parametrize('a, b, expected', VERCMP_TESTS)
+def test_vercmp(a, b, expected):
+	assert vercmp(a, b) == expected
+	assert vercmp(b, a) == -expected
+
+
+def reference_rpmvercmp(a: bytes, b: bytes) -> int:
+	"""
+	Literal, character-by-character port of rpmvercmp() from libalpm.
+	"""
+	if a == b:
+		return 0
+	a, b = a + b'\0', b + b'\0'
+	isdigit = lambda c: 48 <= c <= 57
+	isalpha = lambda c: 65 <= c <= 90 or 97 <= c <= 122
+	isalnum = lambda c: isdigit(c) or isalpha(c)
+	one = ptr1 = two = ptr2 = 0
+	while a[one] and b[two]:
+		while a[one] and not isalnum(a[one]):
+			one += 1
+		while b[two] and not isalnum(b[two]):
+			two += 1
+		if not (a[one] and b[two]):
+			break
+		if one - ptr1 != two - ptr2:
+			return -1 if one - ptr1 < two - ptr2 else 1
+		ptr1, ptr2 = one, two
+		isnum = isdigit(a[ptr1])
+		istype = isdigit if isnum else isalpha
+		while a[ptr1] and istype(a[ptr1]):
+			ptr1 += 1
+		while b[ptr2] and istype(b[ptr2]):
+			ptr2 += 1
+		if two == ptr2:
+			return 1 if isnum else -1
+		seg1, seg2 = a[one:ptr1], b[two:ptr2]
+		if isnum:
+			seg1, seg2 = seg1.lstrip(b'0'), seg2.lstrip(b'0')
+			if len(seg1) != len(seg2):
+				return 1 if len(seg1) > len(seg2) else -1
+		if seg1 != seg2:
+			return 1 if seg1 > seg2 else -1
+		one, two = ptr1, ptr2
+	if not a[one] and not b[two]:
+		return 0
+	if (not a[one] and not isalpha(b[two])) or isalpha(a[one]):
+		return -1
+	return 1
+
+
+def reference_vercmp(a: str, b: str) -> int:
+	def evr(s: str) -> tuple[str, str, 'str|None']:
+		epoch, sep, rest = s.partition(':')
+		if not sep or not epoch.isdigit() and epoch:
+			epoch, rest = '0', s
+		version, sep, release = rest.rpartition('-')
+		if not sep:
+			return epoch or '0', rest, None
+		return epoch or '0', version, release
+
+	if a == b:
+		return 0
+	(e1, v1, r1), (e2, v2, r2) = evr(a), evr(b)
+	ret = reference_rpmvercmp(e1.encode(), e2.encode())
+	if ret == 0:
+		ret = reference_rpmvercmp(v1.encode(), v2.encode())
+		if ret == 0 and r1 is not None and r2 is not None:
+			ret = reference_rpmvercmp(r1.encode(), r2.encode())
+	return ret
+
+
+def random_versions(count: int) -> list[str]:
+	rng = random.Random(0)
+	parts = [ '0', '1', '2', '10', '010', '99', 'a', 'b', 'alpha', 'rc', 'git', 'r' ]
+	seps = [ '.', '.', '.', '_', '+', '~', '..', '' ]
+	ret = []
+	for _ in range(count):
+		v = rng.choice(parts)
+		for _ in range(rng.randint(0, 4)):
+			v += rng.choice(seps) + rng.choice(parts)
+		if rng.random() < 0.1:
+			v += rng.choice(seps)
+		if rng.random() < 0.5:
+			v += f'-{rng.randint(1, 3)}'
+		if rng.random() < 0.2:
+			v = f'{rng.randint(0, 2)}:{v}'
+		ret.append(v)
+	return ret
+
+
+def test_vercmp_reference():
+	versions = random_versions(300)
+	for a in versions:
+		for b in versions[:100]:
+			assert vercmp(a, b) == reference_vercmp(a, b), (a, b)
+
+
+@pytest.mark.skipif(not shutil.which('vercmp'), reason='vercmp not installed')
+def test_vercmp_pacman():
+	versions = random_versions(200)
+	for a, b in zip(versions, reversed(versions)):
+		expected = int(subprocess.check_output([ 'vercmp', a, b ]))
+		assert vercmp(a, b) == max(-1, min(expected, 1)), (a, b)
+
+
+def test_version_sort():
+	versions = [ '1.0-1', '1:0.1-1', '1.0rc1-1', '1.0.1-1', '0.9-3', '1.0-2' ]
+	assert sorted(versions, key=Version.parse) == [ '0.9-3', '1.0rc1-1', '1.0-1', '1.0-2', '1.0.1-1', '1:0.1-1' ]
+	# parsed once, shared by all lookups
+	assert Version.parse('1.0-1') is Version.parse('1.0-1')
+	assert Version.parse('1.0') == Version.parse('1_0')
+
+
+@pytest.mark.parametrize('spec, version, expected', [
+	('foo', '1.0-1', True),
+	('foo>=1.0', '1.0-1', True),
+	('foo>=1.0', '0.9-1', False),
+	('foo>1.0', '1.0-1', False),
+	('foo<2', '1:1.0-1', False),
+	('foo<=2', '2-5', True),
+	# pkgrel is only compared if both sides have one
+	('foo=1.0', '1.0-2', True),
+	('foo=1.0-1', '1.0-2', False),
+])
+def test_depspec_satisfied_by(spec, version, expected):
+	assert DepSpec.parse(spec).satisfied_by(version) is expected
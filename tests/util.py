@@ -1,10 +1,27 @@
 from collections import abc
+import bz2
 import contextlib
+import gzip
+import http.server
+import io
+import json
+import lzma
+import os
 from pathlib import Path
+import re
+import subprocess
+import tarfile
 import tempfile
+import threading
+import time
 import typing
+import urllib.parse
 
 import pytest
+import requests
+
+from buildpy.pkgbuild import PKGBUILD
+from buildpy.srcinfo import SRCINFO
 
 
 def is_bytes(arg: str|bytes) -> bool:
@@ -42,9 +59,267 @@ def tmp_fileobj(tmp_path) -> abc.Generator[Path, None, None]:
 	return _make_fileobj
 
 
+@pytest.fixture
+def no_external(monkeypatch) -> list[str]:
+	"""
+	Record (and fail) any attempt to run a subprocess or to send an HTTP request.
+	"""
+	calls = []
+
+	def execute_child(self, args, *_, **__):
+		calls.append(f'exec: {args}')
+		raise AssertionError(f'unexpected subprocess: {args}')
+
+	def request(self, method, url, *_, **__):
+		calls.append(f'{method} {url}')
+		raise AssertionError(f'unexpected request: {method} {url}')
+
+	monkeypatch.setattr(subprocess.Popen, '_execute_child', execute_child)
+	monkeypatch.setattr(requests.Session, 'request', request)
+	return calls
+
+
+@pytest.fixture
+def stub_makepkg(tmp_path, monkeypatch) -> abc.Callable[[str], Path]:
+	"""
+	Put a `makepkg` running `script` first on PATH. Returns the log file that `script` can append to via
+	`$MAKEPKG_LOG`.
+	"""
+	def _make_makepkg(script: str) -> Path:
+		bin_dir = tmp_path/'bin'
+		bin_dir.mkdir(exist_ok=True)
+		(bin_dir/'makepkg').write_text(script)
+		(bin_dir/'makepkg').chmod(0o755)
+		log = tmp_path/'makepkg.log'
+		monkeypatch.setenv('PATH', f'{bin_dir}:{os.environ["PATH"]}')
+		monkeypatch.setenv('MAKEPKG_LOG', str(log))
+		return log
+	return _make_makepkg
+
+
 def readlines(fobj: typing.IO) -> abc.Iterator[str]:
 	return (line.rstrip('\n') for line in fobj)
 
 
 def readlines_list(fobj: typing.IO) -> list[str]:
 	return fobj.read().splitlines()
+
+
+def aur_package(name: str, *, id: int, pkgbase: str = None, version: str = '1.0-1', **kwargs) -> dict[str, typing.Any]:
+	"""
+	A record in the shape of AUR RPC multiinfo results.
+	"""
+	return {
+		'ID': id,
+		'Name': name,
+		'PackageBaseID': id,
+		'PackageBase': pkgbase or name,
+		'Version': version,
+		'Description': f'{name} package',
+		'URL': f'https://example.org/{name}',
+		'NumVotes': 0,
+		'Popularity': 0,
+		'OutOfDate': None,
+		'Maintainer': 'someone',
+		'FirstSubmitted': 1600000000,
+		'LastModified': 1700000000,
+		'URLPath': f'/cgit/aur.git/snapshot/{pkgbase or name}.tar.gz',
+		'License': [ 'GPL' ],
+	} | kwargs
+
+
+SEARCH_FIELDS = ('ID', 'Name', 'PackageBaseID', 'PackageBase', 'Version', 'Description', 'URL', 'NumVotes',
+                 'Popularity', 'OutOfDate', 'Maintainer', 'FirstSubmitted', 'LastModified', 'URLPath')
+
+
+class FakeAUR:
+	"""
+	A local HTTP server implementing the subset of AUR RPC v5 used by `AURPackageProvider`,
+	with optional per-request latency. The next requests are answered with `statuses` (and no body),
+	if any.
+	"""
+	packages: list[dict[str, typing.Any]]
+	latency: float
+	statuses: list[int]
+	requests: list[tuple[str, str]]
+	max_concurrent: int
+
+	def __init__(self, packages: list[dict[str, typing.Any]], latency: float = 0.0):
+		self.packages = packages
+		self.latency = latency
+		self.statuses = []
+		self.requests = []
+		self.max_concurrent = 0
+		self._concurrent = 0
+		self._lock = threading.Lock()
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+		self.server.daemon_threads = True
+		self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+	def _search(self, field: str, query: str) -> list[dict[str, typing.Any]]:
+		def matches(p) -> bool:
+			if field == 'provides':
+				return p['Name'] == query or any(re.split(r'[<>=]', x)[0] == query for x in p.get('Provides', []))
+			return query in p['Name']
+		return [ { k: p[k] for k in SEARCH_FIELDS } for p in self.packages if matches(p) ]
+
+	def _info(self, names: list[str]) -> list[dict[str, typing.Any]]:
+		return [ p for p in self.packages if p['Name'] in names ]
+
+	def archive(self) -> bytes:
+		"""
+		The packages in the shape of the AUR metadata archive (packages-meta-ext-v1.json.gz).
+		"""
+		return gzip.compress(json.dumps(self.packages, indent=0).encode())
+
+	def _make_handler(self):
+		aur = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+			# headers and body are written separately
+			disable_nagle_algorithm = True
+
+			def _send(self, content_type: str, body: bytes):
+				self.send_response(200)
+				self.send_header('Content-Type', content_type)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def _reply(self, type: str, results: list):
+				body = json.dumps({
+					'version': 5,
+					'type': type,
+					'resultcount': len(results),
+					'results': results,
+				}).encode()
+				self._send('application/json', body)
+
+			def _handle(self, method: str, path: str, args: dict[str, list[str]]):
+				with aur._lock:
+					aur.requests.append((method, path))
+					aur._concurrent += 1
+					aur.max_concurrent = max(aur.max_concurrent, aur._concurrent)
+					status = aur.statuses.pop(0) if aur.statuses else None
+				try:
+					time.sleep(aur.latency)
+					if status is not None:
+						self.send_response(status)
+						self.send_header('Content-Length', '0')
+						self.end_headers()
+					elif path.startswith('/rpc/v5/search/'):
+						query = urllib.parse.unquote(path.removeprefix('/rpc/v5/search/'))
+						self._reply('search', aur._search(args.get('by', [ 'name-desc' ])[0], query))
+					elif path == '/rpc/v5/info':
+						self._reply('multiinfo', aur._info(args.get('arg[]', [])))
+					elif path == '/packages-meta-ext-v1.json.gz':
+						self._send('application/gzip', aur.archive())
+					else:
+						self.send_error(404)
+				finally:
+					with aur._lock:
+						aur._concurrent -= 1
+
+			def do_GET(self):
+				url = urllib.parse.urlsplit(self.path)
+				self._handle('GET', url.path, urllib.parse.parse_qs(url.query))
+
+			def do_POST(self):
+				url = urllib.parse.urlsplit(self.path)
+				body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+				self._handle('POST', url.path, urllib.parse.parse_qs(url.query) | urllib.parse.parse_qs(body))
+
+			def log_message(self, *args):
+				pass
+
+		return Handler
+
+	def __enter__(self):
+		threading.Thread(target=self.server.serve_forever, kwargs={ 'poll_interval': 0.01 }, daemon=True).start()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.server.shutdown()
+		self.server.server_close()
+
+
+def sync_package(name: str, version: str = '1.0-1', *, split_depends: bool = False, **fields) \
+		-> dict[str, str|list[str]]:
+	"""
+	A sync database entry: %NAME%, %VERSION% and any other `fields` (e.g. `DEPENDS=[...]`, `CSIZE='123'`).
+	With `split_depends`, dependency fields go to a separate `depends` file (old database format).
+	"""
+	return { 'NAME': name, 'VERSION': version, 'split_depends': split_depends } | fields
+
+
+def make_sync_db(path: Path, packages: list[dict[str, typing.Any]], compression: str = 'gz') -> Path:
+	"""
+	Write a pacman sync database containing `packages` (see `sync_package()`).
+	`compression` is one of '', 'gz', 'bz2', 'xz' or 'zst'.
+	"""
+	def entry(fields: dict[str, str|list[str]]) -> bytes:
+		text = ''
+		for key, value in fields.items():
+			values = value if isinstance(value, list) else [ value ]
+			text += f'%{key}%\n' + ''.join(f'{v}\n' for v in values) + '\n'
+		return text.encode()
+
+	def add(tar: tarfile.TarFile, name: str, data: bytes):
+		info = tarfile.TarInfo(name)
+		info.size = len(data)
+		tar.addfile(info, io.BytesIO(data))
+
+	buf = io.BytesIO()
+	with tarfile.open(fileobj=buf, mode='w') as tar:
+		for p in packages:
+			p = dict(p)
+			dirname = f'{p["NAME"]}-{p["VERSION"]}'
+			depends = {}
+			if p.pop('split_depends', False):
+				depends = { k: p.pop(k) for k in list(p) if k.endswith('DEPENDS') or k in ('PROVIDES', 'CONFLICTS') }
+			info = tarfile.TarInfo(dirname)
+			info.type = tarfile.DIRTYPE
+			tar.addfile(info)
+			add(tar, f'{dirname}/desc', entry(p))
+			if depends:
+				add(tar, f'{dirname}/depends', entry(depends))
+
+	data = buf.getvalue()
+	match compression:
+		case '':
+			pass
+		case 'gz':
+			data = gzip.compress(data)
+		case 'bz2':
+			data = bz2.compress(data)
+		case 'xz':
+			data = lzma.compress(data)
+		case 'zst':
+			data = subprocess.run([ 'zstd', '-c' ], input=data, stdout=subprocess.PIPE, check=True).stdout
+		case _:
+			raise NotImplementedError(compression)
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(data)
+	return path
+
+
+def local_pkgbuild(pkgbase: str, version: str = '1.0-1', *, pkgnames: list[str] = None, base_dir: Path = None,
+                   **fields: list[str]) -> PKGBUILD:
+	"""
+	A PKGBUILD in `base_dir` (which need not exist) with a .SRCINFO of `pkgbase` (split into `pkgnames`,
+	if given) and pkgbase `fields` (e.g. `depends=[...]`), as loaded by `proc.load_srcinfo()`.
+	"""
+	pkgver, pkgrel = version.rsplit('-', 1)
+	lines = [ f'pkgbase = {pkgbase}', f'\tpkgver = {pkgver}', f'\tpkgrel = {pkgrel}', '\tarch = any' ]
+	for key, values in fields.items():
+		lines += [ f'\t{key} = {v}' for v in values ]
+	for name in pkgnames or [ pkgbase ]:
+		lines += [ '', f'pkgname = {name}' ]
+
+	base_dir = base_dir or Path('/nonexistent')/pkgbase
+	pkgbuild = PKGBUILD.from_path(base_dir, base_dir/'PKGBUILD')
+	pkgbuild.srcinfo = SRCINFO.from_lines(lines, pkgbuild=pkgbuild)
+	pkgbuild.pkgbase = pkgbuild.srcinfo.headers['pkgbase']
+	pkgbuild.pkgname = pkgbuild.srcinfo.headers['pkgname']
+	return pkgbuild